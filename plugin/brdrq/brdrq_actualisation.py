@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Geometry-native actualisation of thematic data to the actual GRB (AutoUpdateBorders).
+
+Same flow as brdr's update_featurecollection_to_actual_grb, but on the Aligner that
+already holds the thematic (Shapely) data: the thematic data is not serialized to
+GeoJSON and parsed again. The results are written to the output layers in columnar
+form (see brdrq_columns), without building a GeoJSON feature per result.
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+from brdr.aligner import Aligner
+from brdr.be.grb.constants import GRB_MAX_REFERENCE_BUFFER, GRB_VERSION_DATE
+from brdr.be.grb.loader import GRBActualLoader
+from brdr.be.grb.utils import get_collection_grb_actual
+from brdr.constants import (
+    DATE_FORMAT,
+    EVALUATION_FIELD_NAME,
+    LAST_VERSION_DATE,
+    METADATA_FIELD_NAME,
+    RELEVANT_DISTANCE_FIELD_NAME,
+    SYMMETRICAL_AREA_CHANGE,
+    SYMMETRICAL_AREA_PERCENTAGE_CHANGE,
+)
+from brdr.enums import AlignerResultType, Evaluation
+from brdr.geometry_utils import buffer_pos
+from brdr.loader import DictLoader
+from shapely import STRtree, buffer, difference, get_dimensions
+from shapely.geometry import LineString, Point, Polygon, shape
+
+RD_STEP = 10  # cm, step of the relevant distances in the evaluation
+
+_EMPTY_BY_DIMENSION = {0: Point(), 1: LineString(), 2: Polygon()}
+
+
+def _feedback_info(feedback, message):
+    if feedback is not None:
+        feedback.pushInfo(message)
+
+
+def _get_base_metadata(feature, base_metadata_field):
+    if base_metadata_field is None:
+        return None
+    try:
+        base_metadata = feature.properties[base_metadata_field]
+        if isinstance(base_metadata, str):
+            base_metadata = json.loads(base_metadata)
+    except Exception:
+        return None
+    return base_metadata if isinstance(base_metadata, dict) else None
+
+
+def get_base_dates(aligner, base_metadata_field):
+    """
+    Base date (last_version_date in the brdr-metadata) of each thematic feature:
+    {theme_id: date}, None when the feature has no (valid) metadata
+    """
+    base_dates = {}
+    for theme_id, feature in aligner.thematic_data.features.items():
+        base_dates[theme_id] = None
+        base_metadata = _get_base_metadata(feature, base_metadata_field)
+        try:
+            str_lvd = base_metadata[LAST_VERSION_DATE]
+            if str_lvd is None or str_lvd == "":
+                continue
+            base_dates[theme_id] = datetime.strptime(str_lvd, DATE_FORMAT).date()
+        except Exception:
+            # geen (geldige) metadata voor deze feature
+            continue
+    return base_dates
+
+
+class GRBChangeIndex:
+    """
+    R-tree (STRtree) of the GRB features that changed in a time window, with their
+    version date, to check which thematic features are touched by a change after
+    their own base date
+    """
+
+    def __init__(self, geometries, dates):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.tree = STRtree(self.geometries)
+
+    @classmethod
+    def from_grb(cls, geometry, grb_type, date_start, date_end, crs):
+        """
+        Index of the GRB features (grb_type) around the geometry with a version date
+        between date_start and date_end
+        """
+        collection, _ = get_collection_grb_actual(
+            buffer_pos(geometry, GRB_MAX_REFERENCE_BUFFER),
+            grb_type=grb_type,
+            partition=1000,
+            date_start=date_start,
+            date_end=date_end,
+            crs=crs,
+        )
+        geometries = []
+        dates = []
+        for feature in collection.get("features", []):
+            try:
+                geometry = shape(feature["geometry"])
+                version_date = datetime.strptime(
+                    feature["properties"][GRB_VERSION_DATE], DATE_FORMAT
+                ).date()
+            except Exception:
+                continue
+            geometries.append(geometry)
+            dates.append(version_date)
+        return cls(geometries, dates)
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def get_affected_ids(self, dict_geometries, dict_base_dates, border_distance=0):
+        """
+        Ids of the geometries that are within GRB_MAX_REFERENCE_BUFFER of a change after
+        their base date. With a border_distance, only the border (donut) of the
+        geometry is checked, so internal changes in big geometries are ignored.
+        """
+        ids = list(dict_geometries.keys())
+        if len(ids) == 0 or len(self) == 0:
+            return []
+        geometries = np.asarray([dict_geometries[i] for i in ids], dtype=object)
+        if border_distance > 0:
+            inner = buffer(
+                geometries, -border_distance, join_style="mitre", mitre_limit=5
+            )
+            geometries = difference(geometries, inner)
+        base_dates = np.asarray(
+            [dict_base_dates[i] for i in ids], dtype="datetime64[D]"
+        )
+        pairs = self.tree.query(
+            geometries, predicate="dwithin", distance=GRB_MAX_REFERENCE_BUFFER
+        )
+        changed = self.dates[pairs[1]] > base_dates[pairs[0]]
+        return [ids[i] for i in np.unique(pairs[0][changed])]
+
+
+def get_no_change_results(aligner, theme_ids, base_metadata_field=None):
+    """
+    Results for features that are not touched by a GRB-change: the original geometry,
+    evaluated as NO_CHANGE (without aligning)
+    """
+    results = {}
+    for theme_id in theme_ids:
+        feature = aligner.thematic_data.features[theme_id]
+        geometry = feature.geometry
+        empty = _EMPTY_BY_DIMENSION.get(get_dimensions(geometry), Polygon())
+        metadata = None
+        if base_metadata_field is not None:
+            metadata = feature.properties.get(base_metadata_field)
+        results[theme_id] = {
+            0: {
+                "result": geometry,
+                "result_diff": empty,
+                "result_diff_plus": empty,
+                "result_diff_min": empty,
+                "metadata": metadata,
+                "properties": {
+                    EVALUATION_FIELD_NAME: Evaluation.NO_CHANGE,
+                    RELEVANT_DISTANCE_FIELD_NAME: 0,
+                    SYMMETRICAL_AREA_CHANGE: 0,
+                    SYMMETRICAL_AREA_PERCENTAGE_CHANGE: 0,
+                },
+            }
+        }
+    return results
+
+
+def get_affected(
+    aligner,
+    grb_type,
+    max_distance_for_actualisation,
+    base_metadata_field=METADATA_FIELD_NAME,
+    feedback=None,
+):
+    """
+    Pre-pass of the actualisation: indexes the GRB-changes since the oldest base date.
+    Only the features touched by a change after their own base date (or without base
+    date) have to be aligned, the others are NO_CHANGE.
+
+    Returns (affected theme_ids, NO_CHANGE-results of the other features)
+    """
+    base_dates = get_base_dates(aligner, base_metadata_field)
+    dated = {k: v for k, v in base_dates.items() if v is not None}
+    affected = [k for k, v in base_dates.items() if v is None]
+    if len(dated) > 0:
+        change_index = GRBChangeIndex.from_grb(
+            aligner.thematic_data.union,
+            grb_type=grb_type,
+            date_start=min(dated.values()),
+            date_end=datetime.now().date(),
+            crs=aligner.crs,
+        )
+        _feedback_info(
+            feedback,
+            "Number of changed GRB-features during timespan: " + str(len(change_index)),
+        )
+        affected_dated = set(
+            change_index.get_affected_ids(
+                {k: aligner.thematic_data.features[k].geometry for k in dated},
+                dated,
+                border_distance=max_distance_for_actualisation,
+            )
+        )
+        affected.extend(k for k in dated if k in affected_dated)
+    affected_set = set(affected)
+    results = get_no_change_results(
+        aligner,
+        [k for k in base_dates if k not in affected_set],
+        base_metadata_field,
+    )
+    _feedback_info(
+        feedback,
+        f"Thematic features touched by a GRB-change: {len(affected)}; "
+        f"not touched (NO_CHANGE): {len(results)}",
+    )
+    return affected, results
+
+
+def actualise(
+    aligner,
+    theme_ids,
+    grb_type,
+    max_distance_for_actualisation,
+    base_metadata_field=METADATA_FIELD_NAME,
+    max_predictions=-1,
+    full_reference_strategy=None,
+    multi_to_best_prediction=True,
+):
+    """
+    Aligns the thematic features (theme_ids) of the aligner to the actual GRB
+    (grb_type), with the processor and CRS of the aligner. The actual GRB is downloaded
+    once, over the combined extent of these features.
+
+    Returns the evaluated predictions {theme_id: {relevant_distance: ProcessResult}}
+    """
+    if len(theme_ids) == 0:
+        return {}
+    extent_aligner = Aligner(crs=aligner.crs)
+    extent_aligner.load_thematic_data(
+        DictLoader({k: aligner.thematic_data.features[k].geometry for k in theme_ids})
+    )
+    aligner.load_reference_data(
+        GRBActualLoader(grb_type=grb_type, partition=1000, aligner=extent_aligner)
+    )
+    relevant_distances = [
+        round(k, 1)
+        for k in np.arange(
+            0, max_distance_for_actualisation * 100 + RD_STEP, RD_STEP, dtype=int
+        )
+        / 100
+    ]
+
+    aligner_result = aligner.process(
+        thematic_ids=theme_ids, relevant_distances=[max_distance_for_actualisation]
+    )
+    process_results = aligner_result.get_results(aligner=aligner)
+    affected_and_changeable = []
+    affected_and_not_changed = set()
+    for k, v in process_results.items():
+        if not v[max_distance_for_actualisation]["result_diff"].is_empty:
+            affected_and_changeable.append(k)
+        else:
+            affected_and_not_changed.add(k)
+
+    aligner_result = aligner.evaluate(
+        relevant_distances=relevant_distances,
+        thematic_ids=affected_and_changeable,
+        metadata_field=base_metadata_field,
+        full_reference_strategy=full_reference_strategy,
+        max_predictions=max_predictions,
+        multi_to_best_prediction=multi_to_best_prediction,
+    )
+    for k, v in aligner_result.results.items():
+        if k in affected_and_not_changed:
+            for dist in v.keys():
+                v[dist]["properties"][EVALUATION_FIELD_NAME] = Evaluation.NO_CHANGE
+    if not aligner_result.results:
+        return {}
+    return aligner_result.get_results(
+        aligner=aligner, result_type=AlignerResultType.EVALUATED_PREDICTIONS
+    )
+
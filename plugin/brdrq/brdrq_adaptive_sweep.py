@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive (coarse-to-fine) sweep over the relevant distances.
+
+Predictions evaluate a dense series of relevant distances, while most consecutive
+distances give an identical resulting geometry. The adaptive sweep first processes a
+coarse grid of the distances, and only refines (bisects) the intervals where the
+resulting geometry changes. The distances inside an interval with an identical result
+at both ends get (a copy of) that result, so the full series is still reported to the
+predictor/evaluator of brdr.
+"""
+from collections import defaultdict
+
+from brdr.aligner import AlignerResult
+from shapely import equals_exact, get_dimensions, normalize, symmetric_difference
+
+ADAPTIVE_COARSE_STEP = 5  # number of distance-steps between the coarse distances
+ADAPTIVE_TOLERANCE = 0.001  # (m) vertex tolerance to consider geometries equal
+ADAPTIVE_AREA_TOLERANCE = 0.01  # (m²) symmetric difference to consider polygons equal
+
+
+def results_equal(
+    result_a,
+    result_b,
+    tolerance=ADAPTIVE_TOLERANCE,
+    area_tolerance=ADAPTIVE_AREA_TOLERANCE,
+):
+    """
+    Checks if two process-results have an equal resulting geometry
+    """
+    if result_a is None or result_b is None:
+        return result_a is result_b
+    a = result_a.get("result")
+    b = result_b.get("result")
+    if a is None or b is None:
+        return a is b
+    if a.is_empty or b.is_empty:
+        return a.is_empty and b.is_empty
+    if equals_exact(normalize(a), normalize(b), tolerance):
+        return True
+    if get_dimensions(a) == 2 and get_dimensions(b) == 2:
+        return symmetric_difference(a, b).area <= area_tolerance
+    return False
+
+
+def _copy_result(result):
+    if result is None:
+        return None
+    copy = dict(result)
+    copy["properties"] = dict(result.get("properties", {}))
+    return copy
+
+
+def enable_adaptive_sweep(aligner, coarse_step=ADAPTIVE_COARSE_STEP):
+    """
+    Replaces the process-method of the aligner by an adaptive sweep over the relevant
+    distances. Predict and evaluate of the aligner use this method.
+
+    When the aligner logs metadata, every distance is still processed, as the metadata
+    describes each individual actuation.
+    """
+    process = aligner.process
+
+    def adaptive_process(relevant_distances=None, *, thematic_ids=None, max_workers=None):
+        rds = sorted(set(relevant_distances or []))
+        if aligner.log_metadata or len(rds) <= coarse_step + 1:
+            return process(
+                relevant_distances=relevant_distances,
+                thematic_ids=thematic_ids,
+                max_workers=max_workers,
+            )
+        if thematic_ids is None:
+            thematic_ids = aligner.thematic_data.features.keys()
+        thematic_ids = list(thematic_ids)
+        n = len(rds)
+        coarse = list(range(0, n, coarse_step))
+        if coarse[-1] != n - 1:
+            coarse.append(n - 1)
+
+        results = {tid: {} for tid in thematic_ids}  # index of distance: result
+        stable = {tid: [] for tid in thematic_ids}  # intervals with equal results
+        todo = {tid: coarse for tid in thematic_ids}
+        nr_processed = 0
+        while todo:
+            # features that need the same distances are processed together
+            by_indices = defaultdict(list)
+            for tid, indices in todo.items():
+                by_indices[tuple(indices)].append(tid)
+            for indices, tids in by_indices.items():
+                processed = process(
+                    relevant_distances=[rds[i] for i in indices],
+                    thematic_ids=tids,
+                    max_workers=max_workers,
+                ).results
+                for tid in tids:
+                    for i in indices:
+                        results[tid][i] = processed[tid][rds[i]]
+                nr_processed += len(indices) * len(tids)
+            # bisect the intervals where the result changes
+            refine = {}
+            for tid in todo:
+                known = sorted(results[tid])
+                needed = []
+                for low, high in zip(known, known[1:]):
+                    if high - low <= 1 or (low, high) in stable[tid]:
+                        continue
+                    if results_equal(results[tid][low], results[tid][high]):
+                        stable[tid].append((low, high))
+                    else:
+                        needed.append((low + high) // 2)
+                if needed:
+                    refine[tid] = needed
+            todo = refine
+
+        for tid in thematic_ids:
+            for low, high in stable[tid]:
+                for i in range(low + 1, high):
+                    results[tid][i] = _copy_result(results[tid][low])
+        aligner.logger.feedback_info(
+            f"Adaptive sweep: {nr_processed} of {n * len(thematic_ids)} "
+            f"distance-calculations processed"
+        )
+        return AlignerResult(
+            {
+                tid: {rds[i]: results[tid][i] for i in range(n)}
+                for tid in thematic_ids
+            }
+        )
+
+    aligner.process = adaptive_process
+    return aligner
@@ -28,8 +28,10 @@ THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ***************************************************************************
 """
 import inspect
+import json
 import os
 import sys
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
 from brdr.be.be import BeCadastralParcelLoader
@@ -48,7 +50,6 @@ from brdr.nl.enums import BRKType
 from brdr.nl.loader import BRKLoader
 from brdr.osm.loader import OSMLoader
 import numpy as np
-from qgis import processing
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.PyQt.QtCore import QDate, QDateTime
 from qgis.core import QgsFeatureRequest
@@ -58,6 +59,7 @@ from qgis.core import QgsProcessingMultiStepFeedback
 from qgis.core import QgsProcessingParameterFile
 from qgis.core import QgsProcessingParameterNumber
 from qgis.core import QgsProcessingException
+from qgis.core import QgsProcessingFeatureSourceDefinition
 from qgis.core import QgsProject
 from qgis.core import QgsStyle
 
@@ -66,7 +68,7 @@ from .brdrq_utils import (
     ENUM_OD_STRATEGY_OPTIONS,
     ENUM_SNAP_STRATEGY_OPTIONS,
     ADPF_VERSIONS,
-    geom_qgis_to_shapely,
+    columns_to_layer,
     featurecollection_to_layer,
     get_workfolder,
     thematic_preparation,
@@ -74,6 +76,7 @@ from .brdrq_utils import (
     PREFIX_LOCAL_LAYER,
     DICT_ADPF_VERSIONS,
     move_to_group,
+    open_output_store,
     OSM_TYPES,
     DICT_OSM_TYPES,
     ENUM_FULL_REFERENCE_STRATEGY_OPTIONS,
@@ -91,6 +94,20 @@ from .brdrq_utils import (
     DICT_NL_TYPES,
     BE_TYPES,
 )
+from .brdrq_columns import featurecollection_to_columns, results_to_columns
+from .brdrq_module_importer import find_python
+from .brdrq_adaptive_sweep import enable_adaptive_sweep
+from .brdrq_parallel import build_tasks, merge_featurecollections, run_tasks
+from .brdrq_result_store import (
+    RESULT_STORE_FILENAME,
+    ResultStore,
+    add_original_attributes,
+    get_feature_keys,
+    get_run_fingerprint,
+    stored_to_featurecollections,
+)
+from .brdrq_reference_cache import CachedReferenceLoader
+from .brdrq_reference_index import extract_reference_by_footprint
 from .brdrq_algorithm_common import (
     add_boolean_parameter,
     add_enum_parameter,
@@ -179,14 +196,18 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
     PROCESSOR = None
     THRESHOLD_OVERLAP_PERCENTAGE = None  # default THRESHOLD_OVERLAP_PERCENTAGE for the aligner,updated by user-choice
     REVIEW_PERCENTAGE = None  # default - features that changes more than this % wil be moved to review lisr
+    NOT_CHANGED_AREA = None  # default - features that changes less than this area (m²) are not changed
     RELEVANT_DISTANCE = None  # RELEVANT_DISTANCE for the aligner
     # CHECKBOXs
     SHOW_INTERMEDIATE_LAYERS = None
     ADD_METADATA = None
     ATTRIBUTES = None
     PREDICTIONS = None
+    ADAPTIVE_SWEEP = None
     LOG_INFO = None
     WORKFOLDER = None
+    WORKERS = 0  # number of worker processes for parallel processing (0 = sequential)
+    RESULT_STORE = None  # reuse stored results of unchanged features (incremental re-run)
 
     # OTHER non UI parameters
     MULTI_AS_SINGLE_MODUS = True  # default MULTI_AS_SINGLE_MODUS for the aligner
@@ -362,6 +383,13 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             default_value=self.default_predictions,
             advanced=True,
         )
+        add_boolean_parameter(
+            algorithm=self,
+            name="ADAPTIVE_SWEEP",
+            description='<br>Adaptive sweep<br><i style="color: gray;">When using Predictions, first calculate a coarse series of relevant distances, and only refine the intervals where the result changes (faster; not used when METADATA is added)</i>',
+            default_value=self.default_adaptive_sweep,
+            advanced=True,
+        )
         add_enum_parameter(
             algorithm=self,
             name="PREDICTION_STRATEGY",
@@ -431,6 +459,15 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             max_value=100,
             advanced=True,
         )
+        add_number_parameter(
+            algorithm=self,
+            name="NOT_CHANGED_AREA",
+            description='<br>NOT_CHANGED_AREA (m²)<br><i style="color: gray;">results with a smaller change are set to not changed </i>',
+            number_type=QgsProcessingParameterNumber.Double,
+            default_value=self.default_not_changed_area,
+            min_value=0,
+            advanced=True,
+        )
         add_boolean_parameter(
             algorithm=self,
             name="ADD_METADATA",
@@ -459,6 +496,23 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             default_value=self.default_extra_logging,
             advanced=True,
         )
+        add_number_parameter(
+            algorithm=self,
+            name="WORKERS",
+            description='<br>WORKERS<br><i style="color: gray;">Number of worker processes to align spatially independent clusters of thematic features in parallel (0 = no parallel processing)</i>',
+            number_type=QgsProcessingParameterNumber.Integer,
+            default_value=self.default_workers,
+            min_value=0,
+            max_value=os.cpu_count() or 1,
+            advanced=True,
+        )
+        add_boolean_parameter(
+            algorithm=self,
+            name="RESULT_STORE",
+            description='Incremental re-run: reuse the stored results of unchanged features<br><i style="color: gray;">Results are stored in the workfolder, per feature (geometry, nearby reference features and the used parameters). Only changed or new features are aligned</i>',
+            default_value=self.default_result_store,
+            advanced=True,
+        )
 
     def processAlgorithm(self, parameters, context, feedback):
         """
@@ -471,22 +525,25 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
         feedback.pushInfo("START")
         feedback.setCurrentStep(1)
         self.prepare_parameters(parameters, context)
-        thematic, thematic_buffered, self.CRS = thematic_preparation(
+        thematic, thematic_geoms, thematic_buffered, self.CRS = thematic_preparation(
             self.LAYER_THEMATIC, self.RELEVANT_DISTANCE, context, feedback
         )
         if thematic is None:
-            raise QgsProcessingException(self.invalidSourceError(parameters, self.test))
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.INPUT_THEMATIC)
+            )
 
-        # Load thematic into a shapely_dict:
+        # Load thematic into a shapely_dict (geometries are already prepared):
         dict_thematic = {}
         dict_thematic_properties = {}
-        features = thematic.getFeatures()
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        features = thematic.getFeatures(request)
         for current, feature in enumerate(features):
-            feature_geom = feature.geometry()
             if feedback.isCanceled():
                 return {}
             id_theme = feature.attribute(self.ID_THEME_BRDRQ_FIELDNAME)
-            dict_thematic[id_theme] = geom_qgis_to_shapely(feature_geom)
+            dict_thematic[id_theme] = thematic_geoms[feature.id()]
             if self.ATTRIBUTES:
                 # dict_thematic_properties[id_theme] = feature.__geo_interface__["properties"]
                 attributes = feature.attributeMap()
@@ -523,18 +580,24 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
 
         # REFERENCE PREPARATION
         if self.SELECTED_REFERENCE == 0:
-            reference = self._reference_preparation(
-                thematic_buffered, context, feedback, parameters
+            selected_fids = None
+            input_reference = parameters[self.INPUT_REFERENCE]
+            if (
+                isinstance(input_reference, QgsProcessingFeatureSourceDefinition) and
+                input_reference.selectedFeaturesOnly
+            ):
+                selected_fids = self.LAYER_REFERENCE.selectedFeatureIds()
+            # Load reference into a shapely_dict (only features intersecting the
+            # buffered thematic footprint, repaired and without Z/M):
+            dict_reference = extract_reference_by_footprint(
+                self.LAYER_REFERENCE,
+                self.ID_REFERENCE_BRDRQ_FIELDNAME,
+                thematic_buffered,
+                fids=selected_fids,
+                feedback=feedback,
             )
-
-            # Load reference into a shapely_dict:
-            dict_reference = {}
-            features = reference.getFeatures()
-            for current, feature in enumerate(features):
-                if feedback.isCanceled():
-                    return {}
-                id_reference = feature.attribute(self.ID_REFERENCE_BRDRQ_FIELDNAME)
-                dict_reference[id_reference] = geom_qgis_to_shapely(feature.geometry())
+            if dict_reference is None:
+                return {}
         feedback.pushInfo("2) PREPROCESSING - Reference layer fixed")
         feedback.setCurrentStep(3)
         if feedback.isCanceled():
@@ -562,6 +625,8 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             log_metadata=self.ADD_METADATA,
             add_observations=self.ADD_METADATA if self.PREDICTIONS else True,
         )
+        if self.PREDICTIONS and self.ADAPTIVE_SWEEP:
+            enable_adaptive_sweep(aligner)
 
         feedback.pushInfo("Load thematic data")
         aligner.load_thematic_data(DictLoader(dict_thematic, dict_thematic_properties))
@@ -578,28 +643,52 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
         elif self.SELECTED_REFERENCE in ADPF_VERSIONS:
             year = DICT_ADPF_VERSIONS[self.SELECTED_REFERENCE]
             aligner.load_reference_data(
-                GRBFiscalParcelLoader(year=str(year), aligner=aligner, partition=1000)
+                CachedReferenceLoader(
+                    GRBFiscalParcelLoader(
+                        year=str(year), aligner=aligner, partition=1000
+                    ),
+                    f"ADPF_{year}",
+                )
             )
         elif self.SELECTED_REFERENCE in OSM_TYPES:
             tags = DICT_OSM_TYPES[self.SELECTED_REFERENCE]
-            aligner.load_reference_data(OSMLoader(osm_tags=tags, aligner=aligner))
+            aligner.load_reference_data(
+                CachedReferenceLoader(
+                    OSMLoader(osm_tags=tags, aligner=aligner),
+                    f"OSM_{json.dumps(tags, sort_keys=True)}",
+                )
+            )
         elif self.SELECTED_REFERENCE in BE_TYPES:
             try:
-                aligner.load_reference_data(BeCadastralParcelLoader(partition=1000, aligner=aligner))
+                aligner.load_reference_data(
+                    CachedReferenceLoader(
+                        BeCadastralParcelLoader(partition=1000, aligner=aligner),
+                        "BE_CADASTRAL_PARCELS",
+                    )
+                )
             except Exception as e:
                 raise QgsProcessingException(e)
         elif self.SELECTED_REFERENCE in NL_TYPES:
             try:
                 brk_type = BRKType[DICT_NL_TYPES[self.SELECTED_REFERENCE]]
-                aligner.load_reference_data(BRKLoader(brk_type=brk_type, partition=1000, aligner=aligner))
+                aligner.load_reference_data(
+                    CachedReferenceLoader(
+                        BRKLoader(brk_type=brk_type, partition=1000, aligner=aligner),
+                        f"NL_{brk_type.name}",
+                    )
+                )
             except Exception as e:
                 raise QgsProcessingException(e)
         else:
+            grb_type = GRBType(self.SELECTED_REFERENCE.value)
             aligner.load_reference_data(
-                GRBActualLoader(
-                    grb_type=GRBType(self.SELECTED_REFERENCE.value),
-                    partition=1000,
-                    aligner=aligner,
+                CachedReferenceLoader(
+                    GRBActualLoader(
+                        grb_type=grb_type,
+                        partition=1000,
+                        aligner=aligner,
+                    ),
+                    f"GRB_{grb_type.name}",
                 )
             )
         feedback.setCurrentStep(4)
@@ -612,39 +701,93 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
         )
         if self.RELEVANT_DISTANCE < 0:
             raise QgsProcessingException("Please provide a RELEVANT DISTANCE >=0")
-        if not self.PREDICTIONS:
-            relevant_distances = [self.RELEVANT_DISTANCE]
-            aligner_result = aligner.predict(
-                relevant_distances=relevant_distances,
+
+        # INCREMENTAL RE-RUN: take the stored results of unchanged features
+        thematic_ids = list(dict_thematic.keys())
+        store = None
+        dict_stored = {}
+        if self.RESULT_STORE:
+            store, keys = self._open_result_store(
+                aligner, dict_thematic, processor, feedback
             )
-            fcs = aligner_result.get_results_as_geojson(
-                aligner=aligner,
-                result_type=AlignerResultType.PROCESSRESULTS,
-                add_metadata=self.ADD_METADATA,
-                add_original_attributes=self.ATTRIBUTES,
+            dict_stored = store.get(keys)
+            thematic_ids = [i for i in thematic_ids if i not in dict_stored]
+            feedback.pushInfo(
+                f"Result store: {len(dict_stored)} unchanged feature(s) taken from "
+                f"store, {len(thematic_ids)} feature(s) to align"
             )
-        else:
-            relevant_distances = (
-                np.arange(0, self.RELEVANT_DISTANCE * 100, 10, dtype=int) / 100
+        # original attributes are added afterwards when using the result store
+        add_attributes = self.ATTRIBUTES and store is None
+
+        # the sequential results are written in columnar form; the results of the
+        # parallel run and of the result store are GeoJSON featurecollections
+        columnar = None
+        if not thematic_ids:
+            fcs = {}
+        elif self.WORKERS > 1:
+            fcs = self._align_parallel(
+                aligner,
+                {i: dict_thematic[i] for i in thematic_ids},
+                dict_thematic_properties,
+                processor,
+                feedback,
+                add_attributes,
             )
+            if fcs is None:
+                return {}
+        else:
+            if not self.PREDICTIONS:
+                relevant_distances = [self.RELEVANT_DISTANCE]
+                aligner_result = aligner.predict(
+                    relevant_distances=relevant_distances,
+                    thematic_ids=thematic_ids,
+                )
+                result_type = AlignerResultType.PROCESSRESULTS
+            else:
+                relevant_distances = self._get_relevant_distances()
 
-            max_predictions, multi_to_best_prediction = (
-                get_prediction_strategy_options(self.PREDICTION_STRATEGY)
-            )
+                max_predictions, multi_to_best_prediction = (
+                    get_prediction_strategy_options(self.PREDICTION_STRATEGY)
+                )
 
-            aligner_result = aligner.evaluate(
-                relevant_distances=relevant_distances,
-                max_predictions=max_predictions,
-                multi_to_best_prediction=multi_to_best_prediction,
-                full_reference_strategy=self.FULL_REFERENCE_STRATEGY,
-            )
-            fcs = aligner_result.get_results_as_geojson(
-                aligner=aligner,
-                result_type=AlignerResultType.EVALUATED_PREDICTIONS,
-                add_metadata=self.ADD_METADATA,
-                add_original_attributes=self.ATTRIBUTES,
+                aligner_result = aligner.evaluate(
+                    relevant_distances=relevant_distances,
+                    thematic_ids=thematic_ids,
+                    max_predictions=max_predictions,
+                    multi_to_best_prediction=multi_to_best_prediction,
+                    full_reference_strategy=self.FULL_REFERENCE_STRATEGY,
+                )
+                result_type = AlignerResultType.EVALUATED_PREDICTIONS
+            if store is None:
+                columnar = results_to_columns(
+                    aligner,
+                    aligner_result.get_results(aligner=aligner, result_type=result_type),
+                    add_metadata=self.ADD_METADATA,
+                    add_original_attributes=add_attributes,
+                )
+            else:
+                fcs = aligner_result.get_results_as_geojson(
+                    aligner=aligner,
+                    result_type=result_type,
+                    add_metadata=self.ADD_METADATA,
+                    add_original_attributes=add_attributes,
+                )
+        if store is not None:
+            id_field = aligner.thematic_data.id_fieldname
+            store.put({i: keys[i] for i in thematic_ids}, fcs, id_field)
+            fcs = merge_featurecollections(
+                [fcs, stored_to_featurecollections(dict_stored, aligner.crs)],
+                list(dict_thematic.keys()),
             )
-        if "result" not in fcs:
+            if self.ATTRIBUTES:
+                add_original_attributes(fcs, dict_thematic_properties, id_field)
+        if columnar is None:
+            columnar = {
+                result_type: featurecollection_to_columns(fc)
+                for result_type, fc in fcs.items()
+            }
+            del fcs
+        if "result" not in columnar:
             feedback.pushInfo("No results found")
             feedback.pushInfo("END")
 
@@ -656,77 +799,62 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
         feedback.setCurrentStep(5)
         feedback.pushInfo("WRITING RESULTS")
 
-        # MAKE TEMPORARY LAYERS
-        if self.SELECTED_REFERENCE != 0:
-            reference_geojson = aligner.reference_data.to_geojson()
-            featurecollection_to_layer(
-                self.LAYER_REFERENCE_NAME,
-                reference_geojson,
-                "reference",
-                True,
-                self.GROUP_LAYER,
-                self.WORKFOLDER,
-            )
-
-        if self.SHOW_INTERMEDIATE_LAYERS:
-            if "result_relevant_intersection" in fcs.keys():
+        # all layers of the run are written to one GeoPackage (output store)
+        with open_output_store(self.WORKFOLDER, aligner.crs) as output_store:
+            # MAKE TEMPORARY LAYERS
+            if self.SELECTED_REFERENCE != 0:
+                reference_geojson = aligner.reference_data.to_geojson()
                 featurecollection_to_layer(
-                    self.LAYER_RELEVANT_INTERSECTION,
-                    fcs["result_relevant_intersection"],
-                    QgsStyle.defaultStyle().symbol("gradient green fill"),
-                    False,
+                    self.LAYER_REFERENCE_NAME,
+                    reference_geojson,
+                    "reference",
+                    True,
                     self.GROUP_LAYER,
                     self.WORKFOLDER,
+                    output_store,
                 )
-            if "result_relevant_diff" in fcs.keys():
-                featurecollection_to_layer(
-                    self.LAYER_RELEVANT_DIFFERENCE,
-                    fcs["result_relevant_diff"],
-                    QgsStyle.defaultStyle().symbol("gradient red fill"),
+
+            if self.SHOW_INTERMEDIATE_LAYERS:
+                if "result_relevant_intersection" in columnar.keys():
+                    columns_to_layer(
+                        self.LAYER_RELEVANT_INTERSECTION,
+                        *columnar["result_relevant_intersection"],
+                        aligner.crs,
+                        QgsStyle.defaultStyle().symbol("gradient green fill"),
+                        False,
+                        self.GROUP_LAYER,
+                        self.WORKFOLDER,
+                        output_store,
+                    )
+                if "result_relevant_diff" in columnar.keys():
+                    columns_to_layer(
+                        self.LAYER_RELEVANT_DIFFERENCE,
+                        *columnar["result_relevant_diff"],
+                        aligner.crs,
+                        QgsStyle.defaultStyle().symbol("gradient red fill"),
+                        False,
+                        self.GROUP_LAYER,
+                        self.WORKFOLDER,
+                        output_store,
+                    )
+            for result_type, layer_name in (
+                ("result_diff", self.LAYER_RESULT_DIFF),
+                ("result_diff_plus", self.LAYER_RESULT_DIFF_PLUS),
+                ("result_diff_min", self.LAYER_RESULT_DIFF_MIN),
+                ("result", self.LAYER_RESULT),
+            ):
+                geometries, columns = columnar.pop(result_type)
+                columns_to_layer(
+                    layer_name,
+                    geometries,
+                    columns,
+                    aligner.crs,
+                    result_type,
                     False,
                     self.GROUP_LAYER,
                     self.WORKFOLDER,
+                    output_store,
                 )
-        result_diff = "result_diff"
-        geojson_result_diff = fcs[result_diff]
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF,
-            geojson_result_diff,
-            result_diff,
-            False,
-            self.GROUP_LAYER,
-            self.WORKFOLDER,
-        )
-        result_diff_plus = "result_diff_plus"
-        geojson_result_diff_plus = fcs[result_diff_plus]
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF_PLUS,
-            geojson_result_diff_plus,
-            result_diff_plus,
-            False,
-            self.GROUP_LAYER,
-            self.WORKFOLDER,
-        )
-        result_diff_min = "result_diff_min"
-        geojson_result_diff_min = fcs[result_diff_min]
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF_MIN,
-            geojson_result_diff_min,
-            result_diff_min,
-            False,
-            self.GROUP_LAYER,
-            self.WORKFOLDER,
-        )
-        result = "result"
-        geojson_result = fcs[result]
-        featurecollection_to_layer(
-            self.LAYER_RESULT,
-            geojson_result,
-            result,
-            False,
-            self.GROUP_LAYER,
-            self.WORKFOLDER,
-        )
 
         # FILTER empty geometries out of diff layers
         # This does not work for points so we do not add filter for point-layers
@@ -745,7 +873,7 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
         if not self.PREDICTIONS or self.PREDICTION_STRATEGY != PredictionStrategy.ALL:
             feedback.pushInfo("Generating correction layer")
             try:
-                correction_layer = generate_correction_layer(thematic, result,id_theme_brdrq_fieldname=self.ID_THEME_BRDRQ_FIELDNAME,workfolder=self.WORKFOLDER, correction_layer_name = "CORRECTION" + self.SUFFIX,review_percentage=self.REVIEW_PERCENTAGE, add_metadata=self.ADD_METADATA)
+                correction_layer = generate_correction_layer(thematic, result,id_theme_brdrq_fieldname=self.ID_THEME_BRDRQ_FIELDNAME,workfolder=self.WORKFOLDER, correction_layer_name = "CORRECTION" + self.SUFFIX,review_percentage=self.REVIEW_PERCENTAGE, not_changed_area=self.NOT_CHANGED_AREA, add_metadata=self.ADD_METADATA)
                 QgsProject.instance().addMapLayer(correction_layer)
                 set_layer_visibility(correction_layer, True)
                 move_to_group(correction_layer, self.GROUP_LAYER)
@@ -771,69 +899,123 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             "OUTPUT_CORRECTION": correction_layer,
         }
 
-    def _get_output_layer(self, layer_name):
-        layers = QgsProject.instance().mapLayersByName(layer_name)
-        if not layers:
-            raise QgsProcessingException(
-                f"Expected output layer '{layer_name}' was not created."
-            )
-        return layers[0]
+    def _get_relevant_distances(self):
+        if not self.PREDICTIONS:
+            return [self.RELEVANT_DISTANCE]
+        return np.arange(0, self.RELEVANT_DISTANCE * 100, 10, dtype=int) / 100
 
-    def _reference_preparation(self, thematic_buffered, context, feedback, parameters):
-        outputs = {}
-        context.setInvalidGeometryCheck(QgsFeatureRequest.GeometryNoCheck)
-        outputs[self.INPUT_REFERENCE + "_extract"] = processing.run(
-            "native:extractbylocation",
-            {
-                "INPUT": parameters[self.INPUT_REFERENCE],
-                "PREDICATE": [0],
-                "INTERSECT": thematic_buffered,
-                "OUTPUT": "TEMPORARY_OUTPUT",
-            },
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+    def _open_result_store(self, aligner, dict_thematic, processor, feedback):
+        """
+        Opens the result store in the workfolder and returns it with the keys
+        {thematic_id: key} of the thematic features for this run
+        """
+        store = ResultStore(os.path.join(self.WORKFOLDER, RESULT_STORE_FILENAME))
+        pruned = store.prune()
+        if pruned:
+            feedback.pushInfo(f"Result store: {pruned} unused result(s) pruned")
+        max_predictions, multi_to_best_prediction = get_prediction_strategy_options(
+            self.PREDICTION_STRATEGY
         )
-        reference = context.getMapLayer(
-            outputs[self.INPUT_REFERENCE + "_extract"]["OUTPUT"]
+        fingerprint = get_run_fingerprint(
+            processor,
+            aligner.config,
+            aligner.crs,
+            relevant_distances=[float(rd) for rd in self._get_relevant_distances()],
+            predictions=self.PREDICTIONS,
+            max_predictions=max_predictions if self.PREDICTIONS else None,
+            multi_to_best_prediction=(
+                multi_to_best_prediction if self.PREDICTIONS else None
+            ),
+            full_reference_strategy=(
+                self.FULL_REFERENCE_STRATEGY if self.PREDICTIONS else None
+            ),
+            adaptive_sweep=self.PREDICTIONS and self.ADAPTIVE_SWEEP,
+            add_metadata=self.ADD_METADATA,
+            # the version date of a download changes every run; the reference
+            # content is part of the key of each feature
+            reference_source=(
+                aligner.reference_data.source
+                if self.ADD_METADATA
+                else (aligner.reference_data.source or {}).get("source")
+            ),
         )
-        feedback.pushInfo("Reference extraction finished")
-        outputs[self.INPUT_REFERENCE + "_fixed"] = processing.run(
-            "native:fixgeometries",
-            {
-                "INPUT": reference,
-                "METHOD": 1,
-                "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-            },
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+        dict_reference = {
+            key: feature.geometry
+            for key, feature in aligner.reference_data.features.items()
+        }
+        buffer_factor = getattr(processor.config, "buffer_multiplication_factor", 1.01)
+        keys = get_feature_keys(
+            dict_thematic,
+            dict_reference,
+            buffer_factor * self.RELEVANT_DISTANCE,
+            fingerprint,
         )
-        reference = context.getMapLayer(
-            outputs[self.INPUT_REFERENCE + "_fixed"]["OUTPUT"]
+        return store, keys
+
+    def _align_parallel(
+        self,
+        aligner,
+        dict_thematic,
+        dict_thematic_properties,
+        processor,
+        feedback,
+        add_attributes,
+    ):
+        """
+        Aligns spatially independent clusters of the thematic features in a pool of
+        worker processes, and merges the results
+        """
+        max_predictions, multi_to_best_prediction = get_prediction_strategy_options(
+            self.PREDICTION_STRATEGY
         )
-        feedback.pushInfo("Reference repair finished")
-        outputs[self.INPUT_REFERENCE + "_dropMZ"] = processing.run(
-            "native:dropmzvalues",
-            {
-                "INPUT": reference,
-                "DROP_M_VALUES": True,
-                "DROP_Z_VALUES": True,
-                "OUTPUT": "TEMPORARY_OUTPUT",
-            },
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+        dict_reference = {
+            key: feature.geometry
+            for key, feature in aligner.reference_data.features.items()
+        }
+        tasks = build_tasks(
+            dict_thematic,
+            dict_thematic_properties,
+            dict_reference,
+            self.RELEVANT_DISTANCE,
+            # more groups than workers, so the load is balanced over the workers
+            4 * self.WORKERS,
+            processor_class=type(processor),
+            processor_config=processor.config,
+            crs=self.CRS,
+            log_metadata=self.ADD_METADATA,
+            add_observations=self.ADD_METADATA if self.PREDICTIONS else True,
+            reference_source=aligner.reference_data.source,
+            predictions=self.PREDICTIONS,
+            adaptive_sweep=self.PREDICTIONS and self.ADAPTIVE_SWEEP,
+            relevant_distances=self._get_relevant_distances(),
+            max_predictions=max_predictions,
+            multi_to_best_prediction=multi_to_best_prediction,
+            full_reference_strategy=self.FULL_REFERENCE_STRATEGY,
+            add_metadata=self.ADD_METADATA,
+            add_attributes=add_attributes,
         )
-        reference = context.getMapLayer(
-            outputs[self.INPUT_REFERENCE + "_dropMZ"]["OUTPUT"]
+        feedback.pushInfo(
+            f"Parallel processing: {len(tasks)} cluster-group(s) on {self.WORKERS} workers"
         )
-        feedback.pushInfo("Reference dropMZ finished")
-        if reference is None:
+        try:
+            results = run_tasks(
+                tasks, self.WORKERS, python_exe=find_python(), feedback=feedback
+            )
+        except BrokenProcessPool as e:
             raise QgsProcessingException(
-                self.invalidSourceError(parameters, self.INPUT_REFERENCE)
+                f"Parallel processing failed, please retry with WORKERS=0: {str(e)}"
             )
-        return reference
+        if results is None:
+            return None
+        return merge_featurecollections(results, list(dict_thematic.keys()))
+
+    def _get_output_layer(self, layer_name):
+        layers = QgsProject.instance().mapLayersByName(layer_name)
+        if not layers:
+            raise QgsProcessingException(
+                f"Expected output layer '{layer_name}' was not created."
+            )
+        return layers[0]
 
     def read_default_settings(self):
         # print ('read_settings')
@@ -848,6 +1030,7 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             "COMBOBOX_ID_REFERENCE": None,
             "RELEVANT_DISTANCE": 3,
             "PREDICTIONS": 0,
+            "ADAPTIVE_SWEEP": False,
             "PREDICTION_STRATEGY": 1,
             "FULL_REFERENCE_STRATEGY": 2,
             "ENUM_PROCESSOR": 0,
@@ -856,10 +1039,13 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             "THRESHOLD_OVERLAP_PERCENTAGE": 50,
             "WORK_FOLDER": "brdrQ",
             "REVIEW_PERCENTAGE": 10,
+            "NOT_CHANGED_AREA": 0.01,
             "ADD_METADATA": False,
             "ADD_ATTRIBUTES": False,
             "SHOW_INTERMEDIATE_LAYERS": False,
             "LOG_INFO": False,
+            "WORKERS": 0,
+            "RESULT_STORE": False,
         }
         initialize_default_attributes(
             self,
@@ -871,6 +1057,7 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_reference_layer_id", "COMBOBOX_ID_REFERENCE"),
                 ("default_relevant_distance", "RELEVANT_DISTANCE"),
                 ("default_predictions", "PREDICTIONS"),
+                ("default_adaptive_sweep", "ADAPTIVE_SWEEP"),
                 ("default_prediction_strategy", "PREDICTION_STRATEGY"),
                 ("default_full_reference_strategy", "FULL_REFERENCE_STRATEGY"),
                 ("default_processor", "ENUM_PROCESSOR"),
@@ -879,10 +1066,13 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_threshold_overlap_percentage", "THRESHOLD_OVERLAP_PERCENTAGE"),
                 ("default_workfolder", "WORK_FOLDER"),
                 ("default_review_percentage", "REVIEW_PERCENTAGE"),
+                ("default_not_changed_area", "NOT_CHANGED_AREA"),
                 ("default_add_metadata", "ADD_METADATA"),
                 ("default_add_attributes", "ADD_ATTRIBUTES"),
                 ("default_intermediate_layers", "SHOW_INTERMEDIATE_LAYERS"),
                 ("default_extra_logging", "LOG_INFO"),
+                ("default_workers", "WORKERS"),
+                ("default_result_store", "RESULT_STORE"),
             ],
         )
 
@@ -898,6 +1088,7 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_reference_layer_id", "default_reference_layer_id"),
                 ("default_relevant_distance", "relevant_distance", float),
                 ("default_predictions", "default_predictions"),
+                ("default_adaptive_sweep", "default_adaptive_sweep"),
                 ("default_prediction_strategy", "default_prediction_strategy"),
                 ("default_full_reference_strategy", "default_full_reference_strategy"),
                 ("default_od_strategy", "default_od_strategy"),
@@ -905,10 +1096,13 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_threshold_overlap_percentage", "default_threshold_overlap_percentage"),
                 ("default_workfolder", "default_workfolder", None, "global"),
                 ("default_review_percentage", "default_review_percentage"),
+                ("default_not_changed_area", "default_not_changed_area", float),
                 ("default_add_metadata", "default_add_metadata"),
                 ("default_add_attributes", "default_add_attributes"),
                 ("default_intermediate_layers", "default_intermediate_layers"),
                 ("default_extra_logging", "default_extra_logging"),
+                ("default_workers", "default_workers", int),
+                ("default_result_store", "default_result_store"),
             ],
             read_setting,
         )
@@ -936,6 +1130,7 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_reference_layer_id", "default_reference_layer_id"),
                 ("default_relevant_distance", "relevant_distance"),
                 ("default_predictions", "default_predictions"),
+                ("default_adaptive_sweep", "default_adaptive_sweep"),
                 ("default_prediction_strategy", "default_prediction_strategy"),
                 ("default_full_reference_strategy", "default_full_reference_strategy"),
                 ("default_processor", "default_processor"),
@@ -944,10 +1139,13 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_threshold_overlap_percentage", "default_threshold_overlap_percentage"),
                 ("default_workfolder", "default_workfolder", "global"),
                 ("default_review_percentage", "default_review_percentage"),
+                ("default_not_changed_area", "default_not_changed_area"),
                 ("default_add_metadata", "default_add_metadata"),
                 ("default_add_attributes", "default_add_attributes"),
                 ("default_intermediate_layers", "default_intermediate_layers"),
                 ("default_extra_logging", "default_extra_logging"),
+                ("default_workers", "default_workers"),
+                ("default_result_store", "default_result_store"),
             ],
             write_setting,
         )
@@ -968,6 +1166,7 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_reference_layer_id", "COMBOBOX_ID_REFERENCE"),
                 ("default_relevant_distance", "RELEVANT_DISTANCE"),
                 ("default_predictions", "PREDICTIONS"),
+                ("default_adaptive_sweep", "ADAPTIVE_SWEEP"),
                 ("default_prediction_strategy", "PREDICTION_STRATEGY"),
                 ("default_full_reference_strategy", "FULL_REFERENCE_STRATEGY"),
                 ("default_processor", "ENUM_PROCESSOR"),
@@ -976,10 +1175,13 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_threshold_overlap_percentage", "THRESHOLD_OVERLAP_PERCENTAGE"),
                 ("default_workfolder", "WORK_FOLDER"),
                 ("default_review_percentage", "REVIEW_PERCENTAGE"),
+                ("default_not_changed_area", "NOT_CHANGED_AREA"),
                 ("default_add_metadata", "ADD_METADATA"),
                 ("default_add_attributes", "ADD_ATTRIBUTES"),
                 ("default_intermediate_layers", "SHOW_INTERMEDIATE_LAYERS"),
                 ("default_extra_logging", "LOG_INFO"),
+                ("default_workers", "WORKERS"),
+                ("default_result_store", "RESULT_STORE"),
             ],
         )
 
@@ -1016,6 +1218,7 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
 
         self.THRESHOLD_OVERLAP_PERCENTAGE = self.default_threshold_overlap_percentage
         self.REVIEW_PERCENTAGE = self.default_review_percentage
+        self.NOT_CHANGED_AREA = self.default_not_changed_area
         self.OD_STRATEGY = OpenDomainStrategy[
             ENUM_OD_STRATEGY_OPTIONS[self.default_od_strategy]
         ]
@@ -1036,8 +1239,11 @@ class AutocorrectBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             self.PREDICTIONS = True  # 1 means PREDICTION
         else:
             self.PREDICTIONS = False  # 0 means NO_PREDICTION
+        self.ADAPTIVE_SWEEP = bool(self.default_adaptive_sweep)
 
         self.LOG_INFO = self.default_extra_logging
+        self.WORKERS = int(self.default_workers or 0)
+        self.RESULT_STORE = bool(self.default_result_store)
 
         # REFERENCE
         ref = ENUM_REFERENCE_OPTIONS[self.default_reference]
@@ -27,14 +27,16 @@ CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFT
 THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 ***************************************************************************
 """
+import os
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
-from brdr.be.grb.grb import update_featurecollection_to_actual_grb
 from brdr.constants import BASE_METADATA_FIELD_NAME
 from brdr.enums import OpenDomainStrategy, FullReferenceStrategy, SnapStrategy
 from brdr.loader import DictLoader
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.PyQt.QtCore import QDate, QDateTime
+from qgis.core import QgsFeatureRequest
 from qgis.core import QgsProcessing
 from qgis.core import QgsProcessingAlgorithm
 from qgis.core import QgsProcessingException
@@ -45,6 +47,10 @@ from qgis.core import (
 )
 from qgis.core import QgsProject
 
+from .brdrq_actualisation import (
+    actualise,
+    get_affected,
+)
 from .brdrq_algorithm_common import (
     add_boolean_parameter,
     add_enum_parameter,
@@ -63,11 +69,14 @@ from .brdrq_algorithm_common import (
     resolve_thematic_layer_and_crs,
     write_saved_settings,
 )
+from .brdrq_columns import results_to_columns
+from .brdrq_module_importer import find_python
+from .brdrq_parallel import build_group_tasks, run_tasks
 from .brdrq_utils import (
-    geom_qgis_to_shapely,
-    featurecollection_to_layer,
+    columns_to_layer,
     get_workfolder,
     GRB_TYPES,
+    open_output_store,
     thematic_preparation,
     ENUM_PREDICTION_STRATEGY_OPTIONS,
     PredictionStrategy,
@@ -107,6 +116,7 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
     SNAP_STRATEGY = None
     THRESHOLD_OVERLAP_PERCENTAGE = None
     REVIEW_PERCENTAGE = None  # default - features that changes more than this % wil be moved to review lisr
+    NOT_CHANGED_AREA = None  # default - features that changes less than this area (m²) are not changed
     RELEVANT_DISTANCE = None
     PROCESSOR = None
     WORKFOLDER = None
@@ -114,6 +124,7 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
     FULL_REFERENCE_STRATEGY = None
     LOG_INFO = None
     METADATA_FIELDNAME = None
+    WORKERS = 0  # number of worker processes for parallel processing (0 = sequential)
 
     # Non UI -  parameters
     CORR_DISTANCE = 0.01  # default CORR_DISTANCE for the aligner
@@ -332,6 +343,15 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             max_value=100,
             advanced=True,
         )
+        add_number_parameter(
+            algorithm=self,
+            name="NOT_CHANGED_AREA",
+            description='<br>NOT_CHANGED_AREA (m²)<br><i style="color: gray;">results with a smaller change are set to not changed </i>',
+            number_type=QgsProcessingParameterNumber.Double,
+            default_value=self.default_not_changed_area,
+            min_value=0,
+            advanced=True,
+        )
         add_boolean_parameter(
             algorithm=self,
             name="LOG_INFO",
@@ -339,6 +359,16 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             default_value=self.default_extra_logging,
             advanced=True,
         )
+        add_number_parameter(
+            algorithm=self,
+            name="WORKERS",
+            description='<br>WORKERS<br><i style="color: gray;">Number of worker processes to actualise groups of spatially independent clusters of thematic features in parallel (0 = no parallel processing)</i>',
+            number_type=QgsProcessingParameterNumber.Integer,
+            default_value=self.default_workers,
+            min_value=0,
+            max_value=os.cpu_count() or 1,
+            advanced=True,
+        )
 
         # OUTPUT
 
@@ -362,9 +392,10 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
 
         self.prepare_parameters(parameters, context)
 
-        thematic, thematic_buffered, self.CRS = thematic_preparation(
+        # no buffered footprint needed, as the GRB reference is downloaded on-the-fly
+        thematic, thematic_geoms, _, self.CRS = thematic_preparation(
             self.LAYER_THEMATIC,
-            self.RELEVANT_DISTANCE,
+            None,
             context,
             feedback,
         )
@@ -377,12 +408,14 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
         dict_thematic = {}
         dict_thematic_properties = {}
         metadata_field_name = self.METADATA_FIELDNAME
-        for feature in thematic.getFeatures():
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        for feature in thematic.getFeatures(request):
             if feedback.isCanceled():
                 return {}
 
             id_theme = feature.attribute(self.ID_THEME_BRDRQ_FIELDNAME)
-            dict_thematic[id_theme] = geom_qgis_to_shapely(feature.geometry())
+            dict_thematic[id_theme] = thematic_geoms[feature.id()]
             attributes_dict = {}
             # The actualisation flow expects the thematic identifier to be present
             # in GeoJSON properties.
@@ -424,85 +457,94 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 data_dict=dict_thematic, data_dict_properties=dict_thematic_properties
             )
         )
-        fc = aligner.thematic_data.to_geojson()
 
         feedback.pushInfo("START ACTUALISATION")
 
         max_predictions, multi_to_best_prediction = get_prediction_strategy_options(
             self.PREDICTION_STRATEGY
         )
-        fcs_actualisation = update_featurecollection_to_actual_grb(
-            fc,
-            id_theme_fieldname=self.ID_THEME_BRDRQ_FIELDNAME,
-            base_metadata_field=self.METADATA_FIELDNAME,
+        affected, results_actualisation = get_affected(
+            aligner,
             grb_type=self.GRB_TYPE,
             max_distance_for_actualisation=self.RELEVANT_DISTANCE,
-            feedback=log_info,
-            max_predictions=max_predictions,
-            full_reference_strategy=self.FULL_REFERENCE_STRATEGY,
-            multi_to_best_prediction=multi_to_best_prediction,
-        )
-        if fcs_actualisation is None or fcs_actualisation == {}:
+            base_metadata_field=self.METADATA_FIELDNAME,
+            feedback=feedback,
+        )
+        if self.WORKERS > 1 and len(affected) > 1:
+            results_affected = self._actualise_parallel(
+                aligner,
+                affected,
+                processor,
+                max_predictions,
+                multi_to_best_prediction,
+                feedback,
+            )
+            if results_affected is None:
+                return {}
+        else:
+            results_affected = actualise(
+                aligner,
+                affected,
+                grb_type=self.GRB_TYPE,
+                max_distance_for_actualisation=self.RELEVANT_DISTANCE,
+                base_metadata_field=self.METADATA_FIELDNAME,
+                max_predictions=max_predictions,
+                full_reference_strategy=self.FULL_REFERENCE_STRATEGY,
+                multi_to_best_prediction=multi_to_best_prediction,
+            )
+        results_actualisation.update(results_affected)
+        if not results_actualisation:
             feedback.pushInfo(
                 "Geen wijzigingen gedetecteerd binnen tijdspanne in referentielaag (GRB-percelen)"
             )
             feedback.pushInfo("Proces wordt afgesloten")
             return {}
-
-        # Add RESULT TO TOC
-        if "result_diff_min" in fcs_actualisation:
-            result_diff_min = "result_diff_min"
-            geojson_result_diff_min = fcs_actualisation[result_diff_min]
-            featurecollection_to_layer(
+        columns_actualisation = results_to_columns(aligner, results_actualisation)
+        del results_actualisation
+
+        # all layers of the run are written to one GeoPackage (output store)
+        with open_output_store(self.WORKFOLDER, aligner.crs) as output_store:
+            # Add RESULT TO TOC
+            for result_type, layer_name, visible in [
+                ("result_diff_min", self.LAYER_RESULT_DIFF_MIN, True),
+                ("result_diff_plus", self.LAYER_RESULT_DIFF_PLUS, True),
+                ("result_diff", self.LAYER_RESULT_DIFF, False),
+            ]:
+                if result_type in columns_actualisation:
+                    geometries, columns = columns_actualisation[result_type]
+                    columns_to_layer(
+                        layer_name,
+                        geometries,
+                        columns,
+                        aligner.crs,
+                        result_type,
+                        visible,
+                        self.GROUP_LAYER,
+                        self.WORKFOLDER,
+                        output_store,
+                    )
+
+            # FILTER empty geometries out of diff layers
+            # This does not work for points so we do not add filter for point-layers
+            remove_empty_features_from_diff_layers([
                 self.LAYER_RESULT_DIFF_MIN,
-                geojson_result_diff_min,
-                result_diff_min,
-                True,
-                self.GROUP_LAYER,
-                self.WORKFOLDER,
-            )
-        if "result_diff_plus" in fcs_actualisation:
-            result_diff_plus = "result_diff_plus"
-            geojson_result_diff_plus = fcs_actualisation[result_diff_plus]
-            featurecollection_to_layer(
                 self.LAYER_RESULT_DIFF_PLUS,
-                geojson_result_diff_plus,
-                result_diff_plus,
-                True,
-                self.GROUP_LAYER,
-                self.WORKFOLDER,
-            )
-        if "result_diff" in fcs_actualisation:
-            result_diff = "result_diff"
-            geojson_result_diff = fcs_actualisation[result_diff]
-            featurecollection_to_layer(
                 self.LAYER_RESULT_DIFF,
-                geojson_result_diff,
-                result_diff,
-                False,
+            ])
+
+            geometries, columns = columns_actualisation["result"]
+            columns_to_layer(
+                self.LAYER_RESULT,
+                geometries,
+                columns,
+                aligner.crs,
+                "result",
+                True,
                 self.GROUP_LAYER,
                 self.WORKFOLDER,
+                output_store,
             )
 
-        # FILTER empty geometries out of diff layers
-        # This does not work for points so we do not add filter for point-layers
-        remove_empty_features_from_diff_layers([
-            self.LAYER_RESULT_DIFF_MIN,
-            self.LAYER_RESULT_DIFF_PLUS,
-            self.LAYER_RESULT_DIFF,
-        ])
-
-        result = "result"
-        geojson_result = fcs_actualisation[result]
-        featurecollection_to_layer(
-            self.LAYER_RESULT,
-            geojson_result,
-            result,
-            True,
-            self.GROUP_LAYER,
-            self.WORKFOLDER,
-        )
-
         feedback.pushInfo("Resulting geometry calculated")
         feedback.pushInfo("END ACTUALISATION")
         result = self._get_output_layer(self.LAYER_RESULT)
@@ -514,7 +556,7 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
         if self.PREDICTION_STRATEGY != PredictionStrategy.ALL:
             feedback.pushInfo("Generating correction layer")
             try:
-                correction_layer = generate_correction_layer(thematic, result,id_theme_brdrq_fieldname=self.ID_THEME_BRDRQ_FIELDNAME,workfolder=self.WORKFOLDER, correction_layer_name = "CORRECTION" + self.SUFFIX,review_percentage=self.REVIEW_PERCENTAGE, add_metadata=True)
+                correction_layer = generate_correction_layer(thematic, result,id_theme_brdrq_fieldname=self.ID_THEME_BRDRQ_FIELDNAME,workfolder=self.WORKFOLDER, correction_layer_name = "CORRECTION" + self.SUFFIX,review_percentage=self.REVIEW_PERCENTAGE, not_changed_area=self.NOT_CHANGED_AREA, add_metadata=True)
                 QgsProject.instance().addMapLayer(correction_layer)
                 set_layer_visibility(correction_layer, True)
                 move_to_group(correction_layer, self.GROUP_LAYER)
@@ -543,6 +585,61 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             "OUTPUT_CORRECTION": correction_layer,
         }
 
+    def _actualise_parallel(
+        self,
+        aligner,
+        affected,
+        processor,
+        max_predictions,
+        multi_to_best_prediction,
+        feedback,
+    ):
+        """
+        Clusters the affected features spatially, actualises the groups of clusters in
+        worker processes (each group downloads the GRB over its own extent) and merges
+        the results
+        """
+        features = aligner.thematic_data.features
+        tasks = build_group_tasks(
+            {k: features[k].geometry for k in affected},
+            {k: features[k].properties for k in affected},
+            self.RELEVANT_DISTANCE,
+            # a few more groups than workers, so the load is balanced over the workers
+            2 * self.WORKERS,
+            processor_class=type(processor),
+            processor_config=processor.config,
+            crs=self.CRS,
+            log_metadata=True,
+            add_observations=True,
+            grb_type=self.GRB_TYPE,
+            max_distance_for_actualisation=self.RELEVANT_DISTANCE,
+            base_metadata_field=self.METADATA_FIELDNAME,
+            max_predictions=max_predictions,
+            full_reference_strategy=self.FULL_REFERENCE_STRATEGY,
+            multi_to_best_prediction=multi_to_best_prediction,
+        )
+        feedback.pushInfo(
+            f"Parallel processing: {len(tasks)} group(s) on {self.WORKERS} workers"
+        )
+        try:
+            results = run_tasks(
+                tasks,
+                self.WORKERS,
+                python_exe=find_python(),
+                feedback=feedback,
+                worker_function="actualise_group",
+            )
+        except BrokenProcessPool as e:
+            raise QgsProcessingException(
+                f"Parallel processing failed, please retry with WORKERS=0: {str(e)}"
+            )
+        if results is None:
+            return None
+        merged = {}
+        for result in results:
+            merged.update(result)
+        return merged
+
     def _get_output_layer(self, layer_name):
         layers = QgsProject.instance().mapLayersByName(layer_name)
         if not layers:
@@ -567,9 +664,11 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             "ENUM_SNAP_STRATEGY": 1,
             "THRESHOLD_OVERLAP_PERCENTAGE": 50,
             "REVIEW_PERCENTAGE": 10,
+            "NOT_CHANGED_AREA": 0.01,
             "WORK_FOLDER": "brdrQ",
             "METADATA_FIELD": BASE_METADATA_FIELD_NAME,
             "LOG_INFO": False,
+            "WORKERS": 0,
         }
 
         initialize_default_attributes(
@@ -587,8 +686,10 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_threshold_overlap_percentage", "THRESHOLD_OVERLAP_PERCENTAGE"),
                 ("default_workfolder", "WORK_FOLDER"),
                 ("default_review_percentage", "REVIEW_PERCENTAGE"),
+                ("default_not_changed_area", "NOT_CHANGED_AREA"),
                 ("default_metadata_field", "METADATA_FIELD"),
                 ("default_extra_logging", "LOG_INFO"),
+                ("default_workers", "WORKERS"),
             ],
         )
 
@@ -608,8 +709,10 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_threshold_overlap_percentage", "default_threshold_overlap_percentage"),
                 ("default_workfolder", "default_workfolder", None, "global"),
                 ("default_review_percentage", "default_review_percentage"),
+                ("default_not_changed_area", "default_not_changed_area", float),
                 ("default_metadata_field", "default_metadata_field"),
                 ("default_extra_logging", "default_extra_logging"),
+                ("default_workers", "default_workers", int),
             ],
             read_setting,
         )
@@ -638,8 +741,10 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_threshold_overlap_percentage", "default_threshold_overlap_percentage"),
                 ("default_workfolder", "default_workfolder", "global"),
                 ("default_review_percentage", "default_review_percentage"),
+                ("default_not_changed_area", "default_not_changed_area"),
                 ("default_metadata_field", "default_metadata_field"),
                 ("default_extra_logging", "default_extra_logging"),
+                ("default_workers", "default_workers"),
             ],
             write_setting,
         )
@@ -660,6 +765,7 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_prediction_strategy", "PREDICTION_STRATEGY"),
                 ("default_full_reference_strategy", "FULL_REFERENCE_STRATEGY"),
                 ("default_review_percentage", "REVIEW_PERCENTAGE"),
+                ("default_not_changed_area", "NOT_CHANGED_AREA"),
                 ("default_processor", "ENUM_PROCESSOR"),
                 ("default_od_strategy", "ENUM_OD_STRATEGY"),
                 ("default_snap_strategy", "ENUM_SNAP_STRATEGY"),
@@ -667,6 +773,7 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
                 ("default_workfolder", "WORK_FOLDER"),
                 ("default_metadata_field", "METADATA_FIELD"),
                 ("default_extra_logging", "LOG_INFO"),
+                ("default_workers", "WORKERS"),
             ],
         )
 
@@ -698,6 +805,7 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
 
         self.THRESHOLD_OVERLAP_PERCENTAGE = self.default_threshold_overlap_percentage
         self.REVIEW_PERCENTAGE = self.default_review_percentage
+        self.NOT_CHANGED_AREA = self.default_not_changed_area
         self.OD_STRATEGY = OpenDomainStrategy[
             ENUM_OD_STRATEGY_OPTIONS[self.default_od_strategy]
         ]
@@ -717,6 +825,7 @@ class AutoUpdateBordersProcessingAlgorithm(QgsProcessingAlgorithm):
             ref, None, None, self.CRS
         )
         self.LOG_INFO = self.default_extra_logging
+        self.WORKERS = int(self.default_workers or 0)
 
         self.METADATA_FIELDNAME = self.default_metadata_field
         if str(self.METADATA_FIELDNAME) == "NULL":
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Background alignment for the FeatureAligner dock.
+
+The reference loading (downloads), the evaluation of the predictions and the
+extraction of the results run in a QgsTask, so QGIS stays responsive. The results are
+handed over to a callback in the main thread, where the layers are created.
+"""
+import time
+
+from brdr.enums import AlignerResultType
+from qgis.core import QgsTask
+
+
+class AlignTaskCanceled(Exception):
+    pass
+
+
+class AlignTask(QgsTask):
+    """
+    Loads the reference (optional) and evaluates the predictions of an aligner with
+    thematic data loaded.
+
+    * aligner: Aligner, with the thematic data loaded
+    * feature_id: id of the thematic feature that is aligned
+    * reference_loader: loader of the reference data; None when the reference is
+      already loaded
+    * on_finished: callback(task, result), called in the main thread
+    """
+
+    def __init__(
+        self,
+        description,
+        aligner,
+        feature_id,
+        relevant_distances,
+        full_strategy,
+        reference_loader=None,
+        max_predictions=4,
+        on_finished=None,
+    ):
+        super().__init__(description)
+        self.aligner = aligner
+        self.feature_id = feature_id
+        self.relevant_distances = relevant_distances
+        self.full_strategy = full_strategy
+        self.reference_loader = reference_loader
+        self.max_predictions = max_predictions
+        self.on_finished = on_finished
+        self.exception = None
+        self.aligner_result = None
+        self.dict_processresults = None
+        self.dict_evaluated_predictions = None
+        self.diffs_dict = None
+        self.evaluation_time = None  # seconds, for the calibration of the cost model
+
+    def _check_canceled(self):
+        if self.isCanceled():
+            raise AlignTaskCanceled()
+
+    def run(self):
+        # evaluate() cannot be interrupted; stop at the next process-call instead
+        process = self.aligner.process
+
+        def cancellable_process(*args, **kwargs):
+            self._check_canceled()
+            return process(*args, **kwargs)
+
+        self.aligner.process = cancellable_process
+        try:
+            if self.reference_loader is not None:
+                self.aligner.load_reference_data(self.reference_loader)
+            self._check_canceled()
+            self.setProgress(50)
+            start = time.perf_counter()
+            self.aligner_result = self.aligner.evaluate(
+                max_predictions=self.max_predictions,
+                relevant_distances=self.relevant_distances,
+                full_reference_strategy=self.full_strategy,
+            )
+            self.evaluation_time = time.perf_counter() - start
+            self._check_canceled()
+            self.setProgress(75)
+            self.dict_processresults = self.aligner_result.get_results(
+                aligner=self.aligner
+            )
+            self.dict_evaluated_predictions = self.aligner_result.get_results(
+                aligner=self.aligner,
+                result_type=AlignerResultType.EVALUATED_PREDICTIONS,
+            )
+            self.diffs_dict = self.aligner.get_difference_metrics_for_thematic_data(
+                self.dict_processresults
+            )
+            self._check_canceled()
+            self.setProgress(90)
+            return True
+        except AlignTaskCanceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+        finally:
+            self.aligner.process = process
+
+    def finished(self, result):
+        if self.on_finished is not None:
+            self.on_finished(self, result)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming, chunked evaluation engine for the BulkAligner dock.
+
+The thematic features are split into spatially compact chunks; features within 2x the
+maximum relevant distance of each other are kept in the same chunk. The chunks are
+evaluated one after the other in a QgsTask, each with its own Aligner and only the
+reference of its own extent. The results of a chunk are handed over to the main thread
+(chunkEvaluated-signal) as soon as they are ready, so they can be written to the
+working layer while the next chunks are evaluated.
+"""
+import numpy as np
+from brdr.enums import AlignerResultType
+from brdr.loader import DictLoader
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsTask
+from shapely import bounds
+
+from .brdrq_align_task import AlignTaskCanceled
+from .brdrq_parallel import get_connected_components
+
+BULK_CHUNK_SIZE = 100  # thematic features per chunk
+Z_ORDER_BITS = 16
+
+
+def get_z_order(x, y, bits=Z_ORDER_BITS):
+    """
+    Z-order (Morton) keys of the coordinates, scaled to their extent: sorting on the key
+    keeps nearby coordinates together
+    """
+
+    def scale(values):
+        values = np.asarray(values, dtype=float)
+        span = values.max() - values.min()
+        if span == 0:
+            return np.zeros(len(values), dtype=np.int64)
+        return ((values - values.min()) / span * (2**bits - 1)).astype(np.int64)
+
+    xi, yi = scale(x), scale(y)
+    keys = np.zeros(len(xi), dtype=np.int64)
+    for b in range(bits):
+        keys |= ((xi >> b) & 1) << (2 * b)
+        keys |= ((yi >> b) & 1) << (2 * b + 1)
+    return keys
+
+
+def build_chunks(dict_thematic, distance, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Splits the thematic ids in chunks of (about) chunk_size features, in Z-order.
+    Features within 2x the distance of each other are kept in the same chunk, so a
+    chunk can be bigger when a cluster of features is bigger.
+    """
+    ids = list(dict_thematic.keys())
+    if len(ids) == 0:
+        return []
+    geoms = np.asarray(list(dict_thematic.values()), dtype=object)
+    labels = get_connected_components(geoms, 2 * distance)
+    b = np.nan_to_num(bounds(geoms))
+    keys = get_z_order((b[:, 0] + b[:, 2]) / 2, (b[:, 1] + b[:, 3]) / 2)
+
+    # clusters in the order of their first feature, features in Z-order
+    clusters = {}
+    for i in np.argsort(keys, kind="stable"):
+        clusters.setdefault(labels[i], []).append(ids[i])
+    chunks = []
+    current = []
+    for members in clusters.values():
+        if current and len(current) + len(members) > chunk_size:
+            chunks.append(current)
+            current = []
+        current.extend(members)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BulkAlignTask(QgsTask):
+    """
+    Evaluates the chunks of thematic features one after the other, and emits the results
+    of each chunk (chunkEvaluated)
+
+    * chunks: list of lists of thematic ids
+    * dict_thematic: {thematic_id: geometry}
+    * create_aligner: callable() returning a new Aligner (settings of the dock)
+    * load_reference: callable(aligner, chunk_index) that loads the reference of the
+      chunk in the aligner (with the thematic data loaded)
+    * on_finished: callback(task, result), called in the main thread
+    """
+
+    chunkEvaluated = pyqtSignal(object)
+
+    def __init__(
+        self,
+        description,
+        chunks,
+        dict_thematic,
+        create_aligner,
+        load_reference,
+        relevant_distances,
+        full_strategy,
+        add_metadata=False,
+        on_finished=None,
+    ):
+        super().__init__(description)
+        self.chunks = chunks
+        self.dict_thematic = dict_thematic
+        self.create_aligner = create_aligner
+        self.load_reference = load_reference
+        self.relevant_distances = relevant_distances
+        self.full_strategy = full_strategy
+        self.add_metadata = add_metadata
+        self.on_finished = on_finished
+        self.exception = None
+        self.evaluated_chunks = 0
+
+    def _check_canceled(self):
+        if self.isCanceled():
+            raise AlignTaskCanceled()
+
+    def run(self):
+        try:
+            for index, ids in enumerate(self.chunks):
+                self._check_canceled()
+                self.chunkEvaluated.emit(self._evaluate_chunk(index, ids))
+                self.evaluated_chunks = index + 1
+                self.setProgress(100 * self.evaluated_chunks / len(self.chunks))
+            return True
+        except AlignTaskCanceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+
+    def _evaluate_chunk(self, index, ids):
+        aligner = self.create_aligner()
+        # evaluate() cannot be interrupted; stop at the next process-call instead
+        process = aligner.process
+
+        def cancellable_process(*args, **kwargs):
+            self._check_canceled()
+            return process(*args, **kwargs)
+
+        aligner.process = cancellable_process
+        aligner.load_thematic_data(DictLoader({i: self.dict_thematic[i] for i in ids}))
+        self.load_reference(aligner, index)
+        self._check_canceled()
+        aligner_result = aligner.evaluate(
+            relevant_distances=self.relevant_distances,
+            max_predictions=-1,
+            full_reference_strategy=self.full_strategy,
+        )
+        dict_processresults = aligner_result.get_results(aligner=aligner)
+        dict_evaluated_predictions = aligner_result.get_results(
+            aligner=aligner, result_type=AlignerResultType.EVALUATED_PREDICTIONS
+        )
+        diffs_dict = aligner.get_difference_metrics_for_thematic_data(
+            dict_processresults
+        )
+        fcs = {}
+        if aligner_result.results:
+            fcs = aligner_result.get_results_as_geojson(
+                aligner=aligner,
+                result_type=AlignerResultType.PROCESSRESULTS,
+                add_metadata=self.add_metadata,
+            )
+        return {
+            "index": index,
+            "ids": ids,
+            "processresults": dict_processresults,
+            "evaluated_predictions": dict_evaluated_predictions,
+            "diffs": diffs_dict,
+            "fcs": fcs,
+        }
+
+    def finished(self, result):
+        if self.on_finished is not None:
+            self.on_finished(self, result)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized classification of the state (brdrq_state) of the features of a correction
+layer.
+
+The metrics of the result features (one row per result; multiple rows per thematic id
+when there are multiple predictions) are classified with rules on NumPy-columns:
+
+* evaluation no_change: not changed
+* evaluation equality (by id and/or full reference): no rule, the result is taken
+* empty result: to update
+* unstable result (stability-field): to update; a stable result that is not a polygon
+  goes to review
+* change percentage above review_percentage: to review
+* change below not_changed_area (m²): not changed
+
+Per thematic id the states of its rows are combined (to update > to review > not
+changed > auto updated); an id with multiple results goes to review.
+
+This module does not import QGIS.
+"""
+import numpy as np
+from brdr.enums import Evaluation
+
+REVIEW_PERCENTAGE = 10  # %, results with a larger change move to review
+NOT_CHANGED_AREA = 0.01  # m², results with a smaller change are not changed
+
+# state codes (cfr. BrdrQState)
+STATE_NONE = 0
+STATE_NOT_CHANGED = 1
+STATE_AUTO_UPDATED = 2
+STATE_TO_REVIEW = 3
+STATE_TO_UPDATE = 4
+
+_EQUALITY_EVALUATIONS = [
+    Evaluation.EQUALITY_BY_ID.value,
+    Evaluation.EQUALITY_BY_FULL_REFERENCE.value,
+    Evaluation.EQUALITY_BY_ID_AND_FULL_REFERENCE.value,
+]
+
+
+def _to_float_array(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def factorize(values):
+    """
+    Returns (uniques, codes): the unique values in order of first occurrence and the
+    index of each value in uniques (works for mixed, unsortable ids)
+    """
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values)
+    )
+    return list(index.keys()), codes
+
+
+def classify_results(
+    result_ids,
+    evaluations,
+    sym_changes,
+    sym_percentage_changes,
+    empty,
+    stability=None,
+    polygon=True,
+    review_percentage=REVIEW_PERCENTAGE,
+    not_changed_area=NOT_CHANGED_AREA,
+):
+    """
+    Classifies the result rows and combines them per thematic id.
+
+    Parameters:
+    - result_ids, evaluations (values of Evaluation), sym_changes,
+      sym_percentage_changes, empty (bool): one value per result row
+    - stability: bool per result row, or None when there is no stability-field
+    - polygon: True when the results are polygons
+
+    Returns (ids, last_rows, states): the unique thematic ids, the index of the last
+    result row per id and the state code per id
+    """
+    count = len(result_ids)
+    evaluations = np.asarray(evaluations, dtype=object)
+    sym_changes = _to_float_array(sym_changes)
+    sym_percentage_changes = _to_float_array(sym_percentage_changes)
+    empty = np.asarray(empty, dtype=bool)
+    if stability is None:
+        unstable = stable = np.zeros(count, dtype=bool)
+    else:
+        stable = np.asarray(stability, dtype=bool)
+        unstable = ~stable
+    with np.errstate(invalid="ignore"):
+        row_states = np.select(
+            [
+                evaluations == Evaluation.NO_CHANGE.value,
+                np.isin(evaluations, _EQUALITY_EVALUATIONS),
+                empty,
+                unstable,
+                stable & (not polygon),
+                sym_percentage_changes > review_percentage,
+                sym_changes < not_changed_area,
+            ],
+            [
+                STATE_NOT_CHANGED,
+                STATE_NONE,
+                STATE_TO_UPDATE,
+                STATE_TO_UPDATE,
+                STATE_TO_REVIEW,
+                STATE_TO_REVIEW,
+                STATE_NOT_CHANGED,
+            ],
+            default=STATE_NONE,
+        )
+
+    ids, codes = factorize(result_ids)
+    n_ids = len(ids)
+
+    def any_row(state):
+        return np.bincount(codes, weights=row_states == state, minlength=n_ids) > 0
+
+    last_rows = np.full(n_ids, -1, dtype=np.int64)
+    np.maximum.at(last_rows, codes, np.arange(count))
+    multiple = np.bincount(codes, minlength=n_ids) > 1
+    states = np.select(
+        [
+            any_row(STATE_TO_UPDATE),
+            any_row(STATE_TO_REVIEW) | multiple,
+            any_row(STATE_NOT_CHANGED),
+        ],
+        [STATE_TO_UPDATE, STATE_TO_REVIEW, STATE_NOT_CHANGED],
+        default=STATE_AUTO_UPDATED,
+    )
+    return ids, last_rows, states
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar form of brdr-results, to write output layers without GeoJSON-features.
+
+Per result type (result, result_diff, ...) the results are kept as a geometry-array
+(Shapely, converted to Multi-geometries) and a list of values per attribute:
+{result_type: (geometries, {fieldname: values})}. The attributes are the same as in
+the GeoJSON-export of brdr (get_results_as_geojson).
+
+This module does not import QGIS.
+"""
+import json
+from datetime import date, datetime
+from enum import Enum
+
+import numpy as np
+from brdr.constants import (
+    AREA_ATTRIBUTE,
+    METADATA_FIELD_NAME,
+    PERIMETER_ATTRIBUTE,
+    SHAPE_INDEX_ATTRIBUTE,
+)
+from shapely import (
+    area,
+    get_type_id,
+    is_empty,
+    length,
+    multilinestrings,
+    multipoints,
+    multipolygons,
+)
+from shapely.geometry import MultiLineString, MultiPoint, MultiPolygon, shape
+from shapely.geometry.base import BaseGeometry
+
+# shapely type-id: (multi-function, empty multi-geometry)
+_TO_MULTI = {
+    0: (multipoints, MultiPoint()),
+    1: (multilinestrings, MultiLineString()),
+    3: (multipolygons, MultiPolygon()),
+}
+GEOMETRY_TYPE_NAMES = {
+    0: "Point",
+    1: "LineString",
+    2: "LinearRing",
+    3: "Polygon",
+    4: "MultiPoint",
+    5: "MultiLineString",
+    6: "MultiPolygon",
+    7: "GeometryCollection",
+}
+
+
+def to_multi(geometries):
+    """
+    Array of the geometries with single-geometries converted to Multi-geometries, so
+    the geometry-type of a layer is consistent (cfr. featurecollection_to_multi)
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    type_ids = get_type_id(geometries)
+    empty = is_empty(geometries)
+    for type_id, (multi_function, empty_multi) in _TO_MULTI.items():
+        mask = (type_ids == type_id) & ~empty
+        if mask.any():
+            geometries[mask] = multi_function(geometries[mask].reshape(-1, 1))
+        mask = (type_ids == type_id) & empty
+        geometries[mask] = empty_multi
+    return geometries
+
+
+def to_column_value(value):
+    """
+    Value as it is written to a field: enums as their value, dates as iso-string,
+    dicts and lists as json-string
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def get_column_type(values):
+    """
+    Field type of a column: "bool", "int", "float" or "string" (default, also when
+    all values are None)
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+        return {"b": "bool", "i": "int", "u": "int", "f": "float"}[values.dtype.kind]
+    column_type = None
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (bool, np.bool_)):
+            value_type = "bool"
+        elif isinstance(value, (int, np.integer)):
+            value_type = "int"
+        elif isinstance(value, (float, np.floating)):
+            value_type = "float"
+        else:
+            return "string"
+        if column_type is None or column_type == value_type:
+            column_type = value_type
+        elif {column_type, value_type} == {"int", "float"}:
+            column_type = "float"
+        else:
+            return "string"
+    return column_type or "string"
+
+
+def _rows_to_columns(geometries, row_properties):
+    fieldnames = list(dict.fromkeys(k for p in row_properties for k in p))
+    columns = {
+        fieldname: [to_column_value(p.get(fieldname)) for p in row_properties]
+        for fieldname in fieldnames
+    }
+    return to_multi(geometries), columns
+
+
+def results_to_columns(aligner, results, add_metadata=True, add_original_attributes=True):
+    """
+    Converts results {theme_id: {relevant_distance: ProcessResult}} to columns per
+    result type: {result_type: (geometries, {fieldname: values})}
+    """
+    id_field = aligner.thematic_data.id_fieldname
+    # per result type: the geometries and the (shared) properties of each row
+    rows = {}
+    for theme_id, results_dict in results.items():
+        feature = aligner.thematic_data.features.get(theme_id)
+        for process_result in results_dict.values():
+            if process_result is None:
+                continue
+            properties = {}
+            if add_original_attributes and feature and feature.properties:
+                properties.update(feature.properties)
+            if add_metadata and process_result.get("metadata") is not None:
+                properties[METADATA_FIELD_NAME] = process_result["metadata"]
+            properties[id_field] = theme_id
+            properties.update(process_result["properties"])
+            for result_type, value in process_result.items():
+                if not isinstance(value, BaseGeometry):
+                    continue
+                geometries, row_properties = rows.setdefault(result_type, ([], []))
+                geometries.append(value)
+                row_properties.append(properties)
+
+    columnar = {}
+    for result_type, (geometries, row_properties) in rows.items():
+        geometries, columns = _rows_to_columns(geometries, row_properties)
+        areas = area(geometries)
+        perimeters = length(geometries)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shape_indices = np.where(
+                (areas > 0) & (perimeters > 0), 4 * np.pi * areas / perimeters**2, -1
+            )
+        columns[AREA_ATTRIBUTE] = areas
+        columns[PERIMETER_ATTRIBUTE] = perimeters
+        columns[SHAPE_INDEX_ATTRIBUTE] = shape_indices
+        columnar[result_type] = (geometries, columns)
+    return columnar
+
+
+def featurecollection_to_columns(featurecollection):
+    """
+    Converts a GeoJSON-featurecollection (dict) to (geometries, {fieldname: values})
+    """
+    features = featurecollection.get("features") or []
+    geometries = [
+        shape(f["geometry"]) if f.get("geometry") is not None else None
+        for f in features
+    ]
+    return _rows_to_columns(geometries, [f.get("properties") or {} for f in features])
+
+
+def split_by_geometry_type(geometries, columns):
+    """
+    Splits the columns by geometry-type in one pass (null-geometries are dropped when
+    there are multiple types). Returns a list of (geometry-type, geometries, columns)
+    in order of first occurrence; the geometry-type is None when there are no
+    geometries. The parts are slices of one stable sort, so each column is copied
+    once, whatever the number of geometry-types.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    type_ids = get_type_id(geometries)
+    present, first = np.unique(type_ids, return_index=True)
+    geometry_types = [t for t in present[np.argsort(first)].tolist() if t >= 0]
+    if len(geometry_types) <= 1:
+        geometry_type = GEOMETRY_TYPE_NAMES[geometry_types[0]] if geometry_types else None
+        return [(geometry_type, geometries, columns)]
+    order = np.argsort(type_ids, kind="stable")
+    sorted_type_ids = type_ids[order]
+    geometries = geometries[order]
+    columns = {k: np.asarray(v, dtype=object)[order] for k, v in columns.items()}
+    parts = []
+    for t in geometry_types:
+        start, end = np.searchsorted(sorted_type_ids, [t, t + 1])
+        parts.append(
+            (
+                GEOMETRY_TYPE_NAMES[t],
+                geometries[start:end],
+                {k: v[start:end] for k, v in columns.items()},
+            )
+        )
+    return parts
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Cost model for the step (resolution) of the relevant distances in the FeatureAligner.
+
+The evaluation time of a feature is estimated as:
+
+    seconds = distances * (c0 + c1 * thematic_vertices + c2 * reference_vertices)
+
+with reference_vertices the vertices of the reference features within the maximum
+relevant distance. The coefficients are calibrated (least squares) from the timings
+recorded on this machine. When the reference is not known yet (on-the-fly references),
+the reference vertices are estimated from the reference density of the recorded
+samples.
+"""
+import json
+
+import numpy as np
+from shapely import box, dwithin, get_num_coordinates
+from shapely.geometry.base import BaseGeometry
+
+COST_MODEL_TARGET_LATENCY = 3  # seconds: densest step that stays below
+COST_MODEL_MAX_LATENCY = 30  # seconds: above, the calculation is blocked
+COST_MODEL_MIN_SAMPLES = 10  # samples needed before the model is used
+COST_MODEL_MAX_SAMPLES = 200  # most recent samples kept for calibration
+
+
+def count_vertices(geometries):
+    geometries = [g for g in geometries if isinstance(g, BaseGeometry)]
+    if len(geometries) == 0:
+        return 0
+    return int(get_num_coordinates(np.asarray(geometries, dtype=object)).sum())
+
+
+def get_search_area(geometry, distance):
+    """
+    Area (m²) of the bounding box of the geometry, extended with the distance
+    """
+    xmin, ymin, xmax, ymax = geometry.bounds
+    return box(xmin, ymin, xmax, ymax).buffer(distance, join_style="mitre").area
+
+
+def count_reference_vertices(geometry, reference_geometries, distance):
+    """
+    Number of vertices of the reference geometries within the distance of the geometry
+    """
+    reference_geometries = np.asarray(
+        [g for g in reference_geometries if isinstance(g, BaseGeometry)], dtype=object
+    )
+    if len(reference_geometries) == 0:
+        return 0
+    nearby = reference_geometries[dwithin(reference_geometries, geometry, distance)]
+    return count_vertices(nearby)
+
+
+class CostModel:
+    """
+    Samples {thematic_vertices, reference_vertices, distances, seconds, reference,
+    search_area}, with reference a key of the reference (f.e. the reference choice)
+    """
+
+    def __init__(self, samples=None, max_samples=COST_MODEL_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.samples = list(samples or [])[-max_samples:]
+        self._coefficients = None
+
+    @classmethod
+    def from_json(cls, value):
+        try:
+            samples = json.loads(value) if isinstance(value, str) else value
+            return cls([s for s in samples if isinstance(s, dict)])
+        except (TypeError, ValueError):
+            return cls()
+
+    def to_json(self):
+        return json.dumps(self.samples)
+
+    def add_sample(
+        self,
+        thematic_vertices,
+        reference_vertices,
+        distances,
+        seconds,
+        reference=None,
+        search_area=None,
+    ):
+        if distances <= 0 or seconds <= 0:
+            return
+        self.samples.append(
+            {
+                "thematic_vertices": int(thematic_vertices),
+                "reference_vertices": int(reference_vertices),
+                "distances": int(distances),
+                "seconds": float(seconds),
+                "reference": reference,
+                "search_area": search_area,
+            }
+        )
+        self.samples = self.samples[-self.max_samples :]
+        self._coefficients = None
+
+    def is_calibrated(self):
+        return len(self.samples) >= COST_MODEL_MIN_SAMPLES
+
+    def coefficients(self):
+        """
+        (c0, c1, c2): seconds per distance, fixed and per thematic/reference vertex
+        """
+        if self._coefficients is None and self.is_calibrated():
+            x = np.array(
+                [
+                    [1.0, s["thematic_vertices"], s["reference_vertices"]]
+                    for s in self.samples
+                ]
+            )
+            y = np.array([s["seconds"] / s["distances"] for s in self.samples])
+            c = np.linalg.lstsq(x, y, rcond=None)[0]
+            # a negative cost is not realistic (f.e. with too few different samples)
+            self._coefficients = tuple(float(v) for v in np.clip(c, 0, None))
+        return self._coefficients
+
+    def estimate(self, thematic_vertices, reference_vertices, distances):
+        """
+        Estimated evaluation time (seconds), or None when the model is not calibrated
+        """
+        c = self.coefficients()
+        if c is None:
+            return None
+        return distances * (
+            c[0] + c[1] * thematic_vertices + c[2] * reference_vertices
+        )
+
+    def estimate_reference_vertices(self, reference, search_area):
+        """
+        Estimated reference vertices in the search area, based on the density of the
+        samples of the same reference. None when there are no samples.
+        """
+        samples = [
+            s
+            for s in self.samples
+            if s.get("reference") == reference and s.get("search_area")
+        ]
+        area = sum(s["search_area"] for s in samples)
+        if area <= 0:
+            return None
+        density = sum(s["reference_vertices"] for s in samples) / area
+        return density * search_area
+
+    def choose_step(
+        self,
+        candidates,
+        thematic_vertices,
+        reference_vertices,
+        target_latency=COST_MODEL_TARGET_LATENCY,
+        max_latency=COST_MODEL_MAX_LATENCY,
+    ):
+        """
+        Chooses the densest step of the candidates [(step, distances)] (ordered from
+        dense to coarse) with an estimated time below the target latency. If none, the
+        coarsest step is used, unless its estimate exceeds the maximum latency.
+
+        Returns (step, estimate); step is None when blocked. Returns (None, None) when
+        the model is not calibrated.
+        """
+        if not self.is_calibrated() or not candidates or reference_vertices is None:
+            return None, None
+        estimate = None
+        for step, distances in candidates:
+            estimate = self.estimate(thematic_vertices, reference_vertices, distances)
+            if estimate <= target_latency:
+                return step, estimate
+        if estimate > max_latency:
+            return None, estimate
+        return candidates[-1][0], estimate
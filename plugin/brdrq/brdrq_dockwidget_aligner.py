@@ -28,6 +28,7 @@ from qgis.PyQt import QtWidgets
 from qgis.core import Qgis
 from qgis.core import edit
 
+from .brdrq_cost_model import COST_MODEL_MAX_LATENCY, COST_MODEL_TARGET_LATENCY
 from .brdrq_help import brdrQHelp
 from .brdrq_settings import brdrQSettings
 from .qt_compat import (
@@ -42,10 +43,10 @@ from .brdrq_utils import (
     get_workfolder,
     geom_shapely_to_qgis,
     get_layer_by_name,
-    BRDRQ_ORIGINAL_WKT_FIELDNAME,
     BRDRQ_STATE_FIELDNAME,
     BrdrQState,
     get_original_geometry,
+    get_original_geometry_attribute,
     setFilterOnLayer,
 )
 
@@ -66,6 +67,10 @@ class brdrQDockWidgetAligner(object):
             1000000  # maximum m² where the calculation will be done for
         )
         self.max_rel_dist_optimization = 7.5  # in meters
+        # calculation time (seconds) targeted by the cost model, and above which the
+        # calculation is blocked
+        self.target_latency = COST_MODEL_TARGET_LATENCY
+        self.max_latency = COST_MODEL_MAX_LATENCY
         self.listed_features = None
         self.feature = None
         self.selectTool = None
@@ -81,6 +86,9 @@ class brdrQDockWidgetAligner(object):
         self.reference_layer = None
         self.max_rel_dist = None
         self.metadata = None
+        self.adaptive_sweep = None
+        self.prediction_cache_memory = None
+        self.prefetch_count = None
         self.full_strategy = None
         self.partial_snapping = None
         self.partial_snapping_strategy = None
@@ -149,7 +157,12 @@ class brdrQDockWidgetAligner(object):
         relevant_distance = round(
             self.doubleSpinBox.value(), self.settingsDialog.DECIMAL
         )
-        if relevant_distance in self.dict_processresults[key]:
+        # results are not available yet while the alignment is running
+        if (
+            self.dict_processresults is not None and
+            key in self.dict_processresults and
+            relevant_distance in self.dict_processresults[key]
+        ):
             result = self.dict_processresults[key][relevant_distance]
             resulting_geom = result["result"]
         else:
@@ -168,25 +181,19 @@ class brdrQDockWidgetAligner(object):
             layer.changeGeometry(feat.id(), qgis_geom)
         try:
             ix_brdrq_state = layer.fields().indexOf(BRDRQ_STATE_FIELDNAME)
-            ix_brdrq_original_wkt = layer.fields().indexOf(BRDRQ_ORIGINAL_WKT_FIELDNAME)
+            # the original geometry is kept unchanged
             ix_brdr_metadata_fieldname = layer.fields().indexOf(METADATA_FIELD_NAME)
             with edit(layer):
                 if ix_brdrq_state >= 0:
                     layer.changeAttributeValue(
                         feat.id(), ix_brdrq_state, str(BrdrQState.MANUAL_UPDATED.value)
                     )
-                if ix_brdrq_original_wkt >= 0:
-                    layer.changeAttributeValue(
-                        feat.id(),
-                        ix_brdrq_original_wkt,
-                        str(feat[ix_brdrq_original_wkt]),
-                    )
                 if ix_brdr_metadata_fieldname >= 0:
                     layer.changeAttributeValue(
                         feat.id(), ix_brdr_metadata_fieldname, str(result["metadata"])
                     )
         except:
-            errormessage = "state/original_wkt/metadata could not be updated, please check brdrq-columns for these data."
+            errormessage = "state/metadata could not be updated, please check brdrq-columns for these data."
             self.iface.messageBar().pushMessage(
                 "Warning",
                 errormessage,
@@ -205,11 +212,15 @@ class brdrQDockWidgetAligner(object):
         feat = self.feature
         if feat is None:
             return
-        original_geometry = get_original_geometry(feat, BRDRQ_ORIGINAL_WKT_FIELDNAME)
+        original_geometry = get_original_geometry(feat)
         if original_geometry is None:
             key = feat.id()
             relevant_distance = round(0.0, self.settingsDialog.DECIMAL)
-            if relevant_distance in self.dict_processresults[key]:
+            if (
+                self.dict_processresults is not None and
+                key in self.dict_processresults and
+                relevant_distance in self.dict_processresults[key]
+            ):
                 result = self.dict_processresults[key][relevant_distance]
                 original_geometry = geom_shapely_to_qgis(result["result"])
             else:
@@ -228,23 +239,25 @@ class brdrQDockWidgetAligner(object):
 
         try:
             ix_brdrq_state = layer.fields().indexOf(BRDRQ_STATE_FIELDNAME)
-            ix_brdrq_original_wkt = layer.fields().indexOf(BRDRQ_ORIGINAL_WKT_FIELDNAME)
+            ix_brdrq_original, original_value = get_original_geometry_attribute(
+                layer, original_geometry
+            )
             ix_brdr_metadata_fieldname = layer.fields().indexOf(METADATA_FIELD_NAME)
             with edit(layer):
                 if ix_brdrq_state >= 0:
                     layer.changeAttributeValue(
                         feat.id(), ix_brdrq_state, str(BrdrQState.TO_UPDATE.value)
                     )
-                if ix_brdrq_original_wkt >= 0:
+                if ix_brdrq_original >= 0:
                     layer.changeAttributeValue(
-                        feat.id(), ix_brdrq_original_wkt, str(original_geometry.asWkt())
+                        feat.id(), ix_brdrq_original, original_value
                     )
                 if ix_brdr_metadata_fieldname >= 0:
                     layer.changeAttributeValue(
                         feat.id(), ix_brdr_metadata_fieldname, str({})
                     )
         except:
-            errormessage = "state/original_wkt/metadata could not be reset, please check brdrq-columns for these data."
+            errormessage = "state/original geometry/metadata could not be reset, please check brdrq-columns for these data."
             self.iface.messageBar().pushMessage(
                 "Warning",
                 errormessage,
@@ -471,6 +484,9 @@ class brdrQDockWidgetAligner(object):
         self.step = self.settingsDialog.step
         self.relevant_distances = self.settingsDialog.relevant_distances
         self.metadata = self.settingsDialog.metadata
+        self.adaptive_sweep = self.settingsDialog.adaptive_sweep
+        self.prediction_cache_memory = self.settingsDialog.prediction_cache_memory
+        self.prefetch_count = self.settingsDialog.prefetch_count
         self.full_strategy = self.settingsDialog.full_strategy
         self.partial_snapping = self.settingsDialog.partial_snapping
         self.partial_snapping_strategy = self.settingsDialog.partial_snapping_strategy
@@ -23,33 +23,40 @@
 """
 
 import os
+from functools import partial
 
 from brdr.aligner import Aligner
 from brdr.be.grb.enums import GRBType
 from brdr.be.grb.loader import GRBActualLoader, GRBFiscalParcelLoader
-from brdr.constants import PREDICTION_SCORE, EVALUATION_FIELD_NAME
-from brdr.enums import AlignerResultType
-from brdr.geometry_utils import geom_from_wkt
+from brdr.configs import AlignerConfig, ProcessorConfig
+from brdr.constants import PREDICTION_SCORE, EVALUATION_FIELD_NAME, VERSION_DATE
 from brdr.loader import DictLoader
-from qgis import processing
 from qgis.PyQt import QtWidgets, uic
 from qgis.PyQt.QtCore import pyqtSignal
-from qgis.core import QgsFeatureRequest, edit
+from qgis.core import Qgis, QgsApplication, QgsFeatureRequest, QgsField
 from qgis.core import QgsProject
 from qgis.core import QgsStyle
-from qgis.utils import OverrideCursor
 
+from .brdrq_adaptive_sweep import enable_adaptive_sweep
+from .brdrq_bulk_engine import BulkAlignTask, build_chunks
 from .brdrq_dockwidget_aligner import brdrQDockWidgetAligner
+from .brdrq_parallel import merge_featurecollections
+from .brdrq_reference_cache import CachedReferenceLoader, SessionReferenceCache
+from .brdrq_reference_index import LocalReferenceIndex
 from .brdrq_utils import (
     move_to_group,
     zoom_to_features,
-    add_field_to_layer,
-    geom_shapely_to_qgis,
+    geoms_shapely_to_qgis,
     featurecollection_to_layer,
+    open_output_store,
     remove_group_layer,
-    geom_qgis_to_shapely,
+    wkbs_to_shapely,
+    geom_qgis_to_wkb,
+    get_processor_by_id,
     GRB_TYPES,
     ADPF_VERSIONS,
+    DICT_REFERENCE_OPTIONS,
+    PREFIX_LOCAL_LAYER,
     BRDRQ_STATE_FIELDNAME,
     BrdrQState,
 )
@@ -57,7 +64,7 @@ from .qt_compat import (
     map_layer_filter_polygon,
     qgs_field_type_string,
     qt_right_dock_widget_area,
-    qt_wait_cursor,
+    qt_user_role,
     set_map_layer_combo_filters,
 )
 
@@ -80,7 +87,17 @@ class brdrQDockWidgetBulkAligner(
 
         self.workinglayer = None
         self.workinggroupname = None
-        self.featureItemList = None
+        # state of the evaluated features, by fid (in order of evaluation)
+        self.feature_states = {}
+        self.nr_predictions = {}
+        # in-memory reference features of the session (on-the-fly references)
+        self.session_reference_cache = SessionReferenceCache()
+        self.local_reference_index = None
+        self._evaluate_task = None
+        self._evaluate_tasks = set()  # references to the running tasks
+        self._chunk_references = None
+        self._list_fcs = []
+        self._thematic_ids = []
 
     def clearUserInterface(self):
         # Clear progressbar
@@ -120,22 +137,68 @@ class brdrQDockWidgetBulkAligner(
     def onClosePlugin(self):
         """Cleanup necessary items here when plugin dockwidget is closed"""
         print("** CLOSING brdrQ")
+        self._cancel_evaluate_task()
+        if self.local_reference_index is not None:
+            self.local_reference_index.disconnect()
+            self.local_reference_index = None
         remove_group_layer(self.workinggroupname)
         # disconnects
         print("** disconnect dockwidget")
         self.closingPlugin.disconnect(self.onClosePlugin)
         self.active = False
 
-    def evaluate(self, task):
+    def evaluate(self, checked=False):
         print("evaluate")
+        # a running evaluation is replaced by the new one
+        self._cancel_evaluate_task()
         self.clearUserInterface()
+        self.textEdit_output.setText("")
+        self.layer = self.mMapLayerComboBox.currentLayer()
+        if self.layer is None:
+            self.textEdit_output.setText("No layer selected")
+            return
+        self.crs = self.layer.sourceCrs().authid()
+        self.aligner_result = None
+        self.dict_processresults = {}
+        self.dict_evaluated_predictions = {}
+        self.diffs_dict = {}
+        self.feature_states = {}
+        self.nr_predictions = {}
+        self._list_fcs = []
+
+        self.workinglayer, self.workinggroupname = self.create_workinglayer()
+        dict_thematic = self.get_thematic_geometries()
+        self._thematic_ids = list(dict_thematic.keys())
+        if not dict_thematic:
+            self.textEdit_output.setText("No features to evaluate")
+            return
+        chunks = build_chunks(dict_thematic, max(self.relevant_distances))
+        if not self._prepare_reference(chunks, dict_thematic):
+            return
 
-        with OverrideCursor(qt_wait_cursor()):
-            self.workinglayer, self.workinggroupname = self.create_workinglayer()
-            self.evaluate_layer()
-            self.prepareFeatureList()
-            self.loadFeaturelist()
-        # dlg.hide()
+        task = BulkAlignTask(
+            f"brdrQ - bulk evaluation of {len(dict_thematic)} features",
+            chunks,
+            dict_thematic,
+            self._create_aligner,
+            partial(self._load_chunk_reference, self._chunk_references),
+            self.relevant_distances,
+            self.full_strategy,
+            add_metadata=self.metadata,
+            on_finished=self._onEvaluateTaskFinished,
+        )
+        task.chunkEvaluated.connect(
+            lambda chunk, task=task: self._onChunkEvaluated(task, chunk)
+        )
+        task.progressChanged.connect(
+            lambda progress, task=task: self._onEvaluateTaskProgress(task, progress)
+        )
+        self._evaluate_task = task
+        self._evaluate_tasks.add(task)
+        self.textEdit_output.setText(
+            f"Evaluating {len(dict_thematic)} features in {len(chunks)} chunks..."
+        )
+        QgsApplication.taskManager().addTask(task)
         return
 
     def create_workinglayer(self):
@@ -143,7 +206,7 @@ class brdrQDockWidgetBulkAligner(
         visible = True
         qinst = QgsProject.instance()
         root = qinst.layerTreeRoot()
-        layer = self.mMapLayerComboBox.currentLayer()
+        layer = self.layer
         # create a new layer from all features
         if self.checkBox_only_selected.isChecked():
             new_layer = layer.materialize(
@@ -153,13 +216,19 @@ class brdrQDockWidgetBulkAligner(
             new_layer = layer.materialize(
                 QgsFeatureRequest().setFilterFids(layer.allFeatureIds())
             )
-        # add attribute for automatic/manual correction
-        # new_layer.renderer().setSymbol(QgsStyle.defaultStyle().symbol("hashed clbue /"))
-        add_field_to_layer(
-            layer,
-            BRDRQ_STATE_FIELDNAME,
-            qgs_field_type_string(),
-            BrdrQState.TO_UPDATE,
+        # add attribute for automatic/manual correction (bulk provider update)
+        provider = new_layer.dataProvider()
+        if provider.fieldNameIndex(BRDRQ_STATE_FIELDNAME) == -1:
+            provider.addAttributes(
+                [QgsField(BRDRQ_STATE_FIELDNAME, qgs_field_type_string())]
+            )
+            new_layer.updateFields()
+        ix_state = provider.fieldNameIndex(BRDRQ_STATE_FIELDNAME)
+        provider.changeAttributeValues(
+            {
+                fid: {ix_state: str(BrdrQState.TO_UPDATE.value)}
+                for fid in new_layer.allFeatureIds()
+            }
         )
 
         # add a new layer to the map
@@ -179,210 +248,275 @@ class brdrQDockWidgetBulkAligner(
         self.iface.layerTreeView().refreshLayerSymbology(new_layer.id())
         return new_layer, groupname
 
-    def evaluate_layer(self):
-        self.progressBar.setValue(5)
-        self.aligner = Aligner()
-        dict_to_load = {}
-        for feature in self.getWorkingFeatures():
-            feature_geom = feature.geometry()
-            wkt = feature_geom.asWkt()
-            geom_shapely = geom_from_wkt(wkt)
-            dict_to_load[feature.id()] = geom_shapely
-        self.progressBar.setValue(10)
-        # Load thematic data
-        self.aligner.load_thematic_data(DictLoader(dict_to_load))
-        self.progressBar.setValue(20)
-        # Load reference data for the on-the fly reference versions
-
+    def get_thematic_geometries(self):
+        """
+        Returns {fid: shapely-geometry} of the working layer (batched WKB-conversion);
+        features without geometry are skipped
+        """
+        request = QgsFeatureRequest().setNoAttributes()
+        fids = []
+        wkbs = []
+        for feature in self.workinglayer.getFeatures(request):
+            fids.append(feature.id())
+            wkbs.append(geom_qgis_to_wkb(feature.geometry()))
+        return {
+            fid: geom
+            for fid, geom in zip(fids, wkbs_to_shapely(wkbs))
+            if geom is not None
+        }
+
+    def _create_aligner(self):
+        """
+        New Aligner with the settings of the dock (also used in the background task)
+        """
+        processor_config = ProcessorConfig()
+        processor_config.od_strategy = self.od_strategy
+        processor_config.threshold_overlap_percentage = (
+            self.threshold_overlap_percentage
+        )
+        processor_config.snap_strategy = self.partial_snapping_strategy
+        processor_config.snap_max_segment_length = self.snap_max_segment_length
+        processor_config.partial_snapping = self.partial_snapping
+        processor_config.partial_snap_strategy = self.partial_snapping_strategy
+        processor_config.partial_snap_max_segment_length = self.snap_max_segment_length
+        processor = get_processor_by_id(
+            processor_id=self.processor.value, config=processor_config
+        )
+        aligner_config = AlignerConfig()
+        aligner_config.log_metadata = self.metadata
+        aligner_config.add_observations = self.metadata
+        aligner = Aligner(crs=self.crs, processor=processor, config=aligner_config)
+        if self.adaptive_sweep:
+            enable_adaptive_sweep(aligner)
+        return aligner
+
+    def _get_reference_loader(self, aligner):
+        """
+        Loader of the on-the-fly reference for the aligner, or None for a local
+        reference layer
+        """
+        reference_choice_id = DICT_REFERENCE_OPTIONS[self.reference_choice]
         if self.reference_choice in GRB_TYPES:
-            self.aligner.load_reference_data(
+            return CachedReferenceLoader(
                 GRBActualLoader(
-                    grb_type=GRBType[self.reference_choice],
+                    grb_type=GRBType[reference_choice_id],
                     partition=1000,
-                    aligner=self.aligner,
-                )
+                    aligner=aligner,
+                ),
+                f"GRB_{reference_choice_id}",
+                session=self.session_reference_cache,
             )
         elif self.reference_choice in ADPF_VERSIONS:
-            year = self.reference_choice.removeprefix("Adpf")
-            self.aligner.load_reference_data(
-                GRBFiscalParcelLoader(year=year, aligner=self.aligner, partition=1000)
+            return CachedReferenceLoader(
+                GRBFiscalParcelLoader(
+                    year=reference_choice_id, aligner=aligner, partition=1000
+                ),
+                f"ADPF_{reference_choice_id}",
+                session=self.session_reference_cache,
             )
-        else:
-            # Load reference into a shapely_dict:
-            dict_reference = {}
-            processing.run(
-                "native:selectwithindistance",
-                {
-                    "INPUT": self.reference_layer,
-                    "REFERENCE": self.layer,
-                    "DISTANCE": 2 * self.maximum / 100,
-                    "METHOD": 0,
-                },
+        return None
+
+    def _prepare_reference(self, chunks, dict_thematic):
+        """
+        Checks the reference (in the main thread). For a local reference layer, the
+        reference features of each chunk are taken from the STRtree of the layer.
+        """
+        self._chunk_references = None
+        if self.reference_choice in GRB_TYPES or self.reference_choice in ADPF_VERSIONS:
+            try:
+                self._get_reference_loader(self._create_aligner())
+            except Exception as e:
+                self._show_warning(
+                    "CRS",
+                    f"Reference layer does not support CRS of current thematic layer: {str(e)}",
+                )
+                return False
+            return True
+        if self.reference_layer is None or self.reference_layer.crs() != self.layer.crs():
+            self._show_warning(
+                "CRS",
+                "Thematic layer and ReferenceLayer are in a different CRS."
+                "Please provide them in the same CRS, with units in meter (f.e. For Belgium in EPSG:31370 or EPSG:3812)",
             )
-            features = self.reference_layer.selectedFeatures()
-            for current, feature in enumerate(features):
-                id_reference = feature.attribute(self.reference_id)
-                dict_reference[id_reference] = geom_qgis_to_shapely(feature.geometry())
-            self.reference_layer.removeSelection()
-            self.aligner.load_reference_data(DictLoader(dict_reference))
-            self.aligner.name_reference_id = self.reference_id
-            self.aligner.dict_reference_source["source"] = "local"
-            self.aligner.dict_reference_source["version_date"] = "unknown"
-        self.progressBar.setValue(50)
-
-        dict_evaluated_predictions = self.aligner.evaluate(
-            ids_to_evaluate=None,
-            base_metadata_field=None,
-            max_predictions=-1,
-            relevant_distances=self.relevant_distances,
-            full_strategy=self.full_strategy,
-        )
-        self.progressBar.setValue(75)
-        dict_processresults = self.aligner.dict_processresults
-        newline = os.linesep
-        outputMessage = ""
-        for key in dict_evaluated_predictions.keys():
-
-            outputMessage = (
-                outputMessage +
-                str(key) +
-                ": Voorspelde relevante afstanden: " +
-                str([str(k) for k in dict_evaluated_predictions[key].keys()]) +
-                newline
+            return False
+        if self.local_reference_index is None or not self.local_reference_index.matches(
+            self.reference_layer, self.reference_id
+        ):
+            if self.local_reference_index is not None:
+                self.local_reference_index.disconnect()
+            self.local_reference_index = LocalReferenceIndex(
+                self.reference_layer, self.reference_id
             )
-        self.textEdit_output.setText(outputMessage)
-
-        self.dict_processresults = dict_processresults
-        self.dict_evaluated_predictions = dict_evaluated_predictions
-        self.diffs_dict = self.aligner.get_diff_metrics(
-            self.dict_processresults, self.aligner.dict_thematic
+        dist = 2 * self.maximum / 100
+        self._chunk_references = []
+        for ids in chunks:
+            dict_reference = {}
+            for i in ids:
+                dict_reference.update(
+                    self.local_reference_index.query(dict_thematic[i], dist)
+                )
+            self._chunk_references.append(dict_reference)
+        return True
+
+    def _load_chunk_reference(self, chunk_references, aligner, index):
+        """
+        Loads the reference of a chunk (in the background task): the reference features
+        of the chunk (local reference), or an on-the-fly reference loader
+        """
+        if chunk_references is None:
+            aligner.load_reference_data(self._get_reference_loader(aligner))
+            return
+        aligner.load_reference_data(
+            DictLoader(chunk_references[index], is_reference=True)
         )
-        self.add_results_to_grouplayer()
-        # set list with predicted values
-        self.listWidget_predictions.clear()
-        items = []
-        items_with_name = []
-        best_index = 0
-        best_score = 0
-        list_predictions = [k for k in (self.dict_evaluated_predictions[key]).keys()]
-        for k in list_predictions:
-            items.append(str(k))
-            score = self.dict_evaluated_predictions[key][k]["properties"][
-                PREDICTION_SCORE
-            ]
-            evaluation = self.dict_evaluated_predictions[key][k]["properties"][
-                EVALUATION_FIELD_NAME
-            ]
-            items_with_name.append(f"{str(k)}: {str(evaluation)} (score: {str(score)})")
-            if score > best_score:
-                best_score = score
-                best_index = list_predictions.index(k)
-        self.listWidget_predictions.setFocus()
-        self.listWidget_predictions.addItems(items_with_name)
-        if len(items) > 0:
-            self.listWidget_predictions.setCurrentRow(best_index)
-            self.doubleSpinBox.setValue(
-                round(float(items[best_index]), self.settingsDialog.DECIMAL)
-            )
-        else:
-            self.textEdit_output.setText("No predictions")
-        self.progressBar.setValue(100)
-        return
-
-    def add_results_to_grouplayer(self):
-        fcs = self.aligner.get_results_as_geojson(
-            resulttype=AlignerResultType.PROCESSRESULTS, add_metadata=self.metadata
+        aligner.name_reference_id = self.reference_id
+        aligner.reference_data.source["source"] = PREFIX_LOCAL_LAYER
+        aligner.reference_data.source["source_url"] = PREFIX_LOCAL_LAYER
+        aligner.reference_data.source[VERSION_DATE] = "unknown"
+
+    def _show_warning(self, title, message):
+        self.iface.messageBar().pushMessage(
+            title, message, level=Qgis.Warning, duration=5
         )
 
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF,
-            fcs["result_diff"],
-            QgsStyle.defaultStyle().symbol("hashed black X"),
-            False,
-            self.workinggroupname,
-            self.tempfolder,
-        )
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF_PLUS,
-            fcs["result_diff_plus"],
-            QgsStyle.defaultStyle().symbol("hashed cgreen /"),
-            True,
-            self.workinggroupname,
-            self.tempfolder,
-        )
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF_MIN,
-            fcs["result_diff_min"],
-            QgsStyle.defaultStyle().symbol("hashed cred /"),
-            True,
-            self.workinggroupname,
-            self.tempfolder,
+    def _cancel_evaluate_task(self):
+        if self._evaluate_task is not None:
+            self._evaluate_task.cancel()
+            self._evaluate_task = None
+
+    def _onEvaluateTaskProgress(self, task, progress):
+        if task is self._evaluate_task and not self._is_closing:
+            self.progressBar.setValue(int(progress))
+
+    def _onChunkEvaluated(self, task, chunk):
+        """
+        Streams the results of an evaluated chunk into the working layer (main thread)
+        """
+        if task is not self._evaluate_task or self._is_closing:
+            return
+        self.dict_processresults.update(chunk["processresults"])
+        self.dict_evaluated_predictions.update(chunk["evaluated_predictions"])
+        self.diffs_dict.update(chunk["diffs"])
+        self._list_fcs.append(chunk["fcs"])
+
+        # bulk provider updates of the states and the (auto-)updated geometries
+        auto_geometries = {}
+        states = {}
+        for fid in chunk["ids"]:
+            geom_predictions = self.dict_evaluated_predictions.get(fid, {})
+            self.nr_predictions[fid] = len(geom_predictions)
+            if len(geom_predictions) == 1:
+                # only one prediction: automatic update
+                prediction = next(iter(geom_predictions.values()))
+                if prediction.get("result") is not None:
+                    auto_geometries[fid] = prediction["result"]
+                    states[fid] = BrdrQState.AUTO_UPDATED
+                    continue
+            states[fid] = BrdrQState.TO_REVIEW
+        provider = self.workinglayer.dataProvider()
+        if auto_geometries:
+            qgis_geometries = geoms_shapely_to_qgis(list(auto_geometries.values()))
+            provider.changeGeometryValues(
+                {
+                    fid: geom
+                    for fid, geom in zip(auto_geometries.keys(), qgis_geometries)
+                    if not geom.isNull()
+                }
+            )
+        ix_state = self.workinglayer.fields().indexOf(BRDRQ_STATE_FIELDNAME)
+        provider.changeAttributeValues(
+            {fid: {ix_state: str(state.value)} for fid, state in states.items()}
         )
-        featurecollection_to_layer(
-            self.LAYER_RESULT,
-            fcs["result"],
-            "result",
-            True,
-            self.workinggroupname,
-            self.tempfolder,
+        self.workinglayer.triggerRepaint()
+        for fid, state in states.items():
+            self.feature_states[fid] = str(state.value)
+            self._add_feature_item(fid)
+        self.textEdit_output.setText(
+            f"Chunk {chunk['index'] + 1}/{len(task.chunks)} evaluated "
+            f"({len(self.feature_states)}/{len(self._thematic_ids)} features)"
         )
-        return
 
-    def prepareFeatureList(self):
-        # self.clearUserInterface()
-        # Add the selected features to the list widget
-        print("list features")
-        feature = None
-        self.featureItemList = []
-
-        for key in self.dict_processresults.keys():
-            for f in self.getWorkingFeatures():
-                if f.id() == key:
-                    feature = f
-                    break
-            if feature is None:
-                print(f"no feature found for key {str(key)}")
-                continue
-            qgis_geom = None
-            if key in self.dict_evaluated_predictions:
-                print(f"keys {str(key)}")
-                geom_predictions = self.dict_evaluated_predictions[key]
-                nr_predictions = len(geom_predictions.keys())
-                print("nr_predictions" + str(nr_predictions))
-                if nr_predictions == 1:
-                    print(f"auto {str(nr_predictions)}")
-                    # update geometry in workinglayer
-                    resulting_geom = geom_predictions[list(geom_predictions.keys())[0]][
-                        "result"
-                    ]
-                    qgis_geom = geom_shapely_to_qgis(resulting_geom)
-                    attribute_string = "auto"
-                else:
-                    print(f"to_check {str(nr_predictions)}")
-                    attribute_string = "to_check_multi_predictions"
-            else:
-                attribute_string = "to_check_no_predictions"
-            with edit(self.workinglayer):
-                self.workinglayer.changeAttributeValue(
-                    feature.id(),
-                    self.workinglayer.fields().indexOf(BRDRQ_STATE_FIELDNAME),
-                    attribute_string,
+    def _onEvaluateTaskFinished(self, task, result):
+        self._evaluate_tasks.discard(task)
+        if task is not self._evaluate_task or self._is_closing:
+            return
+        self._evaluate_task = None
+        if not result:
+            if task.exception is not None:
+                self._show_warning(
+                    "Evaluation", f"Evaluation failed: {str(task.exception)}"
                 )
-                if not qgis_geom is None:
-                    self.workinglayer.changeGeometry(feature.id(), qgis_geom)
+            self.textEdit_output.setText(
+                f"Evaluation stopped after {task.evaluated_chunks}/{len(task.chunks)} chunks"
+            )
+            return
+        self.add_results_to_grouplayer()
+        nr_auto = sum(
+            1 for s in self.feature_states.values() if s == BrdrQState.AUTO_UPDATED.value
+        )
+        self.textEdit_output.setText(
+            f"{len(self.feature_states)} features evaluated: {nr_auto} automatically "
+            f"updated, {len(self.feature_states) - nr_auto} to review"
+        )
+        self.progressBar.setValue(100)
 
+    def add_results_to_grouplayer(self):
+        fcs = merge_featurecollections(self._list_fcs, self._thematic_ids)
+        if not fcs:
+            return
+        with open_output_store(self.tempfolder, self.crs) as output_store:
+            featurecollection_to_layer(
+                self.LAYER_RESULT_DIFF,
+                fcs["result_diff"],
+                QgsStyle.defaultStyle().symbol("hashed black X"),
+                False,
+                self.workinggroupname,
+                self.tempfolder,
+                output_store,
+            )
+            featurecollection_to_layer(
+                self.LAYER_RESULT_DIFF_PLUS,
+                fcs["result_diff_plus"],
+                QgsStyle.defaultStyle().symbol("hashed cgreen /"),
+                True,
+                self.workinggroupname,
+                self.tempfolder,
+                output_store,
+            )
+            featurecollection_to_layer(
+                self.LAYER_RESULT_DIFF_MIN,
+                fcs["result_diff_min"],
+                QgsStyle.defaultStyle().symbol("hashed cred /"),
+                True,
+                self.workinggroupname,
+                self.tempfolder,
+                output_store,
+            )
+            featurecollection_to_layer(
+                self.LAYER_RESULT,
+                fcs["result"],
+                "result",
+                True,
+                self.workinggroupname,
+                self.tempfolder,
+                output_store,
+            )
         return
 
-    def getWorkingFeatures(self):
-        return [f for f in self.workinglayer.getFeatures()]
+    def _add_feature_item(self, fid):
+        state = self.feature_states[fid]
+        if self.checkBox_only_manual.isChecked() and state != BrdrQState.TO_REVIEW.value:
+            return
+        item = QtWidgets.QListWidgetItem(
+            f"ID: {str(fid)}, State: {state}, Predictions: {self.nr_predictions.get(fid, 0)}"
+        )
+        item.setData(qt_user_role(), fid)
+        self.listWidget_features.addItem(item)
 
     def loadFeaturelist(self):
         self.clearUserInterface()
-        for f in self.getWorkingFeatures():
-            item = f"ID: *{str(f.id())}*, Attributes: {f[BRDRQ_STATE_FIELDNAME]}"
-            if self.checkBox_only_manual.isChecked() and "to_check" not in item:
-                continue
-            self.listWidget_features.addItem(item)
+        for fid in self.feature_states:
+            self._add_feature_item(fid)
 
     def onFeatureActivated(self, currentItem):
         print("_onFeatureChange")
@@ -393,20 +527,19 @@ class brdrQDockWidgetBulkAligner(
             return
 
         # get feature
+        key = currentItem.data(qt_user_role())
         self.feature = None
-        key = currentItem.text().split("*")[1]
-        for feat in self.getWorkingFeatures():
-            if str(feat.id()) == key:
-                self.feature = feat
-                break
-        if self.feature is None:
+        if key is not None and self.workinglayer is not None:
+            self.feature = self.workinglayer.getFeature(key)
+        if self.feature is None or not self.feature.isValid():
+            self.feature = None
             self.textEdit_output.setText(f"No feature found with ID {key}")
             return
-        key = self.feature.id()
 
-        zoom_to_features([self.feature], self.iface,features_crs=self.crs)
+        zoom_to_features([self.feature], self.iface, features_crs=self.crs)
 
-        list_predictions = [k for k in (self.dict_evaluated_predictions[key]).keys()]
+        geom_predictions = self.dict_evaluated_predictions.get(key, {})
+        list_predictions = list(geom_predictions.keys())
 
         items = []
         items_with_name = []
@@ -414,12 +547,8 @@ class brdrQDockWidgetBulkAligner(
         best_score = 0
         for k in list_predictions:
             items.append(str(k))
-            score = self.dict_evaluated_predictions[key][k]["properties"][
-                PREDICTION_SCORE
-            ]
-            evaluation = self.dict_evaluated_predictions[key][k]["properties"][
-                EVALUATION_FIELD_NAME
-            ]
+            score = geom_predictions[k]["properties"][PREDICTION_SCORE]
+            evaluation = geom_predictions[k]["properties"][EVALUATION_FIELD_NAME]
             items_with_name.append(f"{str(k)}: {str(evaluation)} (score: {str(score)})")
             if score > best_score:
                 best_score = score
@@ -434,12 +563,21 @@ class brdrQDockWidgetBulkAligner(
         else:
             self.textEdit_output.setText("No predictions")
 
+    def _update_feature_state(self):
+        if self.feature is None:
+            return
+        feature = self.workinglayer.getFeature(self.feature.id())
+        if feature.isValid() and self.feature.id() in self.feature_states:
+            self.feature_states[self.feature.id()] = str(feature[BRDRQ_STATE_FIELDNAME])
+
     def change_geometry(self):
         self._change_geometry(self.workinglayer)
+        self._update_feature_state()
         self.loadFeaturelist()
 
     def reset_geometry(self):
         self._reset_geometry(self.workinglayer)
+        self._update_feature_state()
         self.loadFeaturelist()
 
     def onListItemActivated(self, currentItem):
@@ -22,6 +22,7 @@
  ***************************************************************************/
 """
 
+import json
 import os
 import time
 
@@ -36,20 +37,37 @@ from brdr.loader import DictLoader
 from brdr.nl.enums import BRKType
 from brdr.nl.loader import BRKLoader
 from brdr.osm.loader import OSMLoader
+import numpy as np
 from qgis.PyQt import QtWidgets, uic
 from qgis.PyQt.QtCore import pyqtSignal, Qt, QTimer, QSignalBlocker, QEvent
 from qgis.PyQt.QtGui import QColor
 from qgis.core import Qgis
 from qgis.core import QgsFeature, QgsWkbTypes, QgsVectorLayer, QgsProject
-from qgis.core import QgsFeatureRequest
+from qgis.core import QgsApplication, QgsExpression, QgsFeatureRequest
 from qgis.gui import QgsMapToolPan
 from qgis.gui import QgsRubberBand
 from qgis.utils import OverrideCursor, iface
 
+from .brdrq_adaptive_sweep import enable_adaptive_sweep
+from .brdrq_align_task import AlignTask
+from .brdrq_cost_model import (
+    CostModel,
+    count_reference_vertices,
+    count_vertices,
+    get_search_area,
+)
 from .brdrq_dockwidget_aligner import brdrQDockWidgetAligner
+from .brdrq_feature_table import FeatureTableModel
+from .brdrq_prediction_cache import (
+    PredictionCache,
+    estimate_results_size,
+    get_fingerprint,
+)
+from .brdrq_reference_cache import CachedReferenceLoader, SessionReferenceCache
+from .brdrq_reference_index import LocalReferenceIndex
 from .brdrq_utils import (
     SelectTool,
-    featurecollection_to_layer,
+    featurecollection_to_scrub_layers,
     GRB_TYPES,
     ADPF_VERSIONS,
     geom_qgis_to_shapely,
@@ -58,7 +76,6 @@ from .brdrq_utils import (
     PREFIX_LOCAL_LAYER,
     geom_shapely_to_qgis,
     zoom_to_features,
-    BRDRQ_ORIGINAL_WKT_FIELDNAME,
     BRDRQ_STATE_FIELDNAME,
     get_original_geometry,
     PolygonSelectTool,
@@ -79,12 +96,12 @@ from .qt_compat import (
     map_layer_filter_point,
     map_layer_filter_polygon,
     qt_align_left,
+    qt_ascending_order,
     qt_frame_no_frame,
     qt_header_fixed,
     qt_header_interactive,
     qt_header_resize_to_contents,
     qt_header_stretch,
-    qt_item_is_editable,
     qt_item_view_no_edit_triggers,
     qt_item_view_scroll_per_pixel,
     qt_item_view_select_rows,
@@ -106,6 +123,10 @@ FORM_CLASS, _ = uic.loadUiType(
 
 SELECTION_ALL = "ALL"
 SELECTION_SELECTED = "SELECTED"
+# speculative precomputation of the next features: at most half of the CPUs, at low
+# priority (QgsTask-priorities: higher value = higher priority)
+PREFETCH_MAX_TASKS = max(1, (os.cpu_count() or 2) // 2)
+PREFETCH_PRIORITY = -1
 
 
 class brdrQDockWidgetFeatureAligner(
@@ -117,6 +138,8 @@ class brdrQDockWidgetFeatureAligner(
         """Constructor."""
         print("init brdrQDockWidgetFeatureAligner")
         brdrQDockWidgetAligner.__init__(self, brdrqplugin)
+        self.scrub_layers = []
+        self.preview_layers = {}  # preview-layers of the session {layername: ScrubLayer}
         super(brdrQDockWidgetFeatureAligner, self).__init__(parent)
         # Set up the user interface from Designer.
         # After setupUI you can access any designer object by doing
@@ -141,8 +164,32 @@ class brdrQDockWidgetFeatureAligner(
             button.setIcon(QgsApplication.getThemeIcon(icon_name))
             # button.setIconSize(QtCore.QSize(18, 18))
 
-        self.max_listed_features = 1000
-        self._features_by_id = {}
+        # in-memory reference features of the session (on-the-fly references)
+        self.session_reference_cache = SessionReferenceCache()
+        # STRtree of the local reference layer
+        self.local_reference_index = None
+        self._align_task = None  # alignment of the active feature (QgsTask)
+        self._align_tasks = set()  # references to the running tasks
+        # predictions of visited features (LRU, bounded by memory)
+        self.prediction_cache = PredictionCache()
+        self._prediction_cache_layer = None
+        # precomputation of the next features in the table
+        self._active_row = -1
+        self._prefetch_queue = []  # feature ids
+        self._prefetch_tasks = {}  # cache_key: AlignTask
+        # estimated calculation time (step of the relevant distances), calibrated with
+        # the timings on this machine
+        self.cost_model = CostModel.from_json(
+            read_setting(
+                self.settingsDialog.prefix, "cost_model_samples", "[]", scope="global"
+            )
+        )
+        self._cost_model_changed = False  # samples not yet written to the settings
+        self._listed_feature_ids = []
+        self._total_features_for_selection = 0
+        self.featureTableModel = FeatureTableModel(
+            state_color=self._state_color_for_value, parent=self
+        )
         self._frozenFeaturesView = None
         self._use_frozen_feature_columns = False
         self._current_feature_selection = SELECTION_ALL
@@ -239,8 +286,7 @@ class brdrQDockWidgetFeatureAligner(
         del spinbox_blocker
         self.labelFeatures.setText("Features:")
         # Clear the featurelist widget
-        self.tableFeatures.clearContents()
-        self.tableFeatures.setRowCount(0)
+        self.featureTableModel.clear()
         self.tableFeatures.scrollToTop()
         # Clear predictions table
         self.tablePredictions.clearContents()
@@ -250,6 +296,8 @@ class brdrQDockWidgetFeatureAligner(
         if not self._is_closing and not self._app_is_closing:
             remove_group_layer(self.GROUP_LAYER)
         self.feature = None
+        self.scrub_layers = []
+        self.preview_layers = {}
 
     def _install_scrollable_contents(self):
         """
@@ -335,6 +383,8 @@ class brdrQDockWidgetFeatureAligner(
         self._setup_predictions_table()
 
     def _setup_feature_table(self):
+        # virtual model: the attributes are fetched lazily in pages from the provider
+        self.tableFeatures.setModel(self.featureTableModel)
         self.tableFeatures.setSelectionBehavior(qt_item_view_select_rows())
         self.tableFeatures.setSelectionMode(qt_item_view_single_selection())
         self.tableFeatures.setEditTriggers(qt_item_view_no_edit_triggers())
@@ -344,12 +394,14 @@ class brdrQDockWidgetFeatureAligner(
         self.tableFeatures.setVerticalScrollMode(
             qt_item_view_scroll_per_pixel()
         )
+        self.tableFeatures.horizontalHeader().setSortIndicator(0, qt_ascending_order())
         self.tableFeatures.setSortingEnabled(True)
         self.tableFeatures.verticalHeader().setVisible(False)
         self.lineEditFeatureFilter.textChanged.connect(self._onFeatureFilterTextChanged)
 
         self._frozenFeaturesView = QtWidgets.QTableView(self.tableFeatures)
         self._frozenFeaturesView.setFocusPolicy(qt_no_focus())
+        self._frozenFeaturesView.setModel(self.featureTableModel)
         self._frozenFeaturesView.setSelectionModel(self.tableFeatures.selectionModel())
         self._frozenFeaturesView.verticalHeader().hide()
         self._frozenFeaturesView.setHorizontalScrollBarPolicy(qt_scrollbar_always_off())
@@ -473,7 +525,7 @@ class brdrQDockWidgetFeatureAligner(
 
     def _update_features_counter_from_table(self):
         total = getattr(self, "_total_features_for_selection", 0)
-        listed = self.tableFeatures.rowCount()
+        listed = self.featureTableModel.rowCount()
         self.labelFeatures.setText(f"Features: ({listed}/{total})")
 
     def _feature_matches_filter(self, feature, filter_text):
@@ -528,106 +580,88 @@ class brdrQDockWidgetFeatureAligner(
         self._search_field_indices = selected
         self._search_field_names = [field_names[i] for i in selected]
 
-    def _state_filtered_features(self, state_value, filter_text):
-        request = QgsFeatureRequest()
+    def _matching_feature_ids(self, request, filter_text):
+        """
+        Ids of the features of the request that match the filter text
+        """
         request.setFlags(QgsFeatureRequest.NoGeometry)
-        listed_features = []
+        if self._search_field_indices:
+            request.setSubsetOfAttributes(self._search_field_indices)
+        return [
+            feature.id()
+            for feature in self.layer.getFeatures(request)
+            if self._feature_matches_filter(feature, filter_text)
+        ]
+
+    def _state_filtered_feature_ids(self, state_value, filter_text):
+        if self.layer.fields().indexOf(BRDRQ_STATE_FIELDNAME) < 0:
+            return [], 0
+        request = QgsFeatureRequest()
+        request.setFilterExpression(
+            f"{QgsExpression.quotedColumnRef(BRDRQ_STATE_FIELDNAME)} = "
+            f"{QgsExpression.quotedValue(state_value)}"
+        )
+        if not filter_text:
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            request.setSubsetOfAttributes([])
+            feature_ids = [feature.id() for feature in self.layer.getFeatures(request)]
+            return feature_ids, len(feature_ids)
         total_state_features = 0
-        total_matches = 0
-        ix_state = self.layer.fields().indexOf(BRDRQ_STATE_FIELDNAME)
-        if ix_state < 0:
-            return listed_features, 0
+        feature_ids = []
+        request.setFlags(QgsFeatureRequest.NoGeometry)
         for feature in self.layer.getFeatures(request):
-            attrs = feature.attributes()
-            if ix_state < 0 or attrs[ix_state] != state_value:
-                continue
             total_state_features += 1
             if self._feature_matches_filter(feature, filter_text):
-                total_matches += 1
-                if len(listed_features) < self.max_listed_features:
-                    listed_features.append(feature)
-        if filter_text:
-            return listed_features, total_matches
-        return listed_features, total_state_features
+                feature_ids.append(feature.id())
+        return feature_ids, total_state_features
 
     def _refresh_feature_rows_from_source(self, filter_text=""):
         if self.layer is None:
             return
         selection = self._current_feature_selection
         input_features = self._current_feature_input_features
-        listed_features = []
+        feature_ids = []
         total_for_counter = 0
-        max_listed_features = getattr(self, "max_listed_features", 1000)
         filter_text = (filter_text or "").strip()
         if input_features is not None:
-            total_input = len(input_features)
-            matched = [
-                feature
+            total_for_counter = len(input_features)
+            feature_ids = [
+                feature.id()
                 for feature in input_features
                 if self._feature_matches_filter(feature, filter_text)
             ]
+        elif selection is None or selection == SELECTION_ALL:
+            total_for_counter = self.layer.featureCount()
             if filter_text:
-                listed_features = matched[:max_listed_features]
-                total_for_counter = len(matched)
+                feature_ids = self._matching_feature_ids(
+                    QgsFeatureRequest(), filter_text
+                )
             else:
-                listed_features = list(input_features[:max_listed_features])
-                total_for_counter = total_input
-        elif selection is None or selection == SELECTION_ALL:
-            total_input = self.layer.featureCount()
-            request = QgsFeatureRequest()
-            request.setFlags(QgsFeatureRequest.NoGeometry)
-            matches = 0
-            for feature in self.layer.getFeatures(request):
-                if filter_text and not self._feature_matches_filter(feature, filter_text):
-                    continue
-                matches += 1
-                if len(listed_features) < max_listed_features:
-                    listed_features.append(feature)
-                if not filter_text and len(listed_features) >= max_listed_features:
-                    break
-            total_for_counter = matches if filter_text else total_input
+                feature_ids = list(self.layer.allFeatureIds())
         elif selection == SELECTION_SELECTED:
             selected_ids = self.layer.selectedFeatureIds()
-            total_input = len(selected_ids)
+            total_for_counter = len(selected_ids)
             if filter_text:
-                request = QgsFeatureRequest().setFilterFids(selected_ids)
-                request.setFlags(QgsFeatureRequest.NoGeometry)
-                matches = 0
-                for feature in self.layer.getFeatures(request):
-                    if not self._feature_matches_filter(feature, filter_text):
-                        continue
-                    matches += 1
-                    if len(listed_features) < max_listed_features:
-                        listed_features.append(feature)
-                total_for_counter = matches
+                feature_ids = self._matching_feature_ids(
+                    QgsFeatureRequest().setFilterFids(selected_ids), filter_text
+                )
             else:
-                listed_ids = selected_ids[:max_listed_features]
-                request = QgsFeatureRequest().setFilterFids(listed_ids)
-                request.setFlags(QgsFeatureRequest.NoGeometry)
-                listed_features = list(self.layer.getFeatures(request))
-                total_for_counter = total_input
+                feature_ids = list(selected_ids)
         elif selection in [str(e.value) for e in BrdrQState]:
-            listed_features, total_for_counter = self._state_filtered_features(
+            feature_ids, total_for_counter = self._state_filtered_feature_ids(
                 selection, filter_text
             )
 
-        self.listed_features = listed_features
+        self._listed_feature_ids = feature_ids
         self._total_features_for_selection = total_for_counter
-        self._features_by_id = {str(f.id()): f for f in listed_features}
         self.updateTextListWidgetItems()
         self._update_features_counter_from_table()
-        listed_count = len(listed_features)
-        if total_for_counter > max_listed_features:
-            self._set_user_feedback(
-                f"#Features listed: {listed_count} / {total_for_counter} (first {max_listed_features})"
-            )
-        else:
-            self._set_user_feedback(
-                f"#Features listed: {listed_count} / {total_for_counter}"
-            )
+        self._set_user_feedback(
+            f"#Features listed: {len(feature_ids)} / {total_for_counter}"
+        )
 
     def _refresh_frozen_columns(self, *_args):
-        if self._frozenFeaturesView is None or self.tableFeatures.columnCount() < 2:
+        if self._frozenFeaturesView is None or self.featureTableModel.columnCount() < 2:
             return
         if not self._use_frozen_feature_columns:
             self.tableFeatures.setColumnHidden(0, False)
@@ -636,7 +670,7 @@ class brdrQDockWidgetFeatureAligner(
             return
         self._frozenFeaturesView.setModel(self.tableFeatures.model())
         self._frozenFeaturesView.setSelectionModel(self.tableFeatures.selectionModel())
-        for col in range(self.tableFeatures.columnCount()):
+        for col in range(self.featureTableModel.columnCount()):
             hide = col > 1
             self._frozenFeaturesView.setColumnHidden(col, hide)
         self.tableFeatures.setColumnHidden(0, True)
@@ -697,10 +731,10 @@ class brdrQDockWidgetFeatureAligner(
 
         self.mMapLayerComboBox.layerChanged.connect(self.themeLayerChanged)
         # Primary activation trigger: selection change (works reliably with frozen columns).
-        self.tableFeatures.itemSelectionChanged.connect(
+        self.tableFeatures.selectionModel().selectionChanged.connect(
             self.onFeatureSelectionChanged
         )
-        self.tableFeatures.cellClicked.connect(self.onFeatureRowClicked)
+        self.tableFeatures.clicked.connect(self.onFeatureIndexClicked)
         self.tablePredictions.itemSelectionChanged.connect(
             self.onPredictionSelectionChanged
         )
@@ -803,12 +837,20 @@ class brdrQDockWidgetFeatureAligner(
             self._featureFilterTimer.stop()
         except Exception:
             pass
+        self._cancel_align_task()
+        self._cancel_prefetch()
+        self._save_cost_model()
+        self._connect_prediction_cache(None)
+        self.prediction_cache.clear()
+        if self.local_reference_index is not None:
+            self.local_reference_index.disconnect()
+            self.local_reference_index = None
         # Disconnect active signals to avoid callbacks while QGIS is shutting down.
         for signal_obj, handler in (
             (self.mMapLayerComboBox.layerChanged, self.themeLayerChanged),
             (self.comboBox_selectfeatures.currentIndexChanged, self.on_selectfeatures_changed),
-            (self.tableFeatures.itemSelectionChanged, self.onFeatureSelectionChanged),
-            (self.tableFeatures.cellClicked, self.onFeatureRowClicked),
+            (self.tableFeatures.selectionModel().selectionChanged, self.onFeatureSelectionChanged),
+            (self.tableFeatures.clicked, self.onFeatureIndexClicked),
             (self.tablePredictions.itemSelectionChanged, self.onPredictionSelectionChanged),
             (self.tablePredictions.cellClicked, self.onPredictionRowClicked),
             (self.lineEditFeatureFilter.textChanged, self._onFeatureFilterTextChanged),
@@ -989,6 +1031,8 @@ class brdrQDockWidgetFeatureAligner(
                 self._theme_layer_id = None
                 self.mMapLayerComboBox.setLayer(self.layer)
                 return
+            self._cancel_prefetch()
+            self._connect_prediction_cache(self.layer)
             # Write the layer_id to the settings
             write_setting(self.settingsDialog.prefix, "theme_layer", self.layer.id())
             self._update_search_field_selection()
@@ -1011,7 +1055,7 @@ class brdrQDockWidgetFeatureAligner(
             list(features) if features is not None else None
         )
         self._refresh_feature_rows_from_source(self.lineEditFeatureFilter.text())
-        if len(self.listed_features) == 1:
+        if self.featureTableModel.rowCount() == 1:
             blocker = QSignalBlocker(self.tableFeatures)
             selection_blocker = None
             selection_model = self.tableFeatures.selectionModel()
@@ -1037,55 +1081,25 @@ class brdrQDockWidgetFeatureAligner(
                 if str(name).lower() == str(BRDRQ_STATE_FIELDNAME).lower():
                     state_field_name = name
                     break
-            ix = self.layer.fields().indexOf(state_field_name) if state_field_name else -1
-            remaining_field_names = [
-                n
-                for n in field_names
-                if state_field_name is None or str(n).lower() != str(state_field_name).lower()
-            ]
-            state_header = state_field_name if state_field_name else BRDRQ_STATE_FIELDNAME
-            headers = ["ID", state_header] + remaining_field_names
-            self.tableFeatures.setSortingEnabled(False)
-            self.tableFeatures.clearContents()
-            self.tableFeatures.setColumnCount(len(headers))
-            self.tableFeatures.setHorizontalHeaderLabels(headers)
-            self.tableFeatures.setRowCount(len(self.listed_features))
+            self.featureTableModel.set_source(
+                self.layer,
+                self._listed_feature_ids,
+                state_field_name,
+                BRDRQ_STATE_FIELDNAME,
+            )
             self.tableFeatures.horizontalHeader().setStretchLastSection(False)
-            for i in range(len(self.listed_features)):
-                feature_id = self.listed_features[i].id()
-                feature = self.layer.getFeature(feature_id)
-                attributes = feature.attributes()
-                if ix >= 0:
-                    state = attributes[ix]
-                else:
-                    state = ""
-                attributes_by_name = {
-                    name: attributes[pos] for pos, name in enumerate(field_names)
-                }
-                row_values = [
-                    feature.id(),
-                    state,
-                ] + [attributes_by_name.get(name) for name in remaining_field_names]
-                for col, value in enumerate(row_values):
-                    table_item = QtWidgets.QTableWidgetItem("" if value is None else str(value))
-                    table_item.setFlags(table_item.flags() & ~qt_item_is_editable())
-                    if col == 0:
-                        table_item.setData(qt_user_role(), str(feature.id()))
-                    if ix >= 0:
-                        table_item.setBackground(self._state_color_for_value(str(state)))
-                    self.tableFeatures.setItem(i, col, table_item)
             # Keep ID/brdrq_state readable and attrs scrollable
             self.tableFeatures.setColumnWidth(0, 90)
             self.tableFeatures.setColumnWidth(1, 120)
+            # width of the attribute columns from the header (not from all rows, that
+            # are fetched lazily)
             max_attr_column_width = 320
-            for col in range(2, self.tableFeatures.columnCount()):
-                self.tableFeatures.horizontalHeader().setSectionResizeMode(
-                    col, qt_header_interactive()
-                )
-                desired_width = self.tableFeatures.sizeHintForColumn(col) + 16
+            header = self.tableFeatures.horizontalHeader()
+            for col in range(2, self.featureTableModel.columnCount()):
+                header.setSectionResizeMode(col, qt_header_interactive())
+                desired_width = header.sectionSizeHint(col) + 16
                 clamped_width = max(120, min(desired_width, max_attr_column_width))
                 self.tableFeatures.setColumnWidth(col, clamped_width)
-            self.tableFeatures.setSortingEnabled(True)
             self.tableFeatures.clearSelection()
             self._refresh_frozen_columns()
             self._update_features_counter_from_table()
@@ -1118,12 +1132,12 @@ class brdrQDockWidgetFeatureAligner(
             return color
         return QColor(245, 245, 245, 0)
 
-    def onFeatureSelectionChanged(self):
+    def onFeatureSelectionChanged(self, *_args):
         if self._is_closing:
             return
         if self._suppress_feature_activation:
             return
-        row = self.tableFeatures.currentRow()
+        row = self.tableFeatures.currentIndex().row()
         if row < 0:
             self._last_selected_feature_row = -1
             return
@@ -1148,8 +1162,8 @@ class brdrQDockWidgetFeatureAligner(
         print("onFeatureActivated")
         if selected_row is None or selected_row < 0:
             return
-        id_item = self.tableFeatures.item(selected_row, 0)
-        current_feature_id = None if id_item is None else str(id_item.data(qt_user_role()))
+        feature_id = self.featureTableModel.feature_id(selected_row)
+        current_feature_id = None if feature_id is None else str(feature_id)
         now = time.monotonic()
         # Hard dedupe for duplicate selection-chain emits on the same feature.
         # Keeps explicit re-click behavior (source="click") intact.
@@ -1169,7 +1183,6 @@ class brdrQDockWidgetFeatureAligner(
         if selected_row is not None and selected_row >= 0:
             self._last_selected_feature_row = selected_row
         if source_auto and self.layer is not None and selected_row is not None and selected_row >= 0:
-            feature_id = None if id_item is None else id_item.data(qt_user_role())
             auto_key = (self.layer.id(), str(feature_id))
             if (
                 auto_key == self._last_auto_activation_key and
@@ -1191,12 +1204,14 @@ class brdrQDockWidgetFeatureAligner(
         try:
             with OverrideCursor(qt_wait_cursor()):
                 self._onFeatureChange(selected_row)
-            self.progressBar.setValue(100)
             if source == "selection":
                 self._consume_next_click_row = selected_row
         finally:
             self._feature_activation_in_progress = False
 
+    def onFeatureIndexClicked(self, index):
+        self.onFeatureRowClicked(index.row(), index.column())
+
     def onFeatureRowClicked(self, row, _column):
         if self._is_closing or self._suppress_feature_activation or row is None or row < 0:
             return
@@ -1242,16 +1257,167 @@ class brdrQDockWidgetFeatureAligner(
             return
         self.onFeatureActivated(row, source_auto=source_auto, source=source)
 
+    def _get_step(self, geometry):
+        """
+        Returns the step (cm) of the relevant distances for a feature with this
+        (original) geometry, and a message for the user (or None). The step is None when
+        the calculation is blocked.
+        A feature with an area above max_area_limit is always blocked. Otherwise the
+        step is chosen by the cost model when it is calibrated, or on the area of the
+        feature and the maximum relevant distance.
+        """
+        area = geometry.area()
+        if area > self.max_area_limit:
+            msg = f"Very big area, {str(area)} mÂ²: The calculation is blocked. Please use the bulk tool for this feature"
+            return None, msg
+        cost_model_step = self._get_cost_model_step(geometry)
+        if cost_model_step is not None:
+            return cost_model_step
+        max_rel_dist = self.settingsDialog.max_rel_dist
+        step = self.settingsDialog.small_step
+        msg = None
+        if area > self.max_area_optimization:
+            big_step = self.settingsDialog.big_step
+            msg = f"Warning - Big area, {str(area)} mÂ²: the calculation will be adapted/optimized. Predictions will be based on steps of {str(big_step)} cm"
+            step = big_step
+        if max_rel_dist > 2 * self.max_rel_dist_optimization:
+            big_step = self.settingsDialog.big_step
+            msg = f"Predictions will be based on steps of {str(big_step)} cm"
+            step = big_step
+        elif max_rel_dist > self.max_rel_dist_optimization:
+            mid_step = self.settingsDialog.mid_step
+            msg = f"Predictions will be based on steps of {str(mid_step)} cm"
+            step = mid_step
+        return step, msg
+
+    def _get_cost_model_step(self, geometry):
+        """
+        Returns (step, message) with the densest step that keeps the estimated
+        calculation time below the target latency, or None when the cost model can not
+        be used (not calibrated, or unknown reference density)
+        """
+        if not self.cost_model.is_calibrated():
+            return None
+        geom_shapely = geom_qgis_to_shapely(geometry)
+        if geom_shapely is None or geom_shapely.is_empty:
+            return None
+        distance = self.settingsDialog.maximum / 100
+        if (
+            self.local_reference_index is not None and
+            self.local_reference_index.matches(self.reference_layer, self.reference_id)
+        ):
+            reference_vertices = count_vertices(
+                self.local_reference_index.query(geom_shapely, distance).values()
+            )
+        else:
+            reference_vertices = self.cost_model.estimate_reference_vertices(
+                str(self.reference_choice), get_search_area(geom_shapely, distance)
+            )
+        small_step = self.settingsDialog.small_step
+        candidates = [
+            (step, len(self._get_relevant_distances(step)))
+            for step in sorted(
+                {small_step, self.settingsDialog.mid_step, self.settingsDialog.big_step}
+            )
+        ]
+        step, estimate = self.cost_model.choose_step(
+            candidates,
+            count_vertices([geom_shapely]),
+            reference_vertices,
+            target_latency=self.target_latency,
+            max_latency=self.max_latency,
+        )
+        if estimate is None:
+            return None
+        if step is None:
+            msg = f"Estimated calculation time {estimate:.0f} s: The calculation is blocked. Please use the bulk tool for this feature"
+        elif step != small_step:
+            msg = f"Estimated calculation time {estimate:.1f} s: Predictions will be based on steps of {str(step)} cm"
+        else:
+            msg = None
+        return step, msg
+
+    def _record_cost_sample(self, task):
+        """
+        Adds the timing of a finished alignment to the cost model (calibration). Only
+        the timings of foreground alignments without adaptive sweep are recorded: the
+        precomputations run next to the foreground alignment, and the evaluation time
+        of an adaptive sweep does not follow the number of relevant distances.
+        """
+        if task is not self._align_task or task.adaptive_sweep:
+            return
+        if task.evaluation_time is None or not task.relevant_distances:
+            return
+        thematic_geometries = [
+            f.geometry for f in task.aligner.thematic_data.features.values()
+        ]
+        if len(thematic_geometries) != 1 or thematic_geometries[0] is None:
+            return
+        geometry = thematic_geometries[0]
+        distance = max(task.relevant_distances)
+        reference_geometries = [
+            f.geometry for f in task.aligner.reference_data.features.values()
+        ]
+        self.cost_model.add_sample(
+            count_vertices(thematic_geometries),
+            count_reference_vertices(geometry, reference_geometries, distance),
+            len(task.relevant_distances),
+            task.evaluation_time,
+            reference=str(self.reference_choice),
+            search_area=get_search_area(geometry, distance),
+        )
+        self._cost_model_changed = True
+
+    def _save_cost_model(self):
+        """
+        Writes the samples of the cost model to the settings (when the dock is closed)
+        """
+        if not self._cost_model_changed:
+            return
+        # the calibration is machine-specific: not stored in the project
+        write_setting(
+            self.settingsDialog.prefix,
+            "cost_model_samples",
+            self.cost_model.to_json(),
+            scope="global",
+        )
+        self._cost_model_changed = False
+
+    def _get_relevant_distances(self, step):
+        """
+        Relevant distances (m) for a step (cm), like the settings calculate them
+        """
+        return [
+            round(k, self.settingsDialog.DECIMAL)
+            for k in np.arange(
+                self.settingsDialog.minimum,
+                self.settingsDialog.maximum + step,
+                step,
+                dtype=int,
+            )
+            / 100
+        ]
+
     def _onFeatureChange(self, selected_row):
         if self._is_closing:
             return
         print("_onFeatureChange")
         self.feature = None
+        # a running alignment of the previous feature is superseded; running
+        # precomputations can still be taken over by the new feature
+        self._cancel_align_task()
+        self._prefetch_queue = []
+        self._active_row = selected_row
+        self.aligner = None
+        self.aligner_result = None
+        self.dict_processresults = None
+        self.scrub_layers = []
+        self.dict_evaluated_predictions = None
+        self.diffs_dict = None
         if selected_row is None or selected_row < 0:
             print("selected_row is none")
             return
-        id_item = self.tableFeatures.item(selected_row, 0)
-        feature_id = None if id_item is None else id_item.data(qt_user_role())
+        feature_id = self.featureTableModel.feature_id(selected_row)
         if feature_id is None:
             self._set_user_feedback(f"No feature found at row {selected_row}")
             return
@@ -1260,43 +1426,22 @@ class brdrQDockWidgetFeatureAligner(
             self._set_user_feedback(f"No feature found for ID {feature_id}")
             return
 
-        original_geometry = get_original_geometry(
-            self.feature, BRDRQ_ORIGINAL_WKT_FIELDNAME
-        )
+        original_geometry = get_original_geometry(self.feature)
         if original_geometry is None:
             original_geometry = self.feature.geometry()
 
         zoom_to_features([self.feature], self.iface, features_crs=self.crs)
-        key = self.feature.id()
 
         # Check feature on area
         # check area of feature and optimize/block calculation
-        area = original_geometry.area()
-        max_rel_dist = self.settingsDialog.max_rel_dist
-        step = self.settingsDialog.small_step
-        if area > self.max_area_optimization:
-            if area > self.max_area_limit:
-                msg = f"Very big area, {str(area)} mÂ²: The calculation is blocked. Please use the bulk tool for this feature"
-                self._set_user_feedback(f"{msg}")
-                self.doubleSpinBox.setValue(0)
-                self.tablePredictions.clearContents()
-                self.tablePredictions.setRowCount(0)
-                return
-            else:
-                big_step = self.settingsDialog.big_step
-                msg = f"Warning - Big area, {str(area)} mÂ²: the calculation will be adapted/optimized. Predictions will be based on steps of {str(big_step)} cm"
-                self._set_user_feedback(f"{msg}")
-                step = big_step
-        if max_rel_dist > 2 * self.max_rel_dist_optimization:
-            big_step = self.settingsDialog.big_step
-            msg = f"Predictions will be based on steps of {str(big_step)} cm"
-            self._set_user_feedback(f"{msg}")
-            step = big_step
-        elif max_rel_dist > self.max_rel_dist_optimization:
-            mid_step = self.settingsDialog.mid_step
-            msg = f"Predictions will be based on steps of {str(mid_step)} cm"
+        step, msg = self._get_step(original_geometry)
+        if msg is not None:
             self._set_user_feedback(f"{msg}")
-            step = mid_step
+        if step is None:
+            self.doubleSpinBox.setValue(0)
+            self.tablePredictions.clearContents()
+            self.tablePredictions.setRowCount(0)
+            return
 
         # adapt & reload settings (espacially relevant_distances) before alignment
         self.settingsDialog.step = step
@@ -1307,12 +1452,15 @@ class brdrQDockWidgetFeatureAligner(
         self.tablePredictions.setSortingEnabled(False)
         self.tablePredictions.clearContents()
         self.tablePredictions.setRowCount(0)
-        # do alignment/prediction
+        # do alignment/prediction (in a background task); the predictions are shown
+        # when the task is finished
         align = self._align()
         if self._is_closing or align is None:
             self.tablePredictions.setSortingEnabled(True)
-            return
+        return
 
+    def _show_predictions(self, key):
+        self.tablePredictions.setSortingEnabled(False)
         self.add_results_to_grouplayer()
         if self._is_closing:
             self.tablePredictions.setSortingEnabled(True)
@@ -1388,46 +1536,42 @@ class brdrQDockWidgetFeatureAligner(
             result_type=AlignerResultType.PROCESSRESULTS,
             add_metadata=self.metadata,
         )
-        result_diff = "result_diff"
-        geojson_result_diff = fcs[result_diff]
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF,
-            geojson_result_diff,
-            result_diff,
-            False,
-            self.GROUP_LAYER,
-            self.tempfolder,
-        )
-        result_diff_plus = "result_diff_plus"
-        geojson_result_diff_plus = fcs[result_diff_plus]
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF_PLUS,
-            geojson_result_diff_plus,
-            result_diff_plus,
-            True,
-            self.GROUP_LAYER,
-            self.tempfolder,
-        )
-        result_diff_min = "result_diff_min"
-        geojson_result_diff_min = fcs[result_diff_min]
-        featurecollection_to_layer(
-            self.LAYER_RESULT_DIFF_MIN,
-            geojson_result_diff_min,
-            result_diff_min,
-            True,
-            self.GROUP_LAYER,
-            self.tempfolder,
-        )
-        result = "result"
-        geojson_result = fcs[result]
-        featurecollection_to_layer(
-            self.LAYER_RESULT,
-            geojson_result,
-            result,
-            True,
-            self.GROUP_LAYER,
-            self.tempfolder,
-        )
+        # memory-layers with the results of all relevant distances, to scrub through
+        # the distances without requerying the layers (see setFilterOnLayers). The
+        # layers are created once per session and reused for each feature.
+        self.scrub_layers = []
+        for name, result_type, visible in (
+            (self.LAYER_RESULT_DIFF, "result_diff", False),
+            (self.LAYER_RESULT_DIFF_PLUS, "result_diff_plus", True),
+            (self.LAYER_RESULT_DIFF_MIN, "result_diff_min", True),
+            (self.LAYER_RESULT, "result", True),
+        ):
+            self.scrub_layers.extend(
+                featurecollection_to_scrub_layers(
+                    name,
+                    fcs[result_type],
+                    self.aligner.crs,
+                    result_type,
+                    visible,
+                    self.GROUP_LAYER,
+                    self.settingsDialog.DECIMAL,
+                    self.preview_layers,
+                )
+            )
+        # empty the session layers without results for this feature
+        for scrub_layer in self.preview_layers.values():
+            if scrub_layer not in self.scrub_layers and scrub_layer.is_in_project():
+                scrub_layer.set_features({})
+        return
+
+    def setFilterOnLayers(self, value):
+        value = round(float(value), self.settingsDialog.DECIMAL)
+        shown = [layer.show_distance(value) for layer in self.scrub_layers]
+        if not all(shown):
+            # a result layer is removed from the project: rebuild the layers
+            self.add_results_to_grouplayer()
+            for layer in self.scrub_layers:
+                layer.show_distance(value)
         return
 
     def onPredictionSelectionChanged(self):
@@ -1485,30 +1629,87 @@ class brdrQDockWidgetFeatureAligner(
             return None
         print("_align")
         feat = self.feature
-        selected_features = []
-        if feat is not None:
-            selected_features.append(feat)
-        if len(selected_features) == 0:
+        if feat is None:
             self._set_user_feedback(
                 "No features selected. Please select a feature from the active layer."
             )
             return None
 
-        dict_to_load = {}
-
         self.progressBar.setValue(0)
-        for feature in selected_features:
-            original_geometry = get_original_geometry(
-                feature, BRDRQ_ORIGINAL_WKT_FIELDNAME
+        prepared = self._prepare_alignment(feat, self.relevant_distances)
+        if prepared is None or self._is_closing:
+            return None
+        aligner, reference_loader, cache_key = prepared
+        self.progressBar.setValue(25)
+
+        # Predictions of a revisited feature (with the same geometry and settings)
+        # are taken from the prediction cache
+        entry = self.prediction_cache.get(cache_key)
+        if entry is not None:
+            print("predictions from cache")
+            self._apply_align_results(feat.id(), *entry)
+            return entry
+
+        # A feature that is being precomputed takes over the running task
+        task = self._prefetch_tasks.pop(cache_key, None)
+        if task is None:
+            # Reference download & evaluation in a background task; the results are
+            # handled in _onAlignTaskFinished (main thread)
+            task = self._create_align_task(
+                aligner,
+                feat.id(),
+                self.relevant_distances,
+                reference_loader,
+                cache_key,
+                f"brdrQ - align feature {feat.id()}",
             )
-            if original_geometry is None:
-                original_geometry = feature.geometry()
-            if original_geometry is None:
-                print("feature without geometry")
-                continue
-            geom_shapely = geom_qgis_to_shapely(original_geometry)
+            QgsApplication.taskManager().addTask(task)
+        self._align_task = task
+        return task
+
+    def _create_align_task(
+        self,
+        aligner,
+        feature_id,
+        relevant_distances,
+        reference_loader,
+        cache_key,
+        description,
+    ):
+        task = AlignTask(
+            description,
+            aligner,
+            feature_id,
+            relevant_distances,
+            self.full_strategy,
+            reference_loader=reference_loader,
+            max_predictions=4,
+            on_finished=self._onAlignTaskFinished,
+        )
+        task.cache_key = cache_key
+        task.adaptive_sweep = self.adaptive_sweep
+        task.progressChanged.connect(
+            lambda progress, task=task: self._onAlignTaskProgress(task, progress)
+        )
+        self._align_tasks.add(task)
+        return task
 
-            dict_to_load[feature.id()] = geom_shapely
+    def _prepare_alignment(self, feat, relevant_distances, quiet=False):
+        """
+        Prepares the alignment of a feature (in the main thread): aligner with the
+        thematic data, the reference loader (on-the-fly references) or the loaded local
+        reference, and the key for the prediction cache.
+        Returns (aligner, reference_loader, cache_key), or None when the feature can not
+        be aligned. When quiet, no warnings are shown (precomputation).
+        """
+        warn = self._show_warning if not quiet else lambda *args, **kwargs: None
+        original_geometry = get_original_geometry(feat)
+        if original_geometry is None:
+            original_geometry = feat.geometry()
+        if original_geometry is None:
+            print("feature without geometry")
+            return None
+        dict_to_load = {feat.id(): geom_qgis_to_shapely(original_geometry)}
 
         processor_config = ProcessorConfig()
         processor_config.od_strategy = self.od_strategy
@@ -1527,57 +1728,72 @@ class brdrQDockWidgetFeatureAligner(
         aligner_config = AlignerConfig()
         aligner_config.log_metadata = self.metadata
         aligner_config.add_observations = self.metadata
-        self.aligner = Aligner(
+        aligner = Aligner(
             crs=self.crs,
             processor=processor,
             config=aligner_config,
         )
+        if self.adaptive_sweep:
+            enable_adaptive_sweep(aligner)
 
         # Load thematic data
-        self.aligner.load_thematic_data(DictLoader(dict_to_load))
+        aligner.load_thematic_data(DictLoader(dict_to_load))
         if self._is_closing:
             return None
-        self.progressBar.setValue(25)
-        # Load reference data for the on-the fly reference versions
+        # Reference loaders for the on-the fly reference versions (the download itself
+        # is done in the background task)
+        reference_loader = None
         reference_choice_id = DICT_REFERENCE_OPTIONS[self.reference_choice]
         if self.reference_choice in GRB_TYPES:
             try:
-                self.aligner.load_reference_data(
+                reference_loader = CachedReferenceLoader(
                     GRBActualLoader(
                         grb_type=GRBType[reference_choice_id],
                         partition=1000,
-                        aligner=self.aligner,
-                    )
+                        aligner=aligner,
+                    ),
+                    f"GRB_{reference_choice_id}",
+                    session=self.session_reference_cache,
                 )
             except Exception as e:
-                self._show_warning(
+                warn(
                     "CRS",
                     f"Reference layer 'BE - GRB' does not support CRS of current thematic layer: {str(e)}",
                 )
                 return None
         elif self.reference_choice in ADPF_VERSIONS:
             try:
-                self.aligner.load_reference_data(
+                reference_loader = CachedReferenceLoader(
                     GRBFiscalParcelLoader(
-                        year=reference_choice_id, aligner=self.aligner, partition=1000
-                    )
+                        year=reference_choice_id,
+                        aligner=aligner,
+                        partition=1000,
+                    ),
+                    f"ADPF_{reference_choice_id}",
+                    session=self.session_reference_cache,
                 )
             except Exception as e:
-                self._show_warning(
+                warn(
                     "CRS",
                     f"Reference layer 'BE - GRB' does not support CRS of current thematic layer: {str(e)}",
                 )
                 return None
         elif self.reference_choice in OSM_TYPES:
             tags = DICT_OSM_TYPES[self.reference_choice]
-            self.aligner.load_reference_data(
-                OSMLoader(osm_tags=tags, aligner=self.aligner)
+            reference_loader = CachedReferenceLoader(
+                OSMLoader(osm_tags=tags, aligner=aligner),
+                f"OSM_{json.dumps(tags, sort_keys=True)}",
+                session=self.session_reference_cache,
             )
         elif self.reference_choice in BE_TYPES:
             try:
-                self.aligner.load_reference_data(BeCadastralParcelLoader(partition=1000, aligner=self.aligner))
+                reference_loader = CachedReferenceLoader(
+                    BeCadastralParcelLoader(partition=1000, aligner=aligner),
+                    "BE_CADASTRAL_PARCELS",
+                    session=self.session_reference_cache,
+                )
             except Exception as e:
-                self._show_warning(
+                warn(
                     "CRS",
                     f"Reference layer 'BE - Cadastral parcels' does not support CRS of current thematic layer: {str(e)}",
                 )
@@ -1585,9 +1801,15 @@ class brdrQDockWidgetFeatureAligner(
         elif self.reference_choice in NL_TYPES:
             try:
                 brk_type = BRKType[DICT_NL_TYPES[self.reference_choice]]
-                self.aligner.load_reference_data(BRKLoader(brk_type=brk_type, partition=1000, aligner=self.aligner))
+                reference_loader = CachedReferenceLoader(
+                    BRKLoader(
+                        brk_type=brk_type, partition=1000, aligner=aligner
+                    ),
+                    f"NL_{brk_type.name}",
+                    session=self.session_reference_cache,
+                )
             except Exception as e:
-                self._show_warning(
+                warn(
                     "CRS",
                     f"Reference layer 'NL - BRK' does not support CRS of current thematic layer: {str(e)}",
                 )
@@ -1600,13 +1822,13 @@ class brdrQDockWidgetFeatureAligner(
             except:
                 reference_crs = None
             if reference_crs is None or str(reference_crs) == "NULL" or str(reference_crs) == "":
-                self._show_warning(
+                warn(
                     "CRS",
                     "CRS of the local Reference Layer is not defined. Please define a CRS to the REFERENCE Layer with units in meter",
                 )
                 return None
             elif reference_crs != self.crs:
-                self._show_warning(
+                warn(
                     "CRS",
                     "Thematic layer and ReferenceLayer are in a different CRS."
                     "Please provide them in the same CRS, with units in meter (f.e. For Belgium in EPSG:31370 or EPSG:3812)",
@@ -1618,7 +1840,7 @@ class brdrQDockWidgetFeatureAligner(
                 str(self.reference_id) == "" or
                 self.reference_id == -1
             ):
-                self._show_warning(
+                warn(
                     "Reference ID",
                     "Reference ID not selected: "
                     "Please provide the Unique ID-fieldname of the reference layer (SETTINGS)",
@@ -1650,57 +1872,248 @@ class brdrQDockWidgetFeatureAligner(
             #     dict_reference[id_reference] = geom_qgis_to_shapely(feature.geometry())
             # self.reference_layer.removeSelection()
 
-            # 1. calculate extra buffer
+            # Reference features within the search distance of the feature, from the
+            # (persistent) STRtree of the reference layer
             dist = 2 * self.maximum / 100
-            # 2. Get search extent
-            search_geometry = feat.geometry().buffer(dist, 5)
-            search_extent = search_geometry.boundingBox()
-            request = QgsFeatureRequest().setFilterRect(search_extent)
-            dict_reference = {}
-            # Fill dict_reference
-            for ref_feat in self.reference_layer.getFeatures(request):
-                if ref_feat.geometry().distance(feat.geometry()) <= dist:
-                    id_reference = ref_feat.attribute(self.reference_id)
-                    dict_reference[id_reference] = geom_qgis_to_shapely(
-                        ref_feat.geometry()
-                    )
-            self.aligner.load_reference_data(DictLoader(dict_reference))
-            self.aligner.name_reference_id = self.reference_id
-            self.aligner.reference_data.source["source"] = PREFIX_LOCAL_LAYER
-            self.aligner.reference_data.source["source_url"] = PREFIX_LOCAL_LAYER
-            self.aligner.reference_data.source[VERSION_DATE] = "unknown"
-        self.progressBar.setValue(50)
-        if self._is_closing:
-            return None
-
-        self.aligner_result = self.aligner.evaluate(
-            max_predictions=4,
-            relevant_distances=self.relevant_distances,
-            full_reference_strategy=self.full_strategy,
-        )
+            if self.local_reference_index is None or not self.local_reference_index.matches(
+                self.reference_layer, self.reference_id
+            ):
+                if self.local_reference_index is not None:
+                    self.local_reference_index.disconnect()
+                self.local_reference_index = LocalReferenceIndex(
+                    self.reference_layer, self.reference_id
+                )
+                self.prediction_cache.clear()
+            dict_reference = self.local_reference_index.query(
+                geom_qgis_to_shapely(feat.geometry()), dist
+            )
+            aligner.load_reference_data(DictLoader(dict_reference))
+            aligner.name_reference_id = self.reference_id
+            aligner.reference_data.source["source"] = PREFIX_LOCAL_LAYER
+            aligner.reference_data.source["source_url"] = PREFIX_LOCAL_LAYER
+            aligner.reference_data.source[VERSION_DATE] = "unknown"
         if self._is_closing:
             return None
-        # TODO should we add a try/catch, fe when using DieussaertProcessing for non-polygons it will result in error
 
-        self.dict_processresults = self.aligner_result.get_results(aligner=self.aligner)
-        self.dict_evaluated_predictions = self.aligner_result.get_results(
-            aligner=self.aligner, result_type=AlignerResultType.EVALUATED_PREDICTIONS
+        return aligner, reference_loader, self._get_prediction_cache_key(
+            feat.id(), dict_to_load[feat.id()], relevant_distances
         )
 
-        self.diffs_dict = self.aligner.get_difference_metrics_for_thematic_data(
-            self.dict_processresults
-        )
+    def _cancel_align_task(self):
+        """
+        Cancels the running alignment (f.e. when a new feature is activated); its
+        results are ignored when it finishes
+        """
+        if self._align_task is not None:
+            self._align_task.cancel()
+            self._align_task = None
+
+    def _onAlignTaskProgress(self, task, progress):
+        if task is self._align_task and not self._is_closing:
+            self.progressBar.setValue(int(progress))
+
+    def _onAlignTaskFinished(self, task, result):
+        self._align_tasks.discard(task)
+        if self._prefetch_tasks.get(task.cache_key) is task:
+            del self._prefetch_tasks[task.cache_key]
+        if self._is_closing:
+            return
+        entry = None
+        if result:
+            self._record_cost_sample(task)
+            entry = (
+                task.aligner,
+                task.aligner_result,
+                task.dict_processresults,
+                task.dict_evaluated_predictions,
+                task.diffs_dict,
+            )
+            self.prediction_cache.put(
+                task.cache_key,
+                entry,
+                estimate_results_size(task.aligner, task.dict_processresults),
+            )
+        if task is not self._align_task:
+            # precomputed, or superseded by the alignment of another feature
+            self._run_prefetch()
+            return
+        self._align_task = None
+        self.tablePredictions.setSortingEnabled(True)
+        if entry is None:
+            # f.e. when using DieussaertProcessing for non-polygons
+            if task.exception is not None:
+                self._show_warning(
+                    "Alignment", f"Alignment failed: {str(task.exception)}"
+                )
+            self.progressBar.setValue(0)
+            return
+        self._apply_align_results(task.feature_id, *entry)
+
+    def _apply_align_results(
+        self,
+        feature_id,
+        aligner,
+        aligner_result,
+        dict_processresults,
+        dict_evaluated_predictions,
+        diffs_dict,
+    ):
+        self.aligner = aligner
+        self.aligner_result = aligner_result
+        self.dict_processresults = dict_processresults
+        self.dict_evaluated_predictions = dict_evaluated_predictions
+        self.diffs_dict = diffs_dict
 
         output_message = "PREDICTIONS (@ relevant distances): " + str(
-            [str(k) for k in self.dict_evaluated_predictions[feat.id()].keys()]
+            [str(k) for k in self.dict_evaluated_predictions[feature_id].keys()]
         )
         self._set_user_feedback(output_message)
+        with OverrideCursor(qt_wait_cursor()):
+            self._show_predictions(feature_id)
+        self.progressBar.setValue(100)
+        # precompute the next features of the table in the background
+        self._schedule_prefetch(self._active_row)
+
+    def _schedule_prefetch(self, row):
+        """
+        Queues the next (visible) rows of the feature table after the row for
+        precomputation. Running precomputations of features that are not in the queue
+        anymore are cancelled.
+        """
+        self._prefetch_queue = []
+        feature_ids = []
+        if self.layer is not None and row is not None and row >= 0:
+            r = row + 1
+            while (
+                r < self.featureTableModel.rowCount() and
+                len(feature_ids) < (self.prefetch_count or 0)
+            ):
+                feature_id = self.featureTableModel.feature_id(r)
+                if feature_id is not None and not self.tableFeatures.isRowHidden(r):
+                    feature_ids.append(feature_id)
+                r += 1
+        for key, task in list(self._prefetch_tasks.items()):
+            if task.feature_id not in feature_ids:
+                task.cancel()
+                del self._prefetch_tasks[key]
+        self._prefetch_queue = feature_ids
+        self._run_prefetch()
+
+    def _run_prefetch(self):
+        """
+        Starts the precomputation of queued features, with at most PREFETCH_MAX_TASKS
+        running at the same time (at low priority)
+        """
+        while (
+            self._prefetch_queue and
+            len(self._prefetch_tasks) < PREFETCH_MAX_TASKS and
+            not self._is_closing and
+            self.layer is not None
+        ):
+            feature_id = self._prefetch_queue.pop(0)
+            feature = self.layer.getFeature(feature_id)
+            if feature is None or not feature.isValid():
+                continue
+            original_geometry = get_original_geometry(feature)
+            if original_geometry is None:
+                original_geometry = feature.geometry()
+            if original_geometry is None or original_geometry.isEmpty():
+                continue
+            step, _ = self._get_step(original_geometry)
+            if step is None:
+                continue
+            relevant_distances = self._get_relevant_distances(step)
+            prepared = self._prepare_alignment(feature, relevant_distances, quiet=True)
+            if prepared is None:
+                continue
+            aligner, reference_loader, cache_key = prepared
+            if (
+                self.prediction_cache.get(cache_key) is not None or
+                cache_key in self._prefetch_tasks or
+                (self._align_task is not None and self._align_task.cache_key == cache_key)
+            ):
+                continue
+            task = self._create_align_task(
+                aligner,
+                feature_id,
+                relevant_distances,
+                reference_loader,
+                cache_key,
+                f"brdrQ - precompute feature {feature_id}",
+            )
+            self._prefetch_tasks[cache_key] = task
+            QgsApplication.taskManager().addTask(task, PREFETCH_PRIORITY)
+
+    def _cancel_prefetch(self):
+        self._prefetch_queue = []
+        for task in self._prefetch_tasks.values():
+            task.cancel()
+        self._prefetch_tasks = {}
+
+    def _get_prediction_cache_key(self, feature_id, geometry, relevant_distances):
+        """
+        Key of the prediction cache: layer, feature, fingerprint of the (original)
+        geometry and fingerprint of the settings used for the alignment
+        """
+        settings = {
+            "crs": self.crs,
+            "reference_choice": self.reference_choice,
+            "processor": self.processor,
+            "od_strategy": self.od_strategy,
+            "threshold_overlap_percentage": self.threshold_overlap_percentage,
+            "relevant_distances": relevant_distances,
+            "full_strategy": self.full_strategy,
+            "partial_snapping": self.partial_snapping,
+            "partial_snapping_strategy": self.partial_snapping_strategy,
+            "snap_max_segment_length": self.snap_max_segment_length,
+            "metadata": self.metadata,
+            "adaptive_sweep": self.adaptive_sweep,
+        }
+        if not any(
+            self.reference_choice in options
+            for options in (GRB_TYPES, ADPF_VERSIONS, OSM_TYPES, BE_TYPES, NL_TYPES)
+        ):
+            # local reference layer: the version changes with every edit
+            settings["reference_layer"] = self.reference_layer.id()
+            settings["reference_id"] = self.reference_id
+            settings["reference_version"] = self.local_reference_index.version
         return (
-            self.dict_processresults,
-            self.dict_evaluated_predictions,
-            self.diffs_dict,
+            self.layer.id(),
+            feature_id,
+            get_fingerprint(geometry.wkb),
+            get_fingerprint(settings),
         )
 
+    def _connect_prediction_cache(self, layer):
+        """
+        Invalidates the cached predictions of features of the (thematic) layer when
+        their geometry changes
+        """
+        if self._prediction_cache_layer is not None:
+            try:
+                self._prediction_cache_layer.geometryChanged.disconnect(
+                    self._onThemeGeometryChanged
+                )
+                self._prediction_cache_layer.featureDeleted.disconnect(
+                    self._onThemeFeatureDeleted
+                )
+            except Exception:
+                pass
+        self._prediction_cache_layer = layer
+        if layer is not None:
+            layer.geometryChanged.connect(self._onThemeGeometryChanged)
+            layer.featureDeleted.connect(self._onThemeFeatureDeleted)
+
+    def _onThemeGeometryChanged(self, fid, geometry):
+        self._onThemeFeatureDeleted(fid)
+
+    def _onThemeFeatureDeleted(self, fid):
+        try:
+            layer_id = self._prediction_cache_layer.id()
+        except Exception:
+            return
+        self.prediction_cache.invalidate(layer_id, fid)
+
     def change_geometry(self):
         if self.layer is None:
             self._set_user_feedback("Please select a layer to align in the upper combobox")
@@ -1719,24 +2132,10 @@ class brdrQDockWidgetFeatureAligner(
 
     def _refresh_feature_table_without_realign(self):
         """
-        Refresh the feature table (e.g. state colors) without triggering a new alignment
-        via itemSelectionChanged.
+        Refresh the feature table (e.g. state colors) without triggering a new alignment:
+        the attributes are fetched again, the rows and the selection are kept.
         """
-        selected_row = self.tableFeatures.currentRow()
-        table_blocker = QSignalBlocker(self.tableFeatures)
-        selection_blocker = None
-        selection_model = self.tableFeatures.selectionModel()
-        if selection_model is not None:
-            selection_blocker = QSignalBlocker(selection_model)
-
-        try:
-            self.updateTextListWidgetItems()
-            if 0 <= selected_row < self.tableFeatures.rowCount():
-                self.tableFeatures.selectRow(selected_row)
-        finally:
-            del table_blocker
-            if selection_blocker is not None:
-                del selection_blocker
+        self.featureTableModel.refresh()
 
     def startDock(self):
         if self._is_closing:
@@ -1747,6 +2146,8 @@ class brdrQDockWidgetFeatureAligner(
             self.clearUserInterface()
             self._set_user_feedback("Please select a feature to align")
             self.loadSettings()
+            self._cancel_prefetch()
+            self.prediction_cache.set_max_memory(self.prediction_cache_memory or 0)
             self.add_reference_label()
             self.setHandles()
             self.show()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Virtual table model of the features in the FeatureAligner dock.
+
+The rows are an index of feature ids (a NumPy-array, ordered by fid or by the sort
+column). The attributes are fetched lazily from the provider, in pages of rows, and
+only the most recently used pages are kept, so the memory use does not depend on the
+number of listed features. Sorting is done by the provider (order by-clause of a
+QgsFeatureRequest); only the feature ids are fetched.
+"""
+from collections import OrderedDict
+
+import numpy as np
+from qgis.PyQt.QtCore import QAbstractTableModel, QModelIndex
+from qgis.PyQt.QtGui import QBrush
+from qgis.core import QgsExpression, QgsFeatureRequest
+
+from .qt_compat import (
+    qt_background_role,
+    qt_descending_order,
+    qt_display_role,
+    qt_horizontal,
+    qt_user_role,
+)
+
+FEATURE_TABLE_PAGE_SIZE = 256  # rows fetched per provider-request
+FEATURE_TABLE_MAX_PAGES = 16  # pages kept in memory
+ID_COLUMN = -1  # field index of the column with the feature id
+
+
+def _is_null(value):
+    return value is None or (hasattr(value, "isNull") and value.isNull())
+
+
+class FeatureTableModel(QAbstractTableModel):
+    """
+    Table with the columns ID (feature id), state and the other fields of a layer.
+
+    * state_color: callable(state) that returns the background-QColor of a row
+    * page_size, max_pages: rows per provider-request and pages kept in memory
+    """
+
+    def __init__(
+        self,
+        state_color=None,
+        page_size=FEATURE_TABLE_PAGE_SIZE,
+        max_pages=FEATURE_TABLE_MAX_PAGES,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.state_color = state_color
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.layer = None
+        self._fids = np.empty(0, dtype=np.int64)
+        self._headers = []
+        self._field_indices = []  # field index per column
+        self._state_index = None  # field index of the state
+        self._pages = OrderedDict()  # page: attributes per row (LRU)
+        self._sort_column = 0
+        self._sort_order = None  # None: ascending
+
+    def set_source(self, layer, fids, state_field_name=None, state_header="state"):
+        """
+        Lists the features (fids) of the layer, in the current sort order. The columns
+        are ID, the state (state_field_name; empty when None) and the other fields.
+        """
+        self.beginResetModel()
+        self.layer = layer
+        field_names = layer.fields().names() if layer is not None else []
+        self._state_index = (
+            layer.fields().indexOf(state_field_name)
+            if layer is not None and state_field_name
+            else None
+        )
+        if self._state_index is not None and self._state_index < 0:
+            self._state_index = None
+        other_indices = [
+            i for i in range(len(field_names)) if i != self._state_index
+        ]
+        self._headers = ["ID", state_field_name or state_header] + [
+            field_names[i] for i in other_indices
+        ]
+        self._field_indices = [ID_COLUMN, self._state_index] + other_indices
+        self._fids = np.sort(np.asarray(list(fids), dtype=np.int64))
+        self._pages.clear()
+        if self._sort_column != 0 or self._sort_order is not None:
+            self._fids = self._ordered_fids(self._sort_column, self._sort_order)
+        self.endResetModel()
+
+    def clear(self):
+        """
+        Removes all rows (the columns are kept)
+        """
+        self.beginResetModel()
+        self._fids = np.empty(0, dtype=np.int64)
+        self._pages.clear()
+        self.endResetModel()
+
+    def refresh(self):
+        """
+        Fetches the attributes again (e.g. after a change of the state)
+        """
+        self._pages.clear()
+        if len(self._fids) and self._headers:
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(len(self._fids) - 1, len(self._headers) - 1),
+            )
+
+    def feature_id(self, row):
+        if row is None or row < 0 or row >= len(self._fids):
+            return None
+        return int(self._fids[row])
+
+    def row_of_feature_id(self, feature_id):
+        rows = np.flatnonzero(self._fids == int(feature_id))
+        return int(rows[0]) if len(rows) else -1
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._fids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def headerData(self, section, orientation, role=qt_display_role()):
+        if (
+            orientation == qt_horizontal() and
+            role == qt_display_role() and
+            0 <= section < len(self._headers)
+        ):
+            return self._headers[section]
+        return None
+
+    def data(self, index, role=qt_display_role()):
+        if not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        if role == qt_display_role():
+            field_index = self._field_indices[column]
+            if field_index == ID_COLUMN:
+                return str(self._fids[row])
+            return self._value_text(row, field_index)
+        if role == qt_user_role() and column == 0:
+            return str(self._fids[row])
+        if (
+            role == qt_background_role() and
+            self.state_color is not None and
+            self._state_index is not None
+        ):
+            return QBrush(self.state_color(self._value_text(row, self._state_index)))
+        return None
+
+    def sort(self, column, order=None):
+        """
+        Sorts the rows by the provider (ID-column: by fid); the selection is kept
+        """
+        if order == qt_descending_order():
+            self._sort_order = order
+        else:
+            self._sort_order = None
+        self._sort_column = column
+        if self.layer is None or len(self._fids) == 0:
+            return
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        persistent_fids = [self._fids[i.row()] for i in persistent]
+        self._fids = self._ordered_fids(column, self._sort_order)
+        self._pages.clear()
+        self.changePersistentIndexList(
+            persistent,
+            [
+                self.index(self.row_of_feature_id(fid), i.column())
+                for fid, i in zip(persistent_fids, persistent)
+            ],
+        )
+        self.layoutChanged.emit()
+
+    def _ordered_fids(self, column, order):
+        descending = order is not None
+        field_index = (
+            self._field_indices[column]
+            if 0 <= column < len(self._field_indices)
+            else None
+        )
+        if field_index is None:
+            return self._fids
+        if field_index == ID_COLUMN:
+            fids = np.sort(self._fids)
+            return fids[::-1] if descending else fids
+        field_name = self.layer.fields().at(field_index).name()
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([])
+        subset = len(self._fids) < self.layer.featureCount()
+        if subset:
+            request.setFilterFids([int(fid) for fid in self._fids])
+        request.setOrderBy(
+            QgsFeatureRequest.OrderBy(
+                [
+                    QgsFeatureRequest.OrderByClause(
+                        QgsExpression.quotedColumnRef(field_name), not descending
+                    )
+                ]
+            )
+        )
+        ordered = np.fromiter(
+            (f.id() for f in self.layer.getFeatures(request)), dtype=np.int64
+        )
+        if not subset:
+            ordered = ordered[np.isin(ordered, self._fids)]
+        # listed features that are not returned anymore (e.g. deleted) stay at the end
+        missing = self._fids[~np.isin(self._fids, ordered)]
+        return np.concatenate([ordered, missing])
+
+    def _value_text(self, row, field_index):
+        attributes = self._row_attributes(row)
+        if attributes is None or field_index is None:
+            return ""
+        value = attributes[field_index]
+        return "" if _is_null(value) else str(value)
+
+    def _row_attributes(self, row):
+        page = row // self.page_size
+        attributes = self._pages.get(page)
+        if attributes is None:
+            attributes = self._fetch_page(page)
+            self._pages[page] = attributes
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(page)
+        return attributes[row - page * self.page_size]
+
+    def _fetch_page(self, page):
+        fids = self._fids[page * self.page_size : (page + 1) * self.page_size]
+        request = QgsFeatureRequest().setFilterFids([int(fid) for fid in fids])
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        attributes_by_fid = {
+            feature.id(): feature.attributes()
+            for feature in self.layer.getFeatures(request)
+        }
+        return [attributes_by_fid.get(int(fid)) for fid in fids]
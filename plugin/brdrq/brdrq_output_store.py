@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Run-level output store: one GeoPackage per run for all result layers.
+
+The GeoPackage is written through OGR, on one dataset that is opened once per run:
+
+* WAL-journaling, synchronous=NORMAL and a larger SQLite-cache, set with GDAL
+  config options when the dataset is opened
+* each layer is written in one transaction
+* OGR creates the layer (an existing layer is overwritten) and its spatial index;
+  the attribute indexes are created in the same transaction
+
+This module does not import QGIS.
+"""
+import os
+from contextlib import contextmanager
+
+import numpy as np
+from brdr.constants import DEFAULT_CRS
+from brdr.geometry_utils import to_crs
+from osgeo import gdal, ogr, osr
+from shapely import to_wkb
+
+from .brdrq_columns import get_column_type
+
+OUTPUT_STORE_CONFIG_OPTIONS = {
+    "OGR_SQLITE_JOURNAL": "WAL",
+    "OGR_SQLITE_SYNCHRONOUS": "NORMAL",
+    "OGR_SQLITE_CACHE": "64",  # MB
+}
+OUTPUT_STORE_LAYER_OPTIONS = ["SPATIAL_INDEX=YES", "OVERWRITE=YES"]
+
+_OGR_FIELD_TYPES = {
+    "bool": ogr.OFTInteger,
+    "int": ogr.OFTInteger64,
+    "float": ogr.OFTReal,
+    "string": ogr.OFTString,
+}
+_OGR_CONVERTERS = {"bool": int, "int": int, "float": float, "string": str}
+
+
+@contextmanager
+def _config_options(options):
+    """
+    Sets GDAL config options for the current thread, and restores the previous values
+    """
+    previous = {key: gdal.GetThreadLocalConfigOption(key, None) for key in options}
+    for key, value in options.items():
+        gdal.SetThreadLocalConfigOption(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+
+
+def _quote(identifier):
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _to_ogr_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def to_ogr_srs(crs):
+    """
+    Converts a crs (pyproj CRS, authid, urn or uri) to an OGR SpatialReference, with
+    x/y axis order
+    """
+    crs = to_crs(crs)
+    authority = crs.to_authority()
+    srs = osr.SpatialReference()
+    if authority is not None:
+        srs.SetFromUserInput(f"{authority[0]}:{authority[1]}")
+    else:
+        srs.ImportFromWkt(crs.to_wkt())
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+class OutputStore:
+    """
+    GeoPackage with all output layers of a run, written on one OGR-dataset
+    """
+
+    def __init__(self, path, crs=DEFAULT_CRS):
+        self.path = path
+        self.crs = crs if crs is not None else DEFAULT_CRS
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with _config_options(OUTPUT_STORE_CONFIG_OPTIONS):
+            if os.path.exists(path):
+                self.dataset = ogr.Open(path, 1)
+            else:
+                self.dataset = ogr.GetDriverByName("GPKG").CreateDataSource(path)
+        if self.dataset is None:
+            raise OSError(
+                f"GeoPackage {path} could not be opened: {gdal.GetLastErrorMsg()}"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Flushes and closes the dataset
+        """
+        if self.dataset is None:
+            return
+        self.dataset.FlushCache()
+        self.dataset = None
+
+    def layer_names(self):
+        return [
+            self.dataset.GetLayer(i).GetName()
+            for i in range(self.dataset.GetLayerCount())
+        ]
+
+    def write_layer(
+        self, name, geometry_type, geometries, columns, crs=None, index_fields=()
+    ):
+        """
+        Writes a layer (a geometry-array and {fieldname: values}, of one geometry-type)
+        in one transaction. An existing layer with the same name is replaced. Returns
+        the number of written features.
+        """
+        fieldnames = list(columns.keys())
+        options = list(OUTPUT_STORE_LAYER_OPTIONS)
+        if "fid" in {f.lower() for f in fieldnames}:
+            options.append("FID=brdrq_fid")
+        geometries = np.asarray(geometries, dtype=object)
+        wkbs = to_wkb(geometries, output_dimension=2)
+
+        self.dataset.StartTransaction()
+        try:
+            layer = self.dataset.CreateLayer(
+                name,
+                to_ogr_srs(crs if crs is not None else self.crs),
+                getattr(ogr, "wkb" + geometry_type),
+                options=options,
+            )
+            if layer is None:
+                raise OSError(
+                    f"Layer {name} could not be created: {gdal.GetLastErrorMsg()}"
+                )
+            for fieldname in fieldnames:
+                column_type = get_column_type(columns[fieldname])
+                field = ogr.FieldDefn(fieldname, _OGR_FIELD_TYPES[column_type])
+                if column_type == "bool":
+                    field.SetSubType(ogr.OFSTBoolean)
+                layer.CreateField(field)
+            definition = layer.GetLayerDefn()
+            values = [columns[f] for f in fieldnames]
+            converters = [
+                _OGR_CONVERTERS[get_column_type(column)] for column in values
+            ]
+            for i, wkb in enumerate(wkbs):
+                feature = ogr.Feature(definition)
+                if wkb is not None:
+                    feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb))
+                for index, (column, convert) in enumerate(zip(values, converters)):
+                    value = _to_ogr_value(column[i])
+                    if value is None:
+                        feature.SetFieldNull(index)
+                    else:
+                        feature.SetField(index, convert(value))
+                if layer.CreateFeature(feature) != ogr.OGRERR_NONE:
+                    raise OSError(
+                        f"Features could not be written to {name}: "
+                        f"{gdal.GetLastErrorMsg()}"
+                    )
+            for field in index_fields:
+                if field in columns:
+                    self.dataset.ExecuteSQL(
+                        f"CREATE INDEX {_quote(f'idx_{name}_{field}')} "
+                        f"ON {_quote(name)} ({_quote(field)})"
+                    )
+        except BaseException:
+            self.dataset.RollbackTransaction()
+            raise
+        self.dataset.CommitTransaction()
+        return len(wkbs)
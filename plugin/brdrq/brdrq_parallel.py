@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Spatially clustered, multi-process execution of the alignment (AutocorrectBorders).
+
+The thematic features are split into independent clusters (connected components of
+features within 2x the relevant distance of each other), the clusters are packed into
+balanced groups, and each group is aligned with its own reference subset in a worker
+process. The GeoJSON results of the groups are merged in a deterministic order.
+
+AutoUpdateBorders uses the same worker pool: its affected features are clustered in
+the same way, and each group downloads the actual GRB over its own extent
+(actualise_group). Groups of independent clusters do not download the same GRB
+features twice.
+
+This module does not import QGIS, so it can be imported in the (spawned) worker
+processes as a top-level module.
+"""
+import concurrent.futures
+import importlib
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+from brdr.aligner import Aligner
+from brdr.configs import AlignerConfig
+from brdr.constants import ID_THEME_FIELD_NAME
+from brdr.enums import AlignerResultType
+from brdr.loader import DictLoader
+from shapely import STRtree
+
+WORKER_MODULE = "brdrq_parallel"
+ADAPTIVE_SWEEP_MODULE = "brdrq_adaptive_sweep"
+ACTUALISATION_MODULE = "brdrq_actualisation"
+
+
+def get_connected_components(geoms, distance):
+    """
+    Returns an array with a component-label for each geometry: geometries within the
+    distance of each other (directly or through others) get the same label.
+    Labels are numbered in order of first appearance.
+    """
+    n = len(geoms)
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    left, right = STRtree(geoms).query(geoms, predicate="dwithin", distance=distance)
+    for i, j in zip(left, right):
+        if i < j:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+    roots = np.array([find(i) for i in range(n)], dtype=int)
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels
+
+
+def group_components(labels, n_groups):
+    """
+    Packs the components in (at most) n_groups groups of about equal size (largest
+    component first). Returns a list of index-arrays, ordered by their first index.
+    """
+    labels = np.asarray(labels)
+    components = [np.flatnonzero(labels == label) for label in np.unique(labels)]
+    n_groups = max(1, min(n_groups, len(components)))
+    groups = [[] for _ in range(n_groups)]
+    sizes = [0] * n_groups
+    for component in sorted(components, key=lambda c: (-len(c), c[0])):
+        g = sizes.index(min(sizes))
+        groups[g].append(component)
+        sizes[g] += len(component)
+    groups = [np.sort(np.concatenate(g)) for g in groups if g]
+    return sorted(groups, key=lambda g: g[0])
+
+
+def _create_aligner(task):
+    processor = task["processor_class"](config=task["processor_config"])
+    aligner_config = AlignerConfig()
+    aligner_config.log_metadata = task["log_metadata"]
+    aligner_config.add_observations = task["add_observations"]
+    return Aligner(crs=task["crs"], processor=processor, config=aligner_config)
+
+
+def align_group(task):
+    """
+    Aligns one group of thematic features in a worker process; returns the GeoJSON
+    featurecollections (dict) of the results
+    """
+    aligner = _create_aligner(task)
+    if task.get("adaptive_sweep"):
+        # top-level module (plugin-folder is on the path of the worker)
+        importlib.import_module(ADAPTIVE_SWEEP_MODULE).enable_adaptive_sweep(aligner)
+    aligner.load_thematic_data(
+        DictLoader(task["thematic"], task["thematic_properties"])
+    )
+    aligner.load_reference_data(DictLoader(task["reference"], is_reference=True))
+    aligner.reference_data.source = task["reference_source"]
+    if task["predictions"]:
+        aligner_result = aligner.evaluate(
+            relevant_distances=task["relevant_distances"],
+            max_predictions=task["max_predictions"],
+            multi_to_best_prediction=task["multi_to_best_prediction"],
+            full_reference_strategy=task["full_reference_strategy"],
+        )
+        result_type = AlignerResultType.EVALUATED_PREDICTIONS
+    else:
+        aligner_result = aligner.predict(
+            relevant_distances=task["relevant_distances"],
+        )
+        result_type = AlignerResultType.PROCESSRESULTS
+    if not aligner_result.results:
+        return {}
+    return aligner_result.get_results_as_geojson(
+        aligner=aligner,
+        result_type=result_type,
+        add_metadata=task["add_metadata"],
+        add_original_attributes=task["add_attributes"],
+    )
+
+
+def actualise_group(task):
+    """
+    Actualises one group of thematic features to the actual GRB in a worker process
+    (the GRB is downloaded once for the group); returns the evaluated predictions
+    """
+    aligner = _create_aligner(task)
+    aligner.load_thematic_data(
+        DictLoader(task["thematic"], task["thematic_properties"])
+    )
+    actualisation = importlib.import_module(ACTUALISATION_MODULE)
+    return actualisation.actualise(
+        aligner,
+        list(task["thematic"].keys()),
+        grb_type=task["grb_type"],
+        max_distance_for_actualisation=task["max_distance_for_actualisation"],
+        base_metadata_field=task["base_metadata_field"],
+        max_predictions=task["max_predictions"],
+        full_reference_strategy=task["full_reference_strategy"],
+        multi_to_best_prediction=task["multi_to_best_prediction"],
+    )
+
+
+def merge_featurecollections(list_fcs, thematic_ids):
+    """
+    Merges the featurecollections (dicts of name: featurecollection) of the groups;
+    the features are ordered like the thematic input (thematic_ids)
+    """
+    position = {thematic_id: i for i, thematic_id in enumerate(thematic_ids)}
+    merged = {}
+    for fcs in list_fcs:
+        for name, fc in fcs.items():
+            if name not in merged:
+                merged[name] = dict(fc)
+                merged[name]["features"] = list(fc["features"])
+            else:
+                merged[name]["features"].extend(fc["features"])
+    for fc in merged.values():
+        fc["features"].sort(
+            key=lambda f: position.get(
+                f["properties"].get(ID_THEME_FIELD_NAME), len(position)
+            )
+        )
+    return merged
+
+
+def build_tasks(
+    dict_thematic,
+    dict_thematic_properties,
+    dict_reference,
+    relevant_distance,
+    n_groups,
+    **settings
+):
+    """
+    Splits the thematic features in groups of spatially independent clusters, each
+    with the reference features within the relevant distance
+    """
+    thematic_ids = list(dict_thematic.keys())
+    thematic_geoms = np.asarray(list(dict_thematic.values()), dtype=object)
+    labels = get_connected_components(thematic_geoms, 2 * relevant_distance)
+    groups = group_components(labels, n_groups)
+
+    reference_ids = list(dict_reference.keys())
+    reference_geoms = np.asarray(list(dict_reference.values()), dtype=object)
+    reference_tree = STRtree(reference_geoms)
+    tasks = []
+    for group in groups:
+        hits = np.unique(
+            reference_tree.query(
+                thematic_geoms[group],
+                predicate="dwithin",
+                distance=1.01 * relevant_distance,
+            )[1]
+        )
+        ids = [thematic_ids[i] for i in group]
+        task = dict(settings)
+        task["thematic"] = {i: dict_thematic[i] for i in ids}
+        task["thematic_properties"] = {
+            i: dict_thematic_properties[i] for i in ids if i in dict_thematic_properties
+        }
+        task["reference"] = {reference_ids[i]: reference_geoms[i] for i in hits}
+        tasks.append(task)
+    return tasks
+
+
+def build_group_tasks(
+    dict_thematic, dict_thematic_properties, distance, n_groups, **settings
+):
+    """
+    Splits the thematic features in (at most) n_groups groups of spatially independent
+    clusters (features within 2x the distance of each other are kept in the same
+    group), without reference: each group loads its own reference over its extent
+    """
+    thematic_ids = list(dict_thematic.keys())
+    if len(thematic_ids) == 0:
+        return []
+    thematic_geoms = np.asarray(list(dict_thematic.values()), dtype=object)
+    labels = get_connected_components(thematic_geoms, 2 * distance)
+    tasks = []
+    for group in group_components(labels, n_groups):
+        ids = [thematic_ids[i] for i in group]
+        task = dict(settings)
+        task["thematic"] = {i: dict_thematic[i] for i in ids}
+        task["thematic_properties"] = {
+            i: dict_thematic_properties[i] for i in ids if i in dict_thematic_properties
+        }
+        tasks.append(task)
+    return tasks
+
+
+def run_tasks(
+    tasks, workers, python_exe=None, feedback=None, worker_function="align_group"
+):
+    """
+    Runs the tasks in a pool of worker processes (worker_function of this module);
+    returns the list of results in the order of the tasks, or None when cancelled
+    """
+    plugin_dir = os.path.dirname(os.path.abspath(__file__))
+    if plugin_dir not in sys.path:
+        sys.path.append(plugin_dir)
+    # import as top-level module, so the workers do not import the plugin (and QGIS)
+    worker_module = importlib.import_module(WORKER_MODULE)
+    context = multiprocessing.get_context("spawn")
+    if python_exe is not None:
+        context.set_executable(python_exe)
+    results = [None] * len(tasks)
+    # no with-block: its exit waits for the running groups, also when cancelled
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=context
+    )
+    completed = False
+    try:
+        function = getattr(worker_module, worker_function)
+        futures = [executor.submit(function, task) for task in tasks]
+        for i, future in enumerate(futures):
+            while True:
+                if feedback is not None and feedback.isCanceled():
+                    return None
+                try:
+                    results[i] = future.result(timeout=0.5)
+                    break
+                except concurrent.futures.TimeoutError:
+                    continue
+            if feedback is not None:
+                feedback.pushInfo(f"Cluster-group {i + 1}/{len(tasks)} aligned")
+        completed = True
+    finally:
+        # cancelled or failed: the pending groups are cancelled, without waiting for
+        # the running ones
+        executor.shutdown(wait=completed, cancel_futures=not completed)
+    return results
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-bounded LRU cache of the prediction results per feature (FeatureAligner).
+
+Entries are keyed by layer id, feature id, a fingerprint of the (original) feature
+geometry and a fingerprint of the alignment settings. When the memory budget is
+exceeded, the least recently used entries are dropped.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+import numpy as np
+from shapely import get_num_coordinates
+from shapely.geometry.base import BaseGeometry
+
+PREDICTION_CACHE_MAX_MEMORY = 256  # default memory budget (MB)
+# rough memory use (bytes) of a geometry: overhead + 2D-coordinates
+GEOMETRY_OVERHEAD = 200
+COORDINATE_SIZE = 16
+
+
+def get_fingerprint(value):
+    """
+    Returns a (hex) hash of a WKB (bytes) or of a (json-serializable) settings-dict
+    """
+    if not isinstance(value, (bytes, bytearray)):
+        value = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(value).hexdigest()
+
+
+def estimate_size(geometries):
+    """
+    Estimates the memory use (bytes) of the geometries
+    """
+    geometries = np.asarray(
+        [g for g in geometries if isinstance(g, BaseGeometry)], dtype=object
+    )
+    if len(geometries) == 0:
+        return 0
+    return int(
+        len(geometries) * GEOMETRY_OVERHEAD +
+        get_num_coordinates(geometries).sum() * COORDINATE_SIZE
+    )
+
+
+def estimate_results_size(aligner, dict_processresults):
+    """
+    Estimates the memory use (bytes) of the results of an alignment: the geometries
+    of the process results, and the thematic and reference geometries of the aligner
+    """
+    geometries = [
+        value
+        for results in dict_processresults.values()
+        for process_result in results.values()
+        if process_result is not None
+        for value in process_result.values()
+    ]
+    for collection in (aligner.thematic_data, aligner.reference_data):
+        if collection is not None:
+            geometries.extend(f.geometry for f in collection.features.values())
+    return estimate_size(geometries)
+
+
+class PredictionCache:
+    """
+    LRU cache {key: entry}, bounded by a memory budget (MB). A key is a tuple
+    (layer_id, feature_id, geometry fingerprint, settings fingerprint).
+    """
+
+    def __init__(self, max_memory=PREDICTION_CACHE_MAX_MEMORY):
+        self.max_memory = max_memory
+        self.entries = OrderedDict()  # key: (entry, size)
+        self.size = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, entry, size):
+        self._remove(key)
+        if size > self.max_memory * 1024 * 1024:
+            return
+        self.entries[key] = (entry, size)
+        self.size += size
+        self._evict()
+
+    def set_max_memory(self, max_memory):
+        self.max_memory = max_memory
+        self._evict()
+
+    def invalidate(self, layer_id, feature_id=None):
+        """
+        Removes the entries of a feature, or of all features of the layer
+        """
+        for key in list(self.entries.keys()):
+            if key[0] == layer_id and (feature_id is None or key[1] == feature_id):
+                self._remove(key)
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def _remove(self, key):
+        if key in self.entries:
+            _, size = self.entries.pop(key)
+            self.size -= size
+
+    def _evict(self):
+        while self.entries and self.size > self.max_memory * 1024 * 1024:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.size -= size
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent tile cache for the on-the-fly reference downloads (GRB, ADPF, OSM, BE, NL).
+
+Downloaded reference features are stored in a SQLite-store in the QGIS profile folder,
+keyed by source (reference type/version + CRS) and by a fixed grid of tiles. When a
+reference is requested, only the tiles that are not cached yet (or whose TTL expired)
+are downloaded; the others are read from disk. The store is size-bounded: the least
+recently used tiles are evicted when the maximum size is exceeded.
+
+For interactive use (FeatureAligner) a SessionReferenceCache keeps the tiles of the
+session in memory, so stepping through neighbouring features only loads missing tiles.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from brdr.aligner import Aligner
+from brdr.constants import MAX_REFERENCE_BUFFER
+from brdr.loader import DictLoader, Loader
+from qgis.core import QgsApplication
+from shapely import STRtree, box, buffer, from_wkb, intersects, to_wkb, union_all
+
+REFERENCE_CACHE_FILENAME = "brdrq_reference_cache.sqlite"
+REFERENCE_CACHE_MAX_SIZE = 512 * 1024 * 1024  # bytes
+# tile size in CRS-units (projected CRS: meters; geographic CRS: degrees)
+REFERENCE_CACHE_TILE_SIZE = 1000
+REFERENCE_CACHE_TILE_SIZE_GEOGRAPHIC = 0.01
+DAY = 24 * 60 * 60
+# Time-to-live (seconds) of a cached tile, per source-family (prefix of the source-key)
+REFERENCE_CACHE_TTL = {
+    "GRB": 1 * DAY,  # actual GRB is updated daily
+    "ADPF": 365 * DAY,  # fiscal parcels are a yearly situation
+    "OSM": 7 * DAY,
+    "BE": 30 * DAY,
+    "NL": 7 * DAY,
+}
+REFERENCE_CACHE_TTL_DEFAULT = 1 * DAY
+
+
+class ReferenceTileCache:
+    """
+    SQLite-store with the reference features per (source, tile)
+    """
+
+    def __init__(
+        self,
+        path,
+        max_size=REFERENCE_CACHE_MAX_SIZE,
+        ttl=None,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = REFERENCE_CACHE_TTL if ttl is None else ttl
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tiles (
+                    source TEXT NOT NULL,
+                    tile_x INTEGER NOT NULL,
+                    tile_y INTEGER NOT NULL,
+                    fetched REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    PRIMARY KEY (source, tile_x, tile_y)
+                );
+                CREATE TABLE IF NOT EXISTS features (
+                    source TEXT NOT NULL,
+                    tile_x INTEGER NOT NULL,
+                    tile_y INTEGER NOT NULL,
+                    ref_id TEXT NOT NULL,
+                    wkb BLOB,
+                    properties TEXT,
+                    data_uri TEXT
+                );
+                CREATE INDEX IF NOT EXISTS features_tile
+                    ON features (source, tile_x, tile_y);
+                CREATE TABLE IF NOT EXISTS sources (
+                    source TEXT PRIMARY KEY,
+                    source_info TEXT
+                );
+                """
+            )
+            columns = [c[1] for c in conn.execute("PRAGMA table_info(features)")]
+            if "data_uri" not in columns:
+                # store of a previous version
+                conn.execute("ALTER TABLE features ADD COLUMN data_uri TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_ttl(self, source):
+        return self.ttl.get(source.split("_")[0], REFERENCE_CACHE_TTL_DEFAULT)
+
+    def missing_tiles(self, source, tiles):
+        """
+        Returns the tiles (list of (x, y)) that are not cached or expired
+        """
+        expired = time.time() - self.get_ttl(source)
+        with self._connect() as conn:
+            cached = {
+                (x, y)
+                for x, y in conn.execute(
+                    "SELECT tile_x, tile_y FROM tiles WHERE source = ? AND fetched >= ?",
+                    (source, expired),
+                )
+            }
+        return [t for t in tiles if t not in cached]
+
+    def put(self, source, tiles, features, source_info=None, keep=None):
+        """
+        Stores the features for the given tiles (replacing the previous content), and
+        evicts the least recently used tiles when the store exceeds its maximum size.
+        The stored tiles and the tiles in keep (list of (x, y) of the same source) are
+        not evicted. Returns the number of evicted tiles.
+
+        * features: list of (tile, ref_id, wkb, properties, data_uri)
+        """
+        now = time.time()
+        sizes = dict.fromkeys(tiles, 0)
+        rows = []
+        for tile, ref_id, wkb, properties, data_uri in features:
+            properties = json.dumps(properties, default=str)
+            sizes[tile] += len(wkb or b"") + len(properties) + len(data_uri or "")
+            rows.append(
+                (
+                    source,
+                    tile[0],
+                    tile[1],
+                    json.dumps(ref_id),
+                    wkb,
+                    properties,
+                    data_uri,
+                )
+            )
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM features WHERE source = ? AND tile_x = ? AND tile_y = ?",
+                [(source, x, y) for x, y in tiles],
+            )
+            conn.executemany(
+                "INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?)",
+                [(source, x, y, now, now, size) for (x, y), size in sizes.items()],
+            )
+            if source_info is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?)",
+                    (source, json.dumps(source_info, default=str)),
+                )
+        keep = set(tiles) | set(keep or [])
+        return self.evict(keep=[(source, x, y) for x, y in keep])
+
+    def get(self, source, tiles):
+        """
+        Returns the cached features of the tiles as {ref_id: (wkb, properties,
+        data_uri)}, and the source_info of the source. Features spanning multiple tiles
+        are returned once.
+        """
+        now = time.time()
+        result = {}
+        with self._connect() as conn:
+            for x, y in tiles:
+                for ref_id, wkb, properties, data_uri in conn.execute(
+                    "SELECT ref_id, wkb, properties, data_uri FROM features "
+                    "WHERE source = ? AND tile_x = ? AND tile_y = ?",
+                    (source, x, y),
+                ):
+                    result[json.loads(ref_id)] = (wkb, properties, data_uri)
+            conn.executemany(
+                "UPDATE tiles SET last_used = ? "
+                "WHERE source = ? AND tile_x = ? AND tile_y = ?",
+                [(now, source, x, y) for x, y in tiles],
+            )
+            row = conn.execute(
+                "SELECT source_info FROM sources WHERE source = ?", (source,)
+            ).fetchone()
+        source_info = json.loads(row[0]) if row else None
+        return result, source_info
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used tiles until the store is below its maximum size.
+        The tiles in keep (list of (source, x, y)) are never removed. Returns the number
+        of removed tiles.
+        """
+        keep = set(keep or [])
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+            if total <= self.max_size:
+                return 0
+            evicted = []
+            for source, x, y, size in conn.execute(
+                "SELECT source, tile_x, tile_y, size FROM tiles ORDER BY last_used"
+            ).fetchall():
+                if (source, x, y) in keep:
+                    continue
+                evicted.append((source, x, y))
+                total -= size
+                if total <= 0.9 * self.max_size:
+                    break
+            conn.executemany(
+                "DELETE FROM features WHERE source = ? AND tile_x = ? AND tile_y = ?",
+                evicted,
+            )
+            conn.executemany(
+                "DELETE FROM tiles WHERE source = ? AND tile_x = ? AND tile_y = ?",
+                evicted,
+            )
+        return len(evicted)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM features")
+            conn.execute("DELETE FROM tiles")
+            conn.execute("DELETE FROM sources")
+        with self._connect() as conn:
+            conn.execute("VACUUM")
+
+
+_REFERENCE_CACHE = None
+
+
+def get_reference_cache():
+    """
+    Returns the (session-wide) reference tile cache, stored in the QGIS profile folder
+    """
+    global _REFERENCE_CACHE
+    if _REFERENCE_CACHE is None:
+        path = os.path.join(
+            QgsApplication.qgisSettingsDirPath(), "brdrq", REFERENCE_CACHE_FILENAME
+        )
+        _REFERENCE_CACHE = ReferenceTileCache(path)
+    return _REFERENCE_CACHE
+
+
+def get_tiles(geometry, tile_size):
+    """
+    Returns the grid-tiles (list of (x, y)) that intersect the geometry, and an array
+    with the tile-boxes
+    """
+    if geometry is None or geometry.is_empty:
+        return [], np.array([], dtype=object)
+    minx, miny, maxx, maxy = geometry.bounds
+    xs = np.arange(math.floor(minx / tile_size), math.floor(maxx / tile_size) + 1)
+    ys = np.arange(math.floor(miny / tile_size), math.floor(maxy / tile_size) + 1)
+    grid_x, grid_y = (a.ravel() for a in np.meshgrid(xs, ys))
+    boxes = box(
+        grid_x * tile_size,
+        grid_y * tile_size,
+        (grid_x + 1) * tile_size,
+        (grid_y + 1) * tile_size,
+    )
+    mask = intersects(boxes, geometry)
+    tiles = [(int(x), int(y)) for x, y in zip(grid_x[mask], grid_y[mask])]
+    return tiles, boxes[mask]
+
+
+def get_tile_boxes(tiles, tile_size):
+    """
+    Returns an array with the boxes of the tiles (list of (x, y))
+    """
+    xy = np.asarray(tiles, dtype=float).reshape(-1, 2)
+    return box(
+        xy[:, 0] * tile_size,
+        xy[:, 1] * tile_size,
+        (xy[:, 0] + 1) * tile_size,
+        (xy[:, 1] + 1) * tile_size,
+    )
+
+
+class SessionReferenceCache:
+    """
+    In-memory (session-scoped) sliding window of reference features per source, on top
+    of the persistent tile cache. The features of the tiles loaded during the session
+    are kept in memory and sliced with an STRtree; the least recently used tiles are
+    dropped when more than max_tiles are held for a source (max_tiles=None: no sliding
+    window). The tiles of the current load are never dropped.
+
+    The lock serializes the loads of (background) alignment tasks that share the
+    session.
+    """
+
+    def __init__(self, max_tiles=400):
+        self.max_tiles = max_tiles
+        self.sources = {}
+        self.lock = threading.RLock()
+
+    def _get_source(self, source):
+        if source not in self.sources:
+            self.sources[source] = {
+                "tiles": OrderedDict(),  # tile: set of reference ids
+                "counts": {},  # reference id: number of held tiles
+                "features": {},  # reference id: (geometry, properties, data_uri)
+                "source_info": None,
+                "tree": None,
+                "ids": None,
+            }
+        return self.sources[source]
+
+    def missing_tiles(self, source, tiles):
+        """
+        Returns the tiles that are not held in memory (and marks the others as used)
+        """
+        held = self._get_source(source)["tiles"]
+        missing = []
+        for tile in tiles:
+            if tile in held:
+                held.move_to_end(tile)
+            else:
+                missing.append(tile)
+        return missing
+
+    def add(self, source, tiles, tile_size, cached, source_info, keep=None):
+        """
+        Adds the features of the tiles (as returned by ReferenceTileCache.get). The
+        tiles and the tiles in keep (the other tiles of the current load) are not
+        dropped by the sliding window.
+        """
+        data = self._get_source(source)
+        for tile in tiles:
+            self._drop_tile(data, tile)
+        ref_ids = list(cached.keys())
+        geoms = from_wkb(np.asarray([cached[i][0] for i in ref_ids], dtype=object))
+        # a feature is kept as long as one of the tiles it intersects is held
+        tile_boxes = get_tile_boxes(tiles, tile_size)
+        tile_index, feature_index = STRtree(tile_boxes).query(
+            geoms, predicate="intersects"
+        )[::-1]
+        for tile in tiles:
+            data["tiles"][tile] = set()
+        for t, f in zip(tile_index, feature_index):
+            data["tiles"][tiles[t]].add(ref_ids[f])
+        for tile in tiles:
+            for ref_id in data["tiles"][tile]:
+                data["counts"][ref_id] = data["counts"].get(ref_id, 0) + 1
+        for f in np.unique(feature_index):
+            ref_id = ref_ids[f]
+            if ref_id not in data["features"]:
+                data["features"][ref_id] = (
+                    geoms[f],
+                    json.loads(cached[ref_id][1]),
+                    cached[ref_id][2],
+                )
+        data["source_info"] = source_info
+        self._slide(data, set(tiles) | set(keep or []))
+        data["tree"] = None
+
+    def _drop_tile(self, data, tile):
+        for ref_id in data["tiles"].pop(tile, ()):
+            data["counts"][ref_id] -= 1
+            if data["counts"][ref_id] == 0:
+                del data["counts"][ref_id]
+                data["features"].pop(ref_id, None)
+
+    def _slide(self, data, keep):
+        if self.max_tiles is None:
+            return
+        for tile in list(data["tiles"]):
+            if len(data["tiles"]) <= self.max_tiles:
+                break
+            if tile not in keep:
+                self._drop_tile(data, tile)
+
+    def query(self, source, extent):
+        """
+        Returns the features within the extent as ({id: geometry}, {id: properties},
+        source_info, {id: data_uri})
+        """
+        data = self._get_source(source)
+        if data["tree"] is None:
+            data["ids"] = list(data["features"].keys())
+            data["tree"] = STRtree([data["features"][i][0] for i in data["ids"]])
+        hits = data["tree"].query(extent, predicate="intersects")
+        ids = [data["ids"][i] for i in hits]
+        return (
+            {i: data["features"][i][0] for i in ids},
+            {i: dict(data["features"][i][1]) for i in ids},
+            data["source_info"],
+            {i: data["features"][i][2] for i in ids},
+        )
+
+    def clear(self):
+        self.sources = {}
+
+
+class CachedReferenceLoader(Loader):
+    """
+    Wraps an on-the-fly reference loader (GRBActualLoader, GRBFiscalParcelLoader,
+    OSMLoader, BeCadastralParcelLoader, BRKLoader) so its downloads are cached per tile.
+
+    * loader: the wrapped loader (constructed with the aligner). Missing tiles are
+      downloaded with its load_data, on an aligner with the tiles as thematic data
+    * source: key of the reference source, f.e. 'GRB_ADP' or 'ADPF_2023'. The first
+      part of the key determines the TTL (see REFERENCE_CACHE_TTL)
+    * session: optional SessionReferenceCache; tiles already held in memory are sliced
+      from it without touching the disk-cache or the network
+    """
+
+    def __init__(self, loader, source, cache=None, session=None):
+        super().__init__(is_reference=True)
+        self.loader = loader
+        self.aligner = loader.aligner
+        self.cache = cache
+        self.session = session
+        crs = self.aligner.crs
+        self.source = source + "_" + crs.to_string()
+        self.tile_size = (
+            REFERENCE_CACHE_TILE_SIZE_GEOGRAPHIC
+            if crs.is_geographic
+            else REFERENCE_CACHE_TILE_SIZE
+        )
+
+    def load_data(self):
+        if not self.aligner.thematic_data:
+            raise ValueError(
+                "Reference could not be loaded. Please load thematic data first"
+            )
+        # without session (processing algorithms), all tiles of the load are kept
+        session = (
+            self.session
+            if self.session is not None
+            else SessionReferenceCache(max_tiles=None)
+        )
+        with session.lock:
+            return self._load_data(session)
+
+    def _load_data(self, session):
+        extent = buffer(self.aligner.thematic_data.union, MAX_REFERENCE_BUFFER)
+        tiles, _ = get_tiles(extent, self.tile_size)
+        needed = session.missing_tiles(self.source, tiles)
+        missing = []
+        if needed:
+            cache = self.cache or get_reference_cache()
+            missing = cache.missing_tiles(self.source, needed)
+            if missing:
+                evicted = self._download(cache, missing, keep=needed)
+                if evicted:
+                    self.aligner.logger.feedback_info(
+                        f"brdrQ reference cache: {evicted} tiles evicted"
+                    )
+            cached, source_info = cache.get(self.source, needed)
+            session.add(
+                self.source,
+                needed,
+                self.tile_size,
+                cached,
+                source_info or self.loader.data_dict_source,
+                keep=tiles,
+            )
+        self.aligner.logger.feedback_info(
+            f"brdrQ reference cache ({self.source}): "
+            f"{len(tiles) - len(needed)} tiles from memory, "
+            f"{len(needed) - len(missing)} tiles from disk, "
+            f"{len(missing)} tiles downloaded"
+        )
+
+        # only keep the features within the extent of the thematic data
+        (
+            self.data_dict,
+            self.data_dict_properties,
+            self.data_dict_source,
+            data_uris,
+        ) = session.query(self.source, extent)
+        # version dates are already parsed by the wrapped loader
+        self.versiondate_info = None
+        collection = super().load_data()
+        for feature in collection.features.values():
+            if data_uris.get(feature.data_id) is not None:
+                feature.data_uri = data_uris[feature.data_id]
+        return collection
+
+    def _download(self, cache, tiles, keep=None):
+        """
+        Downloads the tiles with the wrapped loader and stores them in the cache.
+        Returns the number of tiles evicted from the cache.
+        """
+        tile_boxes = get_tile_boxes(tiles, self.tile_size)
+        tile_aligner = Aligner(crs=self.aligner.crs)
+        tile_aligner.load_thematic_data(DictLoader({"tiles": union_all(tile_boxes)}))
+        self.loader.aligner = tile_aligner
+        try:
+            collection = self.loader.load_data()
+        finally:
+            self.loader.aligner = self.aligner
+        features = list(collection.features.values())
+        geoms = np.asarray([f.geometry for f in features], dtype=object)
+        wkbs = to_wkb(geoms)
+        # assign each downloaded feature to all (missing) tiles it intersects
+        tile_index, feature_index = STRtree(tile_boxes).query(
+            geoms, predicate="intersects"
+        )[::-1]
+        return cache.put(
+            self.source,
+            tiles,
+            [
+                (
+                    tiles[t],
+                    features[f].data_id,
+                    wkbs[f],
+                    features[f].properties,
+                    getattr(features[f], "data_uri", None),
+                )
+                for t, f in zip(tile_index, feature_index)
+            ],
+            source_info=collection.source,
+            keep=keep,
+        )
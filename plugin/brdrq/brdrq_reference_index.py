@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial-index based extraction of reference features from a local reference layer.
+
+Instead of materializing an 'extract by location' against the buffered thematic
+layer, the reference layer is queried with the bounding boxes of the clustered
+thematic footprint (using the spatial index of the provider, or a QgsSpatialIndex
+that is built once and reused across runs). Only the exact hits are repaired and
+flattened to 2D.
+
+For the FeatureAligner dock, a LocalReferenceIndex keeps an STRtree of the reference
+geometries that is queried per activated feature.
+"""
+import itertools
+
+import numpy as np
+from qgis.core import QgsFeatureRequest, QgsRectangle, QgsSpatialIndex
+from shapely import (
+    STRtree,
+    box,
+    bounds,
+    dwithin,
+    force_2d,
+    from_wkb,
+    get_parts,
+    prepare,
+    union_all,
+)
+from shapely.errors import GEOSException
+
+from .brdrq_utils import (
+    extract_geometries_by_dimension,
+    geom_qgis_to_wkb,
+    get_geometry_dimension,
+    make_valid_where_invalid,
+)
+from .qt_compat import qgs_spatial_index_present
+
+# Cache of QgsSpatialIndex per layer-id, reused across runs in the QGIS session
+_SPATIAL_INDEX_CACHE = {}
+_CONNECTED_LAYER_IDS = set()
+# Versions of the LocalReferenceIndex-content (unique in the session)
+_INDEX_VERSIONS = itertools.count()
+
+
+def _invalidate_spatial_index(layer_id):
+    _SPATIAL_INDEX_CACHE.pop(layer_id, None)
+
+
+def get_spatial_index(layer, feedback=None):
+    """
+    Returns a QgsSpatialIndex of the layer. The index is built once and kept for the
+    QGIS session; it is dropped when the data of the layer changes or the layer is
+    removed.
+    """
+    layer_id = layer.id()
+    index = _SPATIAL_INDEX_CACHE.get(layer_id)
+    if index is not None:
+        return index
+    request = QgsFeatureRequest().setNoAttributes()
+    request.setInvalidGeometryCheck(QgsFeatureRequest.GeometryNoCheck)
+    index = QgsSpatialIndex(layer.getFeatures(request), feedback)
+    if feedback is not None and feedback.isCanceled():
+        return None
+    _SPATIAL_INDEX_CACHE[layer_id] = index
+    if layer_id not in _CONNECTED_LAYER_IDS:
+        _CONNECTED_LAYER_IDS.add(layer_id)
+        layer.dataChanged.connect(lambda: _invalidate_spatial_index(layer_id))
+        layer.willBeDeleted.connect(lambda: _invalidate_spatial_index(layer_id))
+    return index
+
+
+def cluster_bounding_boxes(geoms):
+    """
+    Clusters the bounding boxes of the (non-empty) geometries: overlapping boxes are
+    dissolved, and the bounding box of each resulting cluster is returned as a
+    QgsRectangle.
+    """
+    boxes = box(*bounds(np.asarray(geoms, dtype=object)).T)
+    boxes = boxes[~np.isnan(bounds(boxes)[:, 0])]
+    if len(boxes) == 0:
+        return []
+    clusters = get_parts(union_all(boxes))
+    return [QgsRectangle(*b) for b in bounds(clusters)]
+
+
+def extract_reference_by_footprint(
+    layer, id_fieldname, footprint, fids=None, feedback=None
+):
+    """
+    Extracts the reference features that intersect the thematic footprint.
+
+    * layer: (local) reference layer
+    * id_fieldname: fieldname of the unique reference id
+    * footprint: array of (buffered) thematic Shapely-geometries
+    * fids: optional subset of feature-ids of the reference layer to extract from
+      (f.e. when 'selected features only' is used)
+
+    Returns a dictionary {reference_id: repaired 2D Shapely-geometry}, or None when
+    cancelled.
+    """
+    rects = cluster_bounding_boxes(footprint)
+    if feedback is not None:
+        feedback.pushInfo(
+            f"Reference extraction: {len(rects)} cluster(s) of thematic features"
+        )
+    if fids is not None:
+        fids = set(fids)
+
+    use_provider_index = layer.hasSpatialIndex() == qgs_spatial_index_present()
+    index = None
+    if not use_provider_index:
+        index = get_spatial_index(layer, feedback)
+        if index is None:
+            return None
+
+    id_index = layer.fields().indexOf(id_fieldname)
+    visited_fids = set()
+    ids = []
+    wkbs = []
+    for rect in rects:
+        if feedback is not None and feedback.isCanceled():
+            return None
+        request = QgsFeatureRequest()
+        request.setInvalidGeometryCheck(QgsFeatureRequest.GeometryNoCheck)
+        request.setSubsetOfAttributes([id_index])
+        if use_provider_index:
+            request.setFilterRect(rect)
+        else:
+            candidate_fids = [
+                fid for fid in index.intersects(rect) if fid not in visited_fids
+            ]
+            if not candidate_fids:
+                continue
+            request.setFilterFids(candidate_fids)
+        for feature in layer.getFeatures(request):
+            fid = feature.id()
+            if fid in visited_fids or (fids is not None and fid not in fids):
+                continue
+            visited_fids.add(fid)
+            ids.append(feature.attribute(id_index))
+            wkbs.append(geom_qgis_to_wkb(feature.geometry()))
+    if not ids:
+        return {}
+
+    # exact intersection-test of the bbox-candidates against the thematic footprint
+    geoms = from_wkb(np.asarray(wkbs, dtype=object))
+    del wkbs
+    tree = STRtree(footprint)
+    try:
+        hits = np.unique(tree.query(geoms, predicate="intersects")[0])
+    except GEOSException:
+        # invalid candidates can make the predicate fail; repair all and retry
+        geoms = make_valid_where_invalid(geoms)
+        hits = np.unique(tree.query(geoms, predicate="intersects")[0])
+
+    # repair & drop Z/M-values of the hits only
+    geoms_hits = force_2d(make_valid_where_invalid(geoms[hits]))
+    dimension = get_geometry_dimension(layer.wkbType())
+    if dimension is not None:
+        geoms_hits = extract_geometries_by_dimension(geoms_hits, dimension)
+    if feedback is not None:
+        feedback.pushInfo(
+            f"Reference extraction: {len(hits)} of {len(ids)} candidate features intersect"
+        )
+    return {ids[i]: geom for i, geom in zip(hits, geoms_hits)}
+
+
+class LocalReferenceIndex:
+    """
+    STRtree of the (prepared) geometries of a local reference layer, keyed by
+    reference id, kept for the lifetime of the FeatureAligner dock.
+
+    Edits on the reference layer are tracked incrementally: changed/added features
+    are kept in a small overlay (and their old entries masked) until the overlay
+    becomes large enough to rebuild the tree. The version changes with every edit, so
+    results based on the reference can be invalidated.
+    """
+
+    REBUILD_THRESHOLD = 1000
+
+    def __init__(self, layer, id_fieldname):
+        self.layer = layer
+        self.id_fieldname = id_fieldname
+        self._tree = None
+        self._fids = None
+        self._ids = None
+        self._geoms = None
+        self._fid_index = {}
+        self._removed = set()
+        self._overlay = {}
+        self.version = next(_INDEX_VERSIONS)
+        self._signals = (
+            (layer.geometryChanged, self._onGeometryChanged),
+            (layer.featureAdded, self._onFeatureAdded),
+            (layer.featureDeleted, self._onFeatureDeleted),
+            (layer.attributeValueChanged, self._onAttributeValueChanged),
+            (layer.afterCommitChanges, self.invalidate),
+            (layer.afterRollBack, self.invalidate),
+            (layer.willBeDeleted, self.disconnect),
+        )
+        for signal, handler in self._signals:
+            signal.connect(handler)
+
+    def matches(self, layer, id_fieldname):
+        return self.layer is layer and self.id_fieldname == id_fieldname
+
+    def disconnect(self):
+        for signal, handler in self._signals:
+            try:
+                signal.disconnect(handler)
+            except Exception:
+                pass
+        self.invalidate()
+        self.layer = None
+
+    def invalidate(self):
+        self.version = next(_INDEX_VERSIONS)
+        self._tree = None
+        self._removed = set()
+        self._overlay = {}
+
+    def _build(self):
+        id_index = self.layer.fields().indexOf(self.id_fieldname)
+        request = QgsFeatureRequest().setSubsetOfAttributes([id_index])
+        request.setInvalidGeometryCheck(QgsFeatureRequest.GeometryNoCheck)
+        fids = []
+        ids = []
+        wkbs = []
+        for feature in self.layer.getFeatures(request):
+            fids.append(feature.id())
+            ids.append(feature.attribute(id_index))
+            wkbs.append(geom_qgis_to_wkb(feature.geometry()))
+        geoms = from_wkb(np.asarray(wkbs, dtype=object))
+        geoms = force_2d(make_valid_where_invalid(geoms))
+        prepare(geoms)
+        self._fids = fids
+        self._ids = ids
+        self._geoms = geoms
+        self._fid_index = {fid: i for i, fid in enumerate(fids)}
+        self._tree = STRtree(geoms)
+        self._removed = set()
+        self._overlay = {}
+
+    def _read_feature(self, fid):
+        feature = self.layer.getFeature(fid)
+        if not feature.isValid():
+            return None
+        geoms = from_wkb(
+            np.asarray([geom_qgis_to_wkb(feature.geometry())], dtype=object)
+        )
+        geom = force_2d(make_valid_where_invalid(geoms))[0]
+        if geom is not None:
+            prepare(geom)
+        return feature.attribute(self.id_fieldname), geom
+
+    def _update(self, fid):
+        self.version = next(_INDEX_VERSIONS)
+        if self._tree is None:
+            return
+        self._removed.add(fid)
+        self._overlay.pop(fid, None)
+        entry = self._read_feature(fid)
+        if entry is not None:
+            self._overlay[fid] = entry
+        if len(self._removed) > self.REBUILD_THRESHOLD:
+            self._tree = None
+
+    def _onGeometryChanged(self, fid, geometry):
+        self._update(fid)
+
+    def _onFeatureAdded(self, fid):
+        self._update(fid)
+
+    def _onFeatureDeleted(self, fid):
+        self.version = next(_INDEX_VERSIONS)
+        if self._tree is None:
+            return
+        self._removed.add(fid)
+        self._overlay.pop(fid, None)
+
+    def _onAttributeValueChanged(self, fid, index, value):
+        if index == self.layer.fields().indexOf(self.id_fieldname):
+            self._update(fid)
+
+    def query(self, geometry, distance):
+        """
+        Returns {reference_id: geometry} of the reference features within the distance
+        of the (Shapely) geometry
+        """
+        if self._tree is None:
+            self._build()
+        result = {}
+        for i in self._tree.query(geometry, predicate="dwithin", distance=distance):
+            if self._fids[i] not in self._removed:
+                result[self._ids[i]] = self._geoms[i]
+        for ref_id, geom in self._overlay.values():
+            if geom is not None and dwithin(geom, geometry, distance):
+                result[ref_id] = geom
+        return result
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed result store for incremental re-runs of AutocorrectBorders.
+
+The results (GeoJSON features) of each thematic feature are stored in a SQLite-store
+in the workfolder, keyed by a hash of:
+
+* the thematic id and geometry
+* the reference features within the search distance of the thematic geometry
+* a fingerprint of the run: processor and aligner parameters, relevant distance(s),
+  prediction settings, CRS and brdr version
+
+On a re-run, features with an unchanged key take their stored results; only changed
+or new features are aligned. The original attributes are not stored: they are added
+to all output features at the end of the run.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from dataclasses import asdict, is_dataclass
+from datetime import date, datetime
+from enum import Enum
+
+import numpy as np
+from brdr import __version__ as brdr_version
+from brdr.geometry_utils import from_crs
+from shapely import STRtree, normalize, to_wkb
+
+RESULT_STORE_FILENAME = "brdrq_result_store.sqlite"
+RESULT_STORE_FORMAT = 2  # increase when the stored content changes
+RESULT_STORE_MAX_AGE = 90 * 24 * 60 * 60  # seconds a stored result is kept unused
+
+
+def _config_to_dict(config):
+    if config is None:
+        return None
+    if is_dataclass(config):
+        return asdict(config)
+    return dict(vars(config))
+
+
+def get_run_fingerprint(processor, aligner_config, crs, **parameters):
+    """
+    Returns a hash of all run-parameters that influence the result of a feature
+    """
+    fingerprint = {
+        "format": RESULT_STORE_FORMAT,
+        "brdr_version": brdr_version,
+        "processor": type(processor).__name__,
+        "processor_config": _config_to_dict(processor.config),
+        "aligner_config": _config_to_dict(aligner_config),
+        "crs": str(crs),
+        **parameters,
+    }
+    fingerprint = json.dumps(fingerprint, sort_keys=True, default=str)
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def _to_json_value(value):
+    """
+    JSON-default for the stored results: NumPy-values as Python-values, enums as their
+    value and dates as a tagged ISO-string (restored by _from_json_object)
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"Result value of type {type(value).__name__} can not be stored")
+
+
+def _from_json_object(obj):
+    if len(obj) == 1:
+        if "__datetime__" in obj:
+            return datetime.fromisoformat(obj["__datetime__"])
+        if "__date__" in obj:
+            return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def _geometry_digest(geom):
+    if geom is None:
+        return b""
+    return to_wkb(normalize(geom), hex=False, output_dimension=2)
+
+
+def get_feature_keys(dict_thematic, dict_reference, distance, fingerprint):
+    """
+    Returns {thematic_id: key}. The key is a hash of the run-fingerprint, the
+    thematic id and geometry, and the reference features within the distance.
+    """
+    reference_ids = list(dict_reference.keys())
+    reference_geoms = np.asarray(list(dict_reference.values()), dtype=object)
+    reference_digests = [
+        hashlib.sha256(
+            json.dumps(ref_id, default=str).encode("utf-8") + _geometry_digest(geom)
+        ).digest()
+        for ref_id, geom in zip(reference_ids, reference_geoms)
+    ]
+    thematic_ids = list(dict_thematic.keys())
+    thematic_geoms = np.asarray(list(dict_thematic.values()), dtype=object)
+    hits = [[] for _ in thematic_ids]
+    if len(reference_geoms) > 0 and len(thematic_geoms) > 0:
+        for i, j in zip(
+            *STRtree(reference_geoms).query(
+                thematic_geoms, predicate="dwithin", distance=distance
+            )
+        ):
+            hits[i].append(reference_digests[j])
+    keys = {}
+    for thematic_id, geom, reference_hits in zip(thematic_ids, thematic_geoms, hits):
+        h = hashlib.sha256(fingerprint.encode("utf-8"))
+        h.update(json.dumps(thematic_id, default=str).encode("utf-8"))
+        h.update(_geometry_digest(geom))
+        for digest in sorted(reference_hits):
+            h.update(digest)
+        keys[thematic_id] = h.hexdigest()
+    return keys
+
+
+def stored_to_featurecollections(dict_stored, crs):
+    """
+    Converts the stored results ({thematic_id: {name: [features]}}) to a dictionary of
+    GeoJSON featurecollections {name: featurecollection}
+    """
+    crs_geojson = {"type": "name", "properties": {"name": from_crs(crs)}}
+    fcs = {}
+    for stored in dict_stored.values():
+        for name, features in stored.items():
+            if name not in fcs:
+                fcs[name] = {
+                    "type": "FeatureCollection",
+                    "features": [],
+                    "crs": crs_geojson,
+                }
+            fcs[name]["features"].extend(features)
+    return fcs
+
+
+def add_original_attributes(fcs, dict_thematic_properties, id_field):
+    """
+    Adds the (actual) original attributes to the features of the featurecollections,
+    like brdr does with 'add_original_attributes'
+    """
+    for fc in fcs.values():
+        for feature in fc["features"]:
+            attributes = dict_thematic_properties.get(
+                feature["properties"].get(id_field)
+            )
+            if attributes:
+                properties = dict(attributes)
+                properties.update(feature["properties"])
+                feature["properties"] = properties
+    return fcs
+
+
+class ResultStore:
+    """
+    SQLite-store with the GeoJSON results per feature-key
+    """
+
+    def __init__(self, path, max_age=RESULT_STORE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    features TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, keys):
+        """
+        Returns the stored results of the keys ({thematic_id: key}) that are in the
+        store, as {thematic_id: {name: [features]}}
+        """
+        ids_by_key = {key: thematic_id for thematic_id, key in keys.items()}
+        key_list = list(ids_by_key.keys())
+        result = {}
+        with self._connect() as conn:
+            # query in chunks to stay below the SQLite variable limit
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start : start + 500]
+                for key, features in conn.execute(
+                    "SELECT key, features FROM results WHERE key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                ):
+                    result[ids_by_key[key]] = json.loads(
+                        features, object_hook=_from_json_object
+                    )
+            conn.executemany(
+                "UPDATE results SET last_used = ? WHERE key = ?",
+                [(time.time(), keys[thematic_id]) for thematic_id in result],
+            )
+        return result
+
+    def put(self, keys, fcs, id_field):
+        """
+        Stores the features of the featurecollections ({name: featurecollection})
+        under the key of their thematic id. Thematic ids without features (no result)
+        are stored as empty.
+        """
+        stored = {thematic_id: {} for thematic_id in keys}
+        for name, fc in fcs.items():
+            for feature in fc["features"]:
+                thematic_id = feature["properties"].get(id_field)
+                if thematic_id in stored:
+                    stored[thematic_id].setdefault(name, []).append(feature)
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                [
+                    (
+                        keys[thematic_id],
+                        json.dumps(features, default=_to_json_value),
+                        now,
+                    )
+                    for thematic_id, features in stored.items()
+                ],
+            )
+
+    def prune(self):
+        """
+        Removes the results that are not used for longer than the maximum age.
+        Returns the number of removed results.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM results WHERE last_used < ?",
+                (time.time() - self.max_age,),
+            ).rowcount
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
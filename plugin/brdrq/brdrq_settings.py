@@ -79,6 +79,9 @@ class brdrQSettings(QtWidgets.QDialog, FORM_CLASS):
         self.reference_layer = None
         self.max_rel_dist = None
         self.metadata = None
+        self.adaptive_sweep = None
+        self.prediction_cache_memory = None
+        self.prefetch_count = None
         self.full_strategy = None
         self.processor = None
         self.partial_snapping = None
@@ -283,6 +286,29 @@ class brdrQSettings(QtWidgets.QDialog, FORM_CLASS):
             self.checkBox_metadata.setChecked(self.metadata)
         self.metadata = self.checkBox_metadata.isChecked()
 
+        if self.adaptive_sweep is None:
+            self.adaptive_sweep = bool(
+                read_setting(
+                    self.prefix,
+                    "adaptive_sweep",
+                    False,
+                )
+            )
+            self.checkBox_adaptive_sweep.setChecked(self.adaptive_sweep)
+        self.adaptive_sweep = self.checkBox_adaptive_sweep.isChecked()
+
+        if self.prediction_cache_memory is None:
+            self.prediction_cache_memory = int(
+                read_setting(self.prefix, "prediction_cache_memory", 256)
+            )
+            self.spinBox_prediction_cache.setValue(self.prediction_cache_memory)
+        self.prediction_cache_memory = self.spinBox_prediction_cache.value()
+
+        if self.prefetch_count is None:
+            self.prefetch_count = int(read_setting(self.prefix, "prefetch_count", 3))
+            self.spinBox_prefetch.setValue(self.prefetch_count)
+        self.prefetch_count = self.spinBox_prefetch.value()
+
         # if self.partial_snapping is None:
         #     self.partial_snapping = int(s.value("brdrq/partial_snapping", 0))
         #     self.checkBox_partial_snapping.setCheckState(
@@ -318,6 +344,11 @@ class brdrQSettings(QtWidgets.QDialog, FORM_CLASS):
         write_setting(self.prefix, "reference_id", self.reference_id)
         write_setting(self.prefix, "max_rel_dist", self.max_rel_dist)
         write_setting(self.prefix, "metadata", self.metadata)
+        write_setting(self.prefix, "adaptive_sweep", self.adaptive_sweep)
+        write_setting(
+            self.prefix, "prediction_cache_memory", self.prediction_cache_memory
+        )
+        write_setting(self.prefix, "prefetch_count", self.prefetch_count)
         write_setting(self.prefix, "full_strategy", self.full_strategy.name)
         write_setting(self.prefix, "processor", self.processor.name)
         write_setting(
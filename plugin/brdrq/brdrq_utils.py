@@ -1,19 +1,20 @@
-import copy
 import json
 import os
-import re
 from enum import Enum
 from pathlib import Path
 
 from brdr.be.grb.enums import GRBType
 from brdr.constants import (
+    DEFAULT_CRS,
     SYMMETRICAL_AREA_CHANGE,
     SYMMETRICAL_AREA_PERCENTAGE_CHANGE,
     METADATA_FIELD_NAME,
     STABILITY,
     ID_THEME_FIELD_NAME,
     EVALUATION_FIELD_NAME,
+    RELEVANT_DISTANCE_FIELD_NAME,
 )
+from brdr.geometry_utils import to_crs
 from brdr.nl.enums import BRKType
 from brdr.processor import (
     AlignerGeometryProcessor,
@@ -22,9 +23,6 @@ from brdr.processor import (
     SnapGeometryProcessor,
     TopologyProcessor,
 )
-from brdr.utils import (
-    write_featurecollection_to_geopackage,
-)
 from qgis.PyQt.QtGui import QColor, QPainter
 from qgis.core import Qgis
 from qgis.core import (
@@ -72,8 +70,9 @@ from brdr.enums import (
 from brdr.typings import ProcessResult
 
 from qgis.PyQt.QtCore import pyqtSignal
-from qgis import processing
-from qgis.core import QgsField, QgsFeatureRequest, QgsProcessing
+from qgis.core import QgsField, QgsFeatureRequest
+from qgis.core import QgsFeature, QgsFeatureSink, QgsFields
+from qgis.core import QgsMemoryProviderUtils, QgsProcessingUtils
 from qgis.core import QgsProcessingParameterFolderDestination
 from qgis.core import QgsGeometry
 from qgis.core import (
@@ -87,14 +86,31 @@ from qgis.core import (
 )
 from qgis.core import QgsStyle
 from qgis.utils import iface
-from shapely import to_wkt, from_wkt, make_valid
+import numpy as np
+from shapely import from_wkb, to_wkb, make_valid, is_valid, is_missing
+from shapely import buffer, force_2d, get_dimensions, get_parts, get_type_id, union_all
 from .qt_compat import (
     is_return_or_enter_key,
     map_mouse_event_pos,
     map_mouse_event_xy,
+    qgs_field_type_bool,
+    qgs_field_type_bytearray,
     qgs_field_type_double,
+    qgs_field_type_longlong,
     qgs_field_type_string,
 )
+from .brdrq_columns import (
+    featurecollection_to_columns,
+    get_column_type,
+    split_by_geometry_type,
+)
+from .brdrq_output_store import OutputStore
+from .brdrq_classification import (
+    NOT_CHANGED_AREA,
+    REVIEW_PERCENTAGE,
+    STATE_TO_UPDATE,
+    classify_results,
+)
 
 GPKG_FILENAME = "brdrq.gpkg"
 
@@ -192,7 +208,10 @@ ENUM_PROCESSOR_OPTIONS = [
     e.name for e in Processor
 ]  # list with all processing-algorithm-options
 
+BRDRQ_ORIGINAL_WKB_FIELDNAME = "brdrq_original_wkb"
+# WKT-field with the original geometry in correction layers of earlier versions
 BRDRQ_ORIGINAL_WKT_FIELDNAME = "brdrq_original_wkt"
+BRDRQ_ORIGINAL_FIELDNAMES = (BRDRQ_ORIGINAL_WKB_FIELDNAME, BRDRQ_ORIGINAL_WKT_FIELDNAME)
 BRDRQ_STATE_FIELDNAME = "brdrq_state"
 
 
@@ -209,6 +228,15 @@ class BrdrQState(str, Enum):
     NONE = "none"
 
 
+# BrdrQState per state code of brdrq_classification
+_STATE_BY_CODE = [
+    BrdrQState.NONE,
+    BrdrQState.NOT_CHANGED,
+    BrdrQState.AUTO_UPDATED,
+    BrdrQState.TO_REVIEW,
+    BrdrQState.TO_UPDATE,
+]
+
 def get_processor_by_id(processor_id, config):
     """
     Function that returns a Processor, based on the ID
@@ -449,9 +477,25 @@ def geom_shapely_to_qgis(geom_shapely):
     """
     Method to convert a Shapely-geometry to a QGIS geometry
     """
-    wkt = to_wkt(make_valid(geom_shapely), rounding_precision=-1, output_dimension=2)
-    geom_qgis = QgsGeometry.fromWkt(wkt)
-    return geom_qgis
+    return geoms_shapely_to_qgis([geom_shapely])[0]
+
+
+def geoms_shapely_to_qgis(geoms_shapely, repair=True):
+    """
+    Batched conversion of Shapely-geometries to QGIS-geometries (based on WKB).
+    Invalid geometries are repaired (if repair=True); None-geometries result in a
+    null QgsGeometry
+    """
+    geoms = geoms_shapely
+    if repair:
+        geoms = make_valid_where_invalid(geoms_shapely)
+    geoms_qgis = []
+    for wkb in to_wkb(geoms, output_dimension=2):
+        geom_qgis = QgsGeometry()
+        if wkb is not None:
+            geom_qgis.fromWkb(wkb)
+        geoms_qgis.append(geom_qgis)
+    return geoms_qgis
 
 
 def remove_group_layer(group_layer_name):
@@ -472,11 +516,53 @@ def geom_qgis_to_shapely(geom_qgis):
     """
     Method to convert a QGIS-geometry to a Shapely-geometry
     """
-    if geom_qgis.isNull() or geom_qgis.isEmpty():
+    return wkbs_to_shapely([geom_qgis_to_wkb(geom_qgis)])[0]
+
+
+def geom_qgis_to_wkb(geom_qgis):
+    """
+    Returns the WKB (bytes) of a QGIS-geometry, or None for null/empty geometries.
+    Curved geometries are segmentized as they are not supported by Shapely.
+    """
+    if geom_qgis is None or geom_qgis.isNull() or geom_qgis.isEmpty():
         return None
-    wkt = geom_qgis.asWkt()
-    geom_shapely = from_wkt(wkt)
-    return make_valid(geom_shapely)
+    if QgsWkbTypes.isCurvedType(geom_qgis.wkbType()):
+        geom_qgis = QgsGeometry(geom_qgis.constGet().segmentize())
+    return bytes(geom_qgis.asWkb())
+
+
+def wkbs_to_shapely(wkbs):
+    """
+    Batched conversion of a list of WKB (bytes or None) to a numpy-array of
+    Shapely-geometries. Only the invalid geometries are repaired.
+    """
+    geoms = from_wkb(np.asarray(wkbs, dtype=object))
+    return make_valid_where_invalid(geoms)
+
+
+def geoms_qgis_to_shapely(geoms_qgis):
+    """
+    Batched conversion of QGIS-geometries to a list of Shapely-geometries.
+    Null/empty geometries are returned as None.
+    """
+    return list(wkbs_to_shapely([geom_qgis_to_wkb(g) for g in geoms_qgis]))
+
+
+def make_valid_where_invalid(geoms):
+    """
+    Vectorized validity check on a sequence of Shapely-geometries: make_valid is
+    only executed on the invalid geometries. Returns a (copied) numpy-array.
+    The geometries are repaired with the 'structure'-method, like
+    native:fixgeometries (METHOD=1); collapsed parts are dropped.
+    """
+    geoms_array = np.empty(len(geoms), dtype=object)
+    geoms_array[:] = list(geoms)
+    invalid = ~is_valid(geoms_array) & ~is_missing(geoms_array)
+    if invalid.any():
+        geoms_array[invalid] = make_valid(
+            geoms_array[invalid], method="structure", keep_collapsed=False
+        )
+    return geoms_array
 
 
 def add_field_to_layer(layer, fieldname, fieldtype, default_value):
@@ -727,7 +813,6 @@ def gpkg_layer_to_map(name, gpkg_path, layer_name, symbol, visible, group):
 
     # 1. Bestaande lagen met dezelfde naam verwijderen uit de TOC
     lyrs = qinst.mapLayersByName(name)
-    root = qinst.layerTreeRoot()
     for lyr in lyrs:
         qinst.removeMapLayer(lyr.id())
 
@@ -742,6 +827,16 @@ def gpkg_layer_to_map(name, gpkg_path, layer_name, symbol, visible, group):
         print(f"Fout: Laag {layer_name} kon niet worden geladen uit {gpkg_path}")
         return None
 
+    return _add_layer_to_map(vl, symbol, visible, group)
+
+
+def _add_layer_to_map(vl, symbol, visible, group):
+    """
+    Stijlt een laag en voegt ze toe aan de TOC, in de gegeven groep.
+    """
+    qinst = QgsProject.instance()
+    root = qinst.layerTreeRoot()
+
     # 4. Styling (overgenomen uit je originele code)
     if symbol is not None:
         # Let op: get_symbol moet nu werken op de 'vl' of metadata,
@@ -772,90 +867,324 @@ def gpkg_layer_to_map(name, gpkg_path, layer_name, symbol, visible, group):
 
 
 
+COLUMNS_BATCH_SIZE = 1000  # features per addFeatures-call when writing columns
+
+
+def columns_to_fields(columns):
+    """
+    QgsFields for columns {fieldname: values}, with the field type derived from the
+    values (bool, integer, double or string)
+    """
+    field_types = {
+        "bool": qgs_field_type_bool,
+        "int": qgs_field_type_longlong,
+        "float": qgs_field_type_double,
+        "string": qgs_field_type_string,
+    }
+    fields = QgsFields()
+    for fieldname, values in columns.items():
+        fields.append(QgsField(fieldname, field_types[get_column_type(values)]()))
+    return fields
+
+
+def _to_python_value(value):
+    """
+    Attribute value of a QgsFeature with NULL (a null-QVariant in older QGIS-versions)
+    as None
+    """
+    if value is None or (hasattr(value, "isNull") and value.isNull()):
+        return None
+    return value
+
+
+def _to_attribute_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def columns_to_features(fields, geometries, columns, start=0, end=None):
+    """
+    QgsFeatures for the rows start:end of columns (a geometry-array and
+    {fieldname: values}); the Shapely-geometries are converted via WKB
+    """
+    if end is None:
+        end = len(geometries)
+    values = [columns[field.name()] for field in fields]
+    geoms_qgis = geoms_shapely_to_qgis(geometries[start:end], repair=False)
+    features = []
+    for i, geom_qgis in zip(range(start, end), geoms_qgis):
+        feature = QgsFeature(fields)
+        feature.setGeometry(geom_qgis)
+        feature.setAttributes([_to_attribute_value(v[i]) for v in values])
+        features.append(feature)
+    return features
+
+
+def write_columns_to_sink(
+    sink, fields, geometries, columns, batch_size=COLUMNS_BATCH_SIZE
+):
+    """
+    Bulk-inserts columns (a geometry-array and {fieldname: values}) in a
+    QgsFeatureSink (layer dataprovider, QgsVectorFileWriter or processing-sink).
+    The Shapely-geometries are converted per batch via WKB and added with one
+    addFeatures-call per batch. Returns the number of written features.
+    """
+    count = len(geometries)
+    for start in range(0, count, batch_size):
+        end = min(start + batch_size, count)
+        features = columns_to_features(fields, geometries, columns, start, end)
+        if not sink.addFeatures(features, QgsFeatureSink.FastInsert):
+            raise QgsProcessingException(
+                f"Features could not be written: {sink.lastError()}"
+            )
+    return count
+
+
+def to_qgs_crs(crs):
+    """
+    Converts a crs (pyproj CRS, authid, urn or uri; default: DEFAULT_CRS of brdr) to a
+    QgsCoordinateReferenceSystem
+    """
+    if crs is None or str(crs) == "NULL" or str(crs) == "":
+        crs = DEFAULT_CRS
+    crs = to_crs(crs)
+    authority = crs.to_authority()
+    if authority is not None:
+        return QgsCoordinateReferenceSystem(f"{authority[0]}:{authority[1]}")
+    return QgsCoordinateReferenceSystem.fromWkt(crs.to_wkt())
+
+
+def open_output_store(folder, crs=None):
+    """
+    Opens the output store of a run: one new GeoPackage (brdrq_<timestamp>.gpkg) in the
+    folder for all result layers of the run, so layers of earlier runs that are still
+    open in QGIS are not overwritten. Use it as a context manager, so the GeoPackage is
+    closed after writing.
+    """
+    if folder is None or str(folder) == "NULL" or str(folder) == "":
+        folder = "tempfolder"
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
+    return OutputStore(os.path.join(folder, f"brdrq_{timestamp}.gpkg"), crs)
+
+
 def featurecollection_to_layer(
-    name, featurecollection, symbol, visible, group, tempfolder
+    name, featurecollection, symbol, visible, group, tempfolder, store=None
 ):
     """
     Add a featurecollection to a QGIS-layer to add it to the TOC. If featurecollection has multiple types (point,line, polygon) these types are added seperately.
     """
-    featurecollection = featurecollection_to_multi(featurecollection)
-    feature_types = get_geojson_type(featurecollection)
-    if len(feature_types) > 1:
-        for x in feature_types:
-            name_x = name + "_" + str(x)
-            geojson_x = filter_geojson_by_geometry_type(featurecollection, x)
-            featurecollection_to_layer(
-                name_x, geojson_x, symbol, visible, group, tempfolder
+    geometries, columns = featurecollection_to_columns(featurecollection)
+    crs = featurecollection.get("crs", {}).get("properties", {}).get("name")
+    return columns_to_layer(
+        name, geometries, columns, crs, symbol, visible, group, tempfolder, store
+    )
+
+
+def columns_to_layer(
+    name, geometries, columns, crs, symbol, visible, group, tempfolder, store=None
+):
+    """
+    Add columnar results (a geometry-array and {fieldname: values}, cfr.
+    results_to_columns) to a QGIS-layer in the TOC, without building GeoJSON-features.
+    If there are multiple geometry-types, these types are added seperately.
+    The layer is written to the output store of the run (see open_output_store); when
+    no store is given, the store in the tempfolder is opened for this layer.
+    """
+    if store is None:
+        with open_output_store(tempfolder, crs) as store:
+            return columns_to_layer(
+                name, geometries, columns, crs, symbol, visible, group, tempfolder, store
+            )
+    parts = split_by_geometry_type(geometries, columns)
+    if len(parts) > 1:
+        for geometry_type, geometries_x, columns_x in parts:
+            columns_to_layer(
+                name + "_" + geometry_type,
+                geometries_x,
+                columns_x,
+                crs,
+                symbol,
+                visible,
+                group,
+                tempfolder,
+                store,
             )
         return
+    geometry_type, geometries, columns = parts[0]
+    if geometry_type is None:
+        geometry_type = "MultiPolygon"
 
     qinst = QgsProject.instance()
-    lyrs = qinst.mapLayersByName(name)
-    root = qinst.layerTreeRoot()
-
-    if len(lyrs) != 0:
-        for lyr in lyrs:
-            root.removeLayer(lyr)
-            qinst.removeMapLayer(lyr.id())
-    if tempfolder is None or str(tempfolder) == "NULL" or str(tempfolder) == "":
-        tempfolder = "tempfolder"
-    # Use one GPKG per layer to avoid pyogrio overwrite races on a shared file.
-    safe_layer_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name)).strip("._")
-    if not safe_layer_name:
-        safe_layer_name = "layer"
-    gpkg_path = os.path.join(tempfolder, f"{safe_layer_name}.gpkg")
-    write_featurecollection_to_geopackage(gpkg_path, featurecollection, layer_name=name)
-
-    uri = f"{gpkg_path}|layername={name}"
+    for lyr in qinst.mapLayersByName(name):
+        qinst.removeMapLayer(lyr.id())
+    store.write_layer(
+        name,
+        geometry_type,
+        geometries,
+        columns,
+        crs,
+        index_fields=[ID_THEME_FIELD_NAME],
+    )
 
-    # 3. Maak de laag aan
-    vl = QgsVectorLayer(uri, name, "ogr")
-    # styling
     if symbol is not None and isinstance(symbol, str):
-        symbol = get_symbol(featurecollection, symbol)
-    if (
-        symbol is not None and
-        vl.renderer() is not None and
-        isinstance(symbol, QgsSymbol)
-    ):
-        vl.renderer().setSymbol(symbol)
-    # vl.setOpacity(0.5)
+        symbol = get_symbol({"type": geometry_type}, symbol)
+    return gpkg_layer_to_map(name, store.path, name, symbol, visible, group)
 
-    # adding layer to TOC
-    qinst.addMapLayer(
-        vl, False
-    )  # False so that it doesn't get inserted at default position
 
-    root.insertLayer(0, vl)
+class ScrubLayer:
+    """
+    Memory-layer in the TOC that shows the features of one relevant distance. The
+    features of all relevant distances are built once, so switching the distance only
+    swaps the features of the memory-provider, without requerying a file-provider.
+    The layer can be reused for the results of a next feature (see set_features).
+    """
 
-    moved_node, _ = move_to_group(vl, group)
-    if moved_node is not None and hasattr(moved_node, "setItemVisibilityChecked"):
-        moved_node.setItemVisibilityChecked(bool(visible))
+    def __init__(self, layer, features_by_distance, crs=None):
+        self.layer = layer
+        self.features_by_distance = features_by_distance
+        self.crs = crs
+        self.relevant_distance = None
 
-    vl.triggerRepaint()
-    if iface is not None:
-        iface.layerTreeView().refreshLayerSymbology(vl.id())
-    return vl
+    def is_in_project(self):
+        try:
+            layer_id = self.layer.id()
+        except RuntimeError:
+            # C++-object of the layer is already deleted
+            return False
+        return QgsProject.instance().mapLayer(layer_id) is not None
+
+    def add_missing_fields(self, fields):
+        """
+        Adds the fields that are not yet in the layer
+        """
+        missing = [
+            field
+            for field in fields
+            if self.layer.fields().indexFromName(field.name()) == -1
+        ]
+        if missing:
+            self.layer.dataProvider().addAttributes(missing)
+            self.layer.updateFields()
+
+    def set_features(self, features_by_distance):
+        """
+        Replaces the features of all relevant distances; the layer is emptied until a
+        distance is shown. The layer tree node, renderer and filter are kept.
+        """
+        self.features_by_distance = features_by_distance
+        self.relevant_distance = None
+        self.layer.dataProvider().truncate()
+        self.layer.triggerRepaint()
+
+    def show_distance(self, relevant_distance):
+        """
+        Shows the features of the relevant distance (no features when there is no
+        result for this distance). Returns False when the layer is removed.
+        """
+        if not self.is_in_project():
+            return False
+        if relevant_distance == self.relevant_distance:
+            return True
+        provider = self.layer.dataProvider()
+        provider.truncate()
+        provider.addFeatures(self.features_by_distance.get(relevant_distance, []))
+        self.relevant_distance = relevant_distance
+        self.layer.triggerRepaint()
+        return True
+
+
+def featurecollection_to_scrub_layers(
+    name,
+    featurecollection,
+    crs,
+    symbol,
+    visible,
+    group,
+    decimals,
+    session_layers=None,
+):
+    """
+    Add a featurecollection with the results of multiple relevant distances as
+    memory-layer(s) to the TOC, to scrub through the relevant distances (see
+    ScrubLayer). The relevant distances are rounded to decimals. If the
+    featurecollection has multiple geometry-types, these types are added seperately.
+
+    session_layers ({layer_name: ScrubLayer}) holds the layers of a session: a layer
+    that is still in the project, with the same geometry-type and crs, is reused (its
+    features are replaced), so no layer is created, registered or moved in the layer
+    tree. New layers are added to session_layers.
+    Returns a list of ScrubLayers.
+    """
+    if session_layers is None:
+        session_layers = {}
+    geometries, columns = featurecollection_to_columns(featurecollection)
+    parts = split_by_geometry_type(geometries, columns)
+    scrub_layers = []
+    for geometry_type, geometries_x, columns_x in parts:
+        layer_name = name if len(parts) == 1 else name + "_" + geometry_type
+        if geometry_type is None:
+            geometry_type = "MultiPolygon"
+        wkb_type = QgsWkbTypes.parseType(geometry_type)
+        fields = columns_to_fields(columns_x)
+        scrub_layer = session_layers.get(layer_name)
+        if (
+            scrub_layer is not None and
+            scrub_layer.is_in_project() and
+            scrub_layer.layer.wkbType() == wkb_type and
+            scrub_layer.crs == crs
+        ):
+            scrub_layer.add_missing_fields(fields)
+        else:
+            qinst = QgsProject.instance()
+            for lyr in qinst.mapLayersByName(layer_name):
+                qinst.removeMapLayer(lyr.id())
+            layer = QgsMemoryProviderUtils.createMemoryLayer(
+                layer_name, fields, wkb_type, to_qgs_crs(crs)
+            )
+            layer_symbol = symbol
+            if isinstance(symbol, str):
+                layer_symbol = get_symbol({"type": geometry_type}, symbol)
+            _add_layer_to_map(layer, layer_symbol, visible, group)
+            scrub_layer = ScrubLayer(layer, {}, crs)
+            session_layers[layer_name] = scrub_layer
+
+        # features with the fields of the (reused) layer
+        fields = scrub_layer.layer.fields()
+        count = len(geometries_x)
+        columns_x = {
+            field.name(): columns_x.get(field.name(), [None] * count) for field in fields
+        }
+        features_by_distance = {}
+        distances = columns_x.get(RELEVANT_DISTANCE_FIELD_NAME, [])
+        for distance, feature in zip(
+            distances, columns_to_features(fields, geometries_x, columns_x)
+        ):
+            features_by_distance.setdefault(
+                round(float(distance), decimals), []
+            ).append(feature)
+        scrub_layer.set_features(features_by_distance)
+        scrub_layers.append(scrub_layer)
+    return scrub_layers
 
 
 def filter_geojson_by_geometry_type(input_geojson, geometry_type):
     """
-    Filter features in a GeoJSON file by geometry type and save to a new file.
+    Filter features in a GeoJSON featurecollection by geometry type. The features are
+    not copied: the returned featurecollection refers to the same feature-dicts.
 
     Parameters:
-    - input_geojson: str, path to the input GeoJSON file
+    - input_geojson: dict, the GeoJSON featurecollection
     - geometry_type: str, e.g. 'Point', 'LineString', 'Polygon'
     """
-
-    # Filter features by geometry type
-    filtered_features = [
+    output_geojson = dict(input_geojson)
+    output_geojson["features"] = [
         feature
         for feature in input_geojson.get("features", [])
-        if feature.get("geometry", {}).get("type") == geometry_type
+        if (feature.get("geometry") or {}).get("type") == geometry_type
     ]
-    output_geojson = copy.deepcopy(input_geojson)
-    output_geojson["features"] = filtered_features
-    # Create new GeoJSON structure
     return output_geojson
 
 
@@ -1162,17 +1491,45 @@ def _processresult_to_dicts(processresult):
     )
 
 
-def get_original_geometry(feature, fieldname):
+def get_original_geometry(feature, fieldnames=BRDRQ_ORIGINAL_FIELDNAMES):
     """
-    Tries to read the original wkt string form a feature (if exists). Else the feature-geometry is returned
+    Reads the original geometry of a feature of a correction layer: from the WKB-field
+    (read without parsing text), or from the WKT-field of correction layers of earlier
+    versions. Returns None when the feature has no original geometry.
     """
-    original_geometry = None
-    try:
-        if fieldname in feature.fields().names():
-            original_geometry = QgsGeometry.fromWkt(feature[fieldname])
-    except:
-        original_geometry = None
-    return original_geometry
+    if isinstance(fieldnames, str):
+        fieldnames = [fieldnames]
+    names = feature.fields().names()
+    for fieldname in fieldnames:
+        if fieldname not in names:
+            continue
+        try:
+            value = feature[fieldname]
+            if not value:
+                continue
+            if isinstance(value, str):
+                original_geometry = QgsGeometry.fromWkt(value)
+            else:
+                original_geometry = QgsGeometry()
+                original_geometry.fromWkb(value)
+        except:
+            continue
+        if not original_geometry.isNull():
+            return original_geometry
+    return None
+
+
+def get_original_geometry_attribute(layer, geometry):
+    """
+    Returns (field index, value) to store the original geometry in a correction layer:
+    WKB, or WKT for correction layers of earlier versions. The index is -1 when the
+    layer has no field for the original geometry.
+    """
+    ix = layer.fields().indexOf(BRDRQ_ORIGINAL_WKB_FIELDNAME)
+    if ix >= 0:
+        return ix, geometry.asWkb()
+    ix = layer.fields().indexOf(BRDRQ_ORIGINAL_WKT_FIELDNAME)
+    return ix, geometry.asWkt() if ix >= 0 else None
 
 
 def save_layer_to_gpkg(layer, gpkg_path, layer_name=None):
@@ -1213,8 +1570,9 @@ def generate_correction_layer(
     correction_layer_name,
     id_theme_brdrq_fieldname,
     workfolder,
-    review_percentage=5,
+    review_percentage=REVIEW_PERCENTAGE,
     add_metadata=False,
+    not_changed_area=NOT_CHANGED_AREA,
 ):
 
     source_layer = input
@@ -1231,71 +1589,56 @@ def generate_correction_layer(
         res[2] + "|layername=" + res[3], correction_layer_name, "ogr"
     )
 
-    geom_type = correction_layer.geometryType()
-
-    # Make a dictionary with ID to geometry from the resultslayer
-    id_geom_map = {}
-    id_diff_index_map = {}
-    id_diff_perc_index_map = {}
-    id_metadata_map = {}
-    id_evaluation_map = {}
-    ids_to_review = []
-    ids_to_align = []
-    ids_not_changed = []
-    stability_field_available = False
-    if is_field_in_layer(STABILITY, results_layer):
-        stability_field_available = True
-    for feat in results_layer.getFeatures():
-        key = feat[ID_THEME_FIELD_NAME]
-        geom = feat.geometry()
-        if key in id_geom_map:
-            # when key not unique and multiple predictions, the last prediction is added to the list and the status is set to review
-            ids_to_review.append(key)
-        id_geom_map[key] = geom
-        if add_metadata:
-            id_metadata_map[key] = feat[METADATA_FIELD_NAME]
-        id_diff_index_map[key] = feat[SYMMETRICAL_AREA_CHANGE]
-        id_diff_perc_index_map[key] = feat[SYMMETRICAL_AREA_PERCENTAGE_CHANGE]
-        try:
-            evaluation = Evaluation(feat[EVALUATION_FIELD_NAME])
-        except:
-            evaluation = Evaluation.NOT_EVALUATED
-        id_evaluation_map[key] = evaluation
-        if evaluation == Evaluation.NO_CHANGE:
-            ids_not_changed.append(key)
-        elif evaluation in (
-            Evaluation.EQUALITY_BY_ID,
-            Evaluation.EQUALITY_BY_FULL_REFERENCE,
-            Evaluation.EQUALITY_BY_ID_AND_FULL_REFERENCE,
-        ):
-            pass
-        elif geom is None or geom.isEmpty():
-            ids_to_align.append(key)
-        elif (
-            geom_type != Qgis.GeometryType.Polygon and
-            stability_field_available and
-            not feat[STABILITY]
-        ):
-            ids_to_align.append(key)
-        elif (
-            geom_type != Qgis.GeometryType.Polygon and
-            stability_field_available and
-            feat[STABILITY]
-        ):
-            ids_to_review.append(key)
-        elif stability_field_available and not feat[STABILITY]:
-            ids_to_align.append(key)
-        elif feat[SYMMETRICAL_AREA_PERCENTAGE_CHANGE] > review_percentage:
-            ids_to_review.append(key)
-        elif feat[SYMMETRICAL_AREA_CHANGE] < 0.01:
-            ids_not_changed.append(key)
+    polygon = correction_layer.geometryType() == Qgis.GeometryType.Polygon
+
+    # Load the metrics of the resultslayer into columns
+    stability_field_available = is_field_in_layer(STABILITY, results_layer)
+    result_fieldnames = [
+        ID_THEME_FIELD_NAME,
+        EVALUATION_FIELD_NAME,
+        SYMMETRICAL_AREA_CHANGE,
+        SYMMETRICAL_AREA_PERCENTAGE_CHANGE,
+    ]
+    if stability_field_available:
+        result_fieldnames.append(STABILITY)
+    if add_metadata:
+        result_fieldnames.append(METADATA_FIELD_NAME)
+    request = QgsFeatureRequest().setSubsetOfAttributes(
+        result_fieldnames, results_layer.fields()
+    )
+    columns = {fieldname: [] for fieldname in result_fieldnames}
+    geometries = []
+    for feat in results_layer.getFeatures(request):
+        geometries.append(feat.geometry())
+        for fieldname, values in columns.items():
+            values.append(_to_python_value(feat[fieldname]))
+    evaluation_values = {e.value for e in Evaluation}
+    evaluations = [
+        e if e in evaluation_values else Evaluation.NOT_EVALUATED.value
+        for e in columns[EVALUATION_FIELD_NAME]
+    ]
+    ids, last_rows, states = classify_results(
+        columns[ID_THEME_FIELD_NAME],
+        evaluations,
+        columns[SYMMETRICAL_AREA_CHANGE],
+        columns[SYMMETRICAL_AREA_PERCENTAGE_CHANGE],
+        [g is None or g.isEmpty() for g in geometries],
+        stability=(
+            [bool(v) for v in columns[STABILITY]] if stability_field_available else None
+        ),
+        polygon=polygon,
+        review_percentage=review_percentage,
+        not_changed_area=not_changed_area,
+    )
+    id_index = {theme_id: i for i, theme_id in enumerate(ids)}
+    state_values = [str(s.value) for s in _STATE_BY_CODE]
 
     # 4. Update geometries in duplicated layer
     fields_to_add = [
         QgsField(METADATA_FIELD_NAME, qgs_field_type_string()),
         QgsField(EVALUATION_FIELD_NAME, qgs_field_type_string()),
         QgsField(BRDRQ_STATE_FIELDNAME, qgs_field_type_string()),
-        QgsField(BRDRQ_ORIGINAL_WKT_FIELDNAME, qgs_field_type_string()),
+        QgsField(BRDRQ_ORIGINAL_WKB_FIELDNAME, qgs_field_type_bytearray()),
         QgsField(SYMMETRICAL_AREA_CHANGE, qgs_field_type_double()),
         QgsField(SYMMETRICAL_AREA_PERCENTAGE_CHANGE, qgs_field_type_double()),
     ]
@@ -1318,7 +1661,7 @@ def generate_correction_layer(
         METADATA_FIELD_NAME: correction_layer.fields().indexFromName(METADATA_FIELD_NAME),
         EVALUATION_FIELD_NAME: correction_layer.fields().indexFromName(EVALUATION_FIELD_NAME),
         BRDRQ_STATE_FIELDNAME: correction_layer.fields().indexFromName(BRDRQ_STATE_FIELDNAME),
-        BRDRQ_ORIGINAL_WKT_FIELDNAME: correction_layer.fields().indexFromName(BRDRQ_ORIGINAL_WKT_FIELDNAME),
+        BRDRQ_ORIGINAL_WKB_FIELDNAME: correction_layer.fields().indexFromName(BRDRQ_ORIGINAL_WKB_FIELDNAME),
         SYMMETRICAL_AREA_CHANGE: correction_layer.fields().indexFromName(SYMMETRICAL_AREA_CHANGE),
         SYMMETRICAL_AREA_PERCENTAGE_CHANGE: correction_layer.fields().indexFromName(SYMMETRICAL_AREA_PERCENTAGE_CHANGE),
     }
@@ -1326,40 +1669,30 @@ def generate_correction_layer(
     attr_changes = {}
     geometry_changes = {}
     for feat in correction_layer.getFeatures():
-        theme_id = feat[id_theme_brdrq_fieldname]
-        provider_fid = feat.id()
-
-        state = str(BrdrQState.NONE.value)
-        diff_value = id_diff_index_map[theme_id]
-        diff_perc_value = id_diff_perc_index_map[theme_id]
-
-        if theme_id in id_geom_map and theme_id not in ids_to_align:
-            geometry_changes[provider_fid] = id_geom_map[theme_id]
-            state = str(BrdrQState.AUTO_UPDATED.value)
-        if theme_id in ids_not_changed:
-            state = str(BrdrQState.NOT_CHANGED.value)
-        if theme_id in ids_to_review:
-            state = str(BrdrQState.TO_REVIEW.value)
-        if theme_id in ids_to_align:
-            diff_value = -1
-            diff_perc_value = -1
-            state = str(BrdrQState.TO_UPDATE.value)
-
+        i = id_index.get(feat[id_theme_brdrq_fieldname])
         attrs = {
-            field_idx[EVALUATION_FIELD_NAME]: str(id_evaluation_map[theme_id].value),
-            field_idx[SYMMETRICAL_AREA_CHANGE]: diff_value,
-            field_idx[SYMMETRICAL_AREA_PERCENTAGE_CHANGE]: diff_perc_value,
-            field_idx[BRDRQ_ORIGINAL_WKT_FIELDNAME]: feat.geometry().asWkt(),
-            field_idx[BRDRQ_STATE_FIELDNAME]: state,
+            field_idx[BRDRQ_ORIGINAL_WKB_FIELDNAME]: feat.geometry().asWkb(),
+            field_idx[BRDRQ_STATE_FIELDNAME]: str(BrdrQState.NONE.value),
         }
-        if add_metadata:
-            attrs[field_idx[METADATA_FIELD_NAME]] = id_metadata_map[theme_id]
-        attr_changes[provider_fid] = attrs
-
-    provider = correction_layer.dataProvider()
-    provider.changeAttributeValues(attr_changes)
-    if geometry_changes:
-        provider.changeGeometryValues(geometry_changes)
+        if i is not None:
+            state = states[i]
+            row = last_rows[i]
+            if state == STATE_TO_UPDATE:
+                diff_value = diff_perc_value = -1
+            else:
+                geometry_changes[feat.id()] = geometries[row]
+                diff_value = columns[SYMMETRICAL_AREA_CHANGE][row]
+                diff_perc_value = columns[SYMMETRICAL_AREA_PERCENTAGE_CHANGE][row]
+            attrs[field_idx[EVALUATION_FIELD_NAME]] = evaluations[row]
+            attrs[field_idx[SYMMETRICAL_AREA_CHANGE]] = diff_value
+            attrs[field_idx[SYMMETRICAL_AREA_PERCENTAGE_CHANGE]] = diff_perc_value
+            attrs[field_idx[BRDRQ_STATE_FIELDNAME]] = state_values[state]
+            if add_metadata:
+                attrs[field_idx[METADATA_FIELD_NAME]] = columns[METADATA_FIELD_NAME][row]
+        attr_changes[feat.id()] = attrs
+
+    # one bulk update of the provider for the attributes and the geometries
+    correction_layer.dataProvider().changeFeatures(attr_changes, geometry_changes)
 
     style_outputlayer(correction_layer, BRDRQ_STATE_FIELDNAME)
     return correction_layer
@@ -1527,67 +1860,118 @@ def remove_empty_features_from_diff_layers(layers_to_filter):
             setFilterOnLayer(lyr, filter)
 
 
+def extract_geometries_by_dimension(geoms, dimension):
+    """
+    Repairing a geometry can result in a GeometryCollection with parts of a lower
+    dimension (f.e. a polygon with a collapsed line-part). Like native:fixgeometries,
+    only the parts with the given dimension (0=point, 1=line, 2=polygon) are kept.
+    Returns a numpy-array; geometries without matching parts become None.
+    """
+    geoms_array = np.empty(len(geoms), dtype=object)
+    geoms_array[:] = list(geoms)
+    mixed = (get_type_id(geoms_array) == 7) | (
+        ~is_missing(geoms_array) & (get_dimensions(geoms_array) != dimension)
+    )
+    for i in np.flatnonzero(mixed):
+        parts = get_parts(geoms_array[i])
+        parts = parts[get_dimensions(parts) == dimension]
+        geoms_array[i] = union_all(parts) if len(parts) > 0 else None
+    return geoms_array
+
+
+def get_geometry_dimension(wkb_type):
+    """
+    Returns the dimension (0=point, 1=line, 2=polygon) of a QGIS WKB-type, or None
+    """
+    return {
+        Qgis.GeometryType.Point: 0,
+        Qgis.GeometryType.Line: 1,
+        Qgis.GeometryType.Polygon: 2,
+    }.get(QgsWkbTypes.geometryType(wkb_type))
+
+
 def thematic_preparation(input_thematic_layer, relevant_distance, context, feedback):
-    input_thematic_name = "thematic_preparation"
-    outputs = {}
+    """
+    Fused preparation of the thematic input in a single pass over the features.
+    Repair (make_valid), dropping Z/M-values (force_2d) and buffering are executed
+    vectorized on the batched geometry-array, so no temporary layers are written
+    in between.
+
+    Returns a tuple with:
+    * thematic: memory-layer with the prepared (repaired, 2D) thematic features
+    * thematic_geoms: dictionary with the prepared Shapely-geometry for each
+      feature-id of 'thematic'
+    * thematic_buffered: numpy-array with the buffered (1.01 * relevant_distance)
+      footprint of the thematic features (None if relevant_distance is None)
+    * crs: authid of the CRS of the thematic input
+    """
     # THEMATIC PREPARATION
     context.setInvalidGeometryCheck(QgsFeatureRequest.GeometryNoCheck)
-
-    outputs[input_thematic_name + "_fixed"] = processing.run(
-        "native:fixgeometries",
-        {
-            "INPUT": input_thematic_layer,
-            "METHOD": 1,
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        },
-        context=context,
-        feedback=feedback,
-        is_child_algorithm=True,
-    )
-    thematic = context.getMapLayer(outputs[input_thematic_name + "_fixed"]["OUTPUT"])
+    source = QgsProcessingUtils.variantToSource(input_thematic_layer, context)
+    if source is None:
+        return None, None, None, None
     crs = (
-        thematic.sourceCrs().authid()
+        source.sourceCrs().authid()
     )  # set CRS for the calculations, based on the THEMATIC input layer
-    if crs is None or str(crs) == "NULL":
+    if crs is None or str(crs) == "NULL" or str(crs) == "":
         raise QgsProcessingException(
             "Thematic layer does not have a defined CRS attached to it. "
             "Please define a CRS to the Thematic layer, with units in meter (f.e. For Belgium in EPSG:31370 or EPSG:3812)"
         )
-    outputs[input_thematic_name + "_dropMZ"] = processing.run(
-        "native:dropmzvalues",
-        {
-            "INPUT": thematic,
-            "DROP_M_VALUES": True,
-            "DROP_Z_VALUES": True,
-            "OUTPUT": "TEMPORARY_OUTPUT",
-        },
-        context=context,
-        feedback=feedback,
-        is_child_algorithm=True,
-    )
-    thematic = context.getMapLayer(outputs[input_thematic_name + "_dropMZ"]["OUTPUT"])
-    # buffer the thematic layer to select all plots around it that are relevant to
-    # the calculations
-    outputs[input_thematic_name + "_buffered"] = processing.run(
-        "native:buffer",
-        {
-            "INPUT": thematic,
-            "DISTANCE": 1.01 * relevant_distance,
-            "SEGMENTS": 10,
-            "END_CAP_STYLE": 0,
-            "JOIN_STYLE": 1,
-            "MITRE_LIMIT": 10,
-            "DISSOLVE": False,
-            "OUTPUT": "TEMPORARY_OUTPUT",
-        },
-        context=context,
-        feedback=feedback,
-        is_child_algorithm=True,
+
+    features = []
+    wkbs = []
+    for feature in source.getFeatures():
+        if feedback.isCanceled():
+            break
+        wkbs.append(geom_qgis_to_wkb(feature.geometry()))
+        feature.clearGeometry()
+        features.append(feature)
+
+    # repair & drop Z/M-values
+    geoms = force_2d(wkbs_to_shapely(wkbs))
+    del wkbs
+    wkb_type = QgsWkbTypes.promoteNonPointTypesToMulti(
+        QgsWkbTypes.linearType(QgsWkbTypes.flatType(source.wkbType()))
     )
-    thematic_buffered = context.getMapLayer(
-        outputs[input_thematic_name + "_buffered"]["OUTPUT"]
+    dimension = get_geometry_dimension(wkb_type)
+    if dimension is not None:
+        geoms = extract_geometries_by_dimension(geoms, dimension)
+    is_multi = QgsWkbTypes.isMultiType(wkb_type)
+    for feature, geom_qgis in zip(
+        features, geoms_shapely_to_qgis(geoms, repair=False)
+    ):
+        if geom_qgis.isNull():
+            continue
+        if is_multi:
+            geom_qgis.convertToMultiType()
+        feature.setGeometry(geom_qgis)
+
+    thematic = QgsMemoryProviderUtils.createMemoryLayer(
+        "thematic_preparation", source.fields(), wkb_type, source.sourceCrs()
     )
-    return thematic, thematic_buffered, crs
+    success, added_features = thematic.dataProvider().addFeatures(features)
+    if not success:
+        raise QgsProcessingException(
+            "Thematic preparation failed: features could not be added to the prepared thematic layer"
+        )
+    thematic_geoms = {
+        feature.id(): geom for feature, geom in zip(added_features, geoms)
+    }
+
+    # buffer the thematic geometries to select all plots around it that are
+    # relevant to the calculations
+    thematic_buffered = None
+    if relevant_distance is not None:
+        thematic_buffered = buffer(
+            geoms,
+            1.01 * relevant_distance,
+            quad_segs=10,
+            cap_style="round",
+            join_style="mitre",
+            mitre_limit=10,
+        )
+    return thematic, thematic_geoms, thematic_buffered, crs
 
 
 # https://www.pythonguis.com/tutorials/plotting-matplotlib/
@@ -418,6 +418,40 @@ def qt_user_role():
     raise AttributeError("Qt UserRole enum not available")
 
 
+def _qt_enum(name, container_name):
+    from qgis.PyQt.QtCore import Qt
+
+    value = getattr(Qt, name, None)
+    if value is not None:
+        return value
+
+    container = getattr(Qt, container_name, None)
+    if container is not None and hasattr(container, name):
+        return getattr(container, name)
+
+    raise AttributeError(f"Qt enum not available: {name}")
+
+
+def qt_display_role():
+    return _qt_enum("DisplayRole", "ItemDataRole")
+
+
+def qt_background_role():
+    return _qt_enum("BackgroundRole", "ItemDataRole")
+
+
+def qt_horizontal():
+    return _qt_enum("Horizontal", "Orientation")
+
+
+def qt_ascending_order():
+    return _qt_enum("AscendingOrder", "SortOrder")
+
+
+def qt_descending_order():
+    return _qt_enum("DescendingOrder", "SortOrder")
+
+
 def qt_checkstate_checked():
     from qgis.PyQt.QtCore import Qt
 
@@ -564,3 +598,57 @@ def qgs_field_type_double():
         from qgis.PyQt.QtCore import QVariant
 
         return QVariant.Double
+
+
+def qgs_field_type_longlong():
+    """
+    Field type helper compatible with QGIS 3 (Qt5) and QGIS 4 (Qt6).
+    """
+    try:
+        from qgis.PyQt.QtCore import QMetaType
+
+        return QMetaType.Type.LongLong
+    except Exception:
+        from qgis.PyQt.QtCore import QVariant
+
+        return QVariant.LongLong
+
+
+def qgs_field_type_bool():
+    """
+    Field type helper compatible with QGIS 3 (Qt5) and QGIS 4 (Qt6).
+    """
+    try:
+        from qgis.PyQt.QtCore import QMetaType
+
+        return QMetaType.Type.Bool
+    except Exception:
+        from qgis.PyQt.QtCore import QVariant
+
+        return QVariant.Bool
+
+
+def qgs_field_type_bytearray():
+    """
+    Field type helper compatible with QGIS 3 (Qt5) and QGIS 4 (Qt6).
+    """
+    try:
+        from qgis.PyQt.QtCore import QMetaType
+
+        return QMetaType.Type.QByteArray
+    except Exception:
+        from qgis.PyQt.QtCore import QVariant
+
+        return QVariant.ByteArray
+
+
+def qgs_spatial_index_present():
+    """
+    Spatial index presence helper compatible with QGIS 3 and QGIS 4.
+    """
+    presence = getattr(Qgis, "SpatialIndexPresence", None)
+    if presence is not None and hasattr(presence, "Present"):
+        return presence.Present
+    from qgis.core import QgsFeatureSource
+
+    return QgsFeatureSource.SpatialIndexPresent
@@ -0,0 +1,92 @@
+import json
+import unittest
+from datetime import date
+
+from brdr.aligner import Aligner
+from brdr.constants import EVALUATION_FIELD_NAME, PERIMETER_ATTRIBUTE
+from brdr.loader import DictLoader
+from shapely import LineString, box
+
+from ..brdrq_actualisation import (
+    GRBChangeIndex,
+    get_base_dates,
+    get_no_change_results,
+)
+from ..brdrq_columns import results_to_columns
+
+
+class TestActualisation(unittest.TestCase):
+    def test_get_base_dates(self):
+        aligner = Aligner(crs="EPSG:31370")
+        aligner.load_thematic_data(
+            DictLoader(
+                {1: box(0, 0, 1, 1), 2: box(2, 0, 3, 1), 3: box(4, 0, 5, 1)},
+                data_dict_properties={
+                    1: {"meta": json.dumps({"last_version_date": "2022-05-01"})},
+                    2: {"meta": {"last_version_date": "2021-01-31"}},
+                    3: {"meta": None},
+                },
+            )
+        )
+        base_dates = get_base_dates(aligner, "meta")
+        self.assertEqual(
+            {k: str(v) if v else None for k, v in base_dates.items()},
+            {1: "2022-05-01", 2: "2021-01-31", 3: None},
+        )
+        self.assertEqual(get_base_dates(aligner, None), {1: None, 2: None, 3: None})
+
+    def test_change_index(self):
+        change_index = GRBChangeIndex(
+            [box(0, 0, 10, 10), box(1000, 0, 1010, 10)],
+            [date(2022, 6, 1), date(2023, 6, 1)],
+        )
+        dict_geometries = {
+            "before": box(0, 20, 10, 30),  # change within 10m, after base date
+            "after": box(5, 15, 10, 20),  # change within 10m, before base date
+            "far": box(500, 0, 510, 10),
+            "internal": box(-100, -100, 100, 100),  # change not near the border
+        }
+        dict_base_dates = {
+            "before": date(2022, 1, 1),
+            "after": date(2023, 1, 1),
+            "far": date(2020, 1, 1),
+            "internal": date(2020, 1, 1),
+        }
+        self.assertEqual(
+            change_index.get_affected_ids(
+                dict_geometries, dict_base_dates, border_distance=2
+            ),
+            ["before"],
+        )
+        self.assertEqual(
+            sorted(change_index.get_affected_ids(dict_geometries, dict_base_dates)),
+            ["before", "internal"],
+        )
+        self.assertEqual(
+            GRBChangeIndex([], []).get_affected_ids(dict_geometries, dict_base_dates),
+            [],
+        )
+
+    def test_no_change_results(self):
+        aligner = Aligner(crs="EPSG:31370")
+        aligner.load_thematic_data(
+            DictLoader(
+                {"a": box(0, 0, 10, 10), "b": LineString([(0, 0), (5, 0)])},
+                data_dict_properties={"a": {"name": "A"}, "b": {"name": "B"}},
+            )
+        )
+        results = get_no_change_results(aligner, ["a", "b"])
+        columnar = results_to_columns(aligner, results)
+        geometries, columns = columnar["result"]
+        self.assertEqual(columns["name"], ["A", "B"])
+        self.assertEqual(columns[EVALUATION_FIELD_NAME], ["no_change"] * 2)
+        self.assertEqual(geometries[0].area, 100)
+        geometries, columns = columnar["result_diff"]
+        self.assertEqual(
+            [g.geom_type for g in geometries], ["MultiPolygon", "MultiLineString"]
+        )
+        self.assertEqual(list(columns[PERIMETER_ATTRIBUTE]), [0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
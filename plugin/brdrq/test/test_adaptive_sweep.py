@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import MagicMock
+
+from brdr.aligner import Aligner
+from brdr.loader import DictLoader
+from shapely import box, Polygon
+
+from ..brdrq_adaptive_sweep import enable_adaptive_sweep, results_equal
+
+
+class TestAdaptiveSweep(unittest.TestCase):
+    def test_results_equal(self):
+        a = {"result": box(0, 0, 10, 10)}
+        b = {"result": Polygon([(10, 10), (10, 0), (0, 0), (0, 10)])}
+        self.assertTrue(results_equal(a, b))
+        self.assertFalse(results_equal(a, {"result": box(0, 0, 10, 11)}))
+        self.assertTrue(results_equal(None, None))
+        self.assertFalse(results_equal(a, None))
+
+    def test_adaptive_sweep_equals_full_sweep(self):
+        thematic = {"theme_1": box(0.5, 0.5, 10.3, 10.2), "theme_2": box(30, 0, 36, 6)}
+        reference = {
+            "ref_1": box(0, 0, 10, 10),
+            "ref_2": box(10, 0, 20, 10),
+            "ref_3": box(29, 0, 35, 7),
+        }
+        relevant_distances = [i / 10 for i in range(0, 40)]
+        results = []
+        feedback = MagicMock()
+        for adaptive in (False, True):
+            aligner = Aligner()
+            if adaptive:
+                enable_adaptive_sweep(aligner)
+                aligner.logger.feedback = feedback
+            aligner.load_thematic_data(DictLoader(thematic))
+            aligner.load_reference_data(DictLoader(reference))
+            results.append(
+                aligner.process(relevant_distances=relevant_distances).results
+            )
+        full, adaptive = results
+        messages = [c[0][0] for c in feedback.pushInfo.call_args_list]
+        self.assertTrue(any(m.startswith("Adaptive sweep: ") for m in messages))
+        self.assertEqual(full.keys(), adaptive.keys())
+        for key in full:
+            self.assertEqual(list(full[key].keys()), list(adaptive[key].keys()))
+            for rd in full[key]:
+                self.assertTrue(results_equal(full[key][rd], adaptive[key][rd]))
+
+
+if __name__ == "__main__":
+    unittest.main()
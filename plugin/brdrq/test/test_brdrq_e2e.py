@@ -127,7 +127,7 @@ class TestFlow(unittest.TestCase):
             # kies themelayer in widget
             widget.mMapLayerComboBox.setLayer(None)
             widget.mMapLayerComboBox.setLayer(layer_theme)
-            feature_table = widget.tableFeatures
+            feature_table = widget.featureTableModel
             print(str(feature_table.rowCount()))
             print("current_layer: " + widget.mMapLayerComboBox.currentLayer().name())
             for x in range(feature_table.rowCount()):
@@ -178,7 +178,7 @@ class TestFlow(unittest.TestCase):
             # kies themelayer in widget
             widget.mMapLayerComboBox.setLayer(None)
             widget.mMapLayerComboBox.setLayer(layer_theme)
-            feature_table = widget.tableFeatures
+            feature_table = widget.featureTableModel
             print(str(feature_table.rowCount()))
             print("current_layer: " + widget.mMapLayerComboBox.currentLayer().name())
             for x in range(feature_table.rowCount()):
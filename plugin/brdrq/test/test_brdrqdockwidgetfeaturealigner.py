@@ -1,9 +1,17 @@
+import os
 import unittest
+from unittest.mock import MagicMock
+
+from brdr.aligner import Aligner
+from brdr.loader import DictLoader
 
 from processing.core.Processing import Processing
+from qgis.core import QgsGeometry, QgsProject, QgsVectorLayer
 from qgis.gui import QgsMapCanvas
+from shapely import box
 
 from .utilities import get_qgis_app
+from ..brdrq_cost_model import CostModel
 from ..brdrq_dockwidget_featurealigner import brdrQDockWidgetFeatureAligner
 from ..brdrq_plugin import BrdrQPlugin
 
@@ -34,4 +42,103 @@ class TestBrdrQDockWidgetFeatureAligner(unittest.TestCase):
         assert widget.tableFeatures.isSortingEnabled()
         assert widget.tablePredictions.isSortingEnabled()
 
+    def test_get_relevant_distances(self):
+        brdrqplugin = BrdrQPlugin(IFACE)
+        widget = brdrQDockWidgetFeatureAligner(brdrqplugin, None)
+        widget.settingsDialog.minimum = 0
+        widget.settingsDialog.maximum = 300
+        self.assertEqual(widget._get_relevant_distances(100), [0, 1, 2, 3])
+        self.assertEqual(len(widget._get_relevant_distances(10)), 31)
+
+    def test_run_prefetch(self):
+        project = QgsProject.instance()
+        path = os.path.join(os.path.dirname(__file__), "themelayer_e2e.geojson")
+        layer_theme = QgsVectorLayer(path, "themelayer_e2e")
+        project.addMapLayer(layer_theme)
+        brdrqplugin = BrdrQPlugin(IFACE)
+        widget = brdrQDockWidgetFeatureAligner(brdrqplugin, None)
+        try:
+            widget._initialize()
+            widget.startDock()
+            widget.mMapLayerComboBox.setLayer(None)
+            widget.mMapLayerComboBox.setLayer(layer_theme)
+            widget._cancel_prefetch()
+            feature_ids = sorted(layer_theme.allFeatureIds())[:1]
+            widget._prefetch_queue = list(feature_ids)
+            widget._run_prefetch()
+            self.assertEqual(widget._prefetch_queue, [])
+            self.assertEqual(
+                [task.feature_id for task in widget._prefetch_tasks.values()],
+                feature_ids,
+            )
+        finally:
+            widget._cancel_prefetch()
+            project.removeAllMapLayers()
+            widget.close()
+
+    def test_get_step_calibrated_cost_model(self):
+        brdrqplugin = BrdrQPlugin(IFACE)
+        widget = brdrQDockWidgetFeatureAligner(brdrqplugin, None)
+        widget.settingsDialog.minimum = 0
+        widget.settingsDialog.maximum = 300
+        widget.local_reference_index = None
+        geometry = QgsGeometry.fromWkt("POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0))")
+
+        def calibrated_model(seconds_per_distance):
+            model = CostModel()
+            for i in range(12):
+                distances = 20 + i
+                model.add_sample(
+                    10 + 50 * (i % 4),
+                    100 + 1000 * (i % 3),
+                    distances,
+                    distances * seconds_per_distance * (1 + i % 4 + i % 3),
+                    reference=str(widget.reference_choice),
+                    search_area=1000,
+                )
+            return model
+
+        widget.cost_model = calibrated_model(0.0001)
+        self.assertEqual(
+            widget._get_step(geometry), (widget.settingsDialog.small_step, None)
+        )
+        # too expensive for every step: blocked by the cost model
+        widget.cost_model = calibrated_model(10)
+        step, msg = widget._get_step(geometry)
+        self.assertIsNone(step)
+        self.assertIn("blocked", msg)
+        # a very big area stays blocked, also when the model estimates it as cheap
+        widget.cost_model = calibrated_model(0.0001)
+        widget.max_area_limit = 50
+        step, msg = widget._get_step(geometry)
+        self.assertIsNone(step)
+        self.assertIn("Very big area", msg)
+
+    def test_record_cost_sample_foreground_only(self):
+        brdrqplugin = BrdrQPlugin(IFACE)
+        widget = brdrQDockWidgetFeatureAligner(brdrqplugin, None)
+        widget.cost_model = CostModel()
+        aligner = Aligner()
+        aligner.load_thematic_data(DictLoader({"a": box(0, 0, 10, 10)}))
+        aligner.load_reference_data(DictLoader({"r": box(0, 0, 10, 11)}))
+
+        def finished_task(adaptive_sweep=False):
+            task = MagicMock()
+            task.aligner = aligner
+            task.relevant_distances = [0, 1, 2]
+            task.evaluation_time = 0.3
+            task.adaptive_sweep = adaptive_sweep
+            return task
 
+        # precomputation, next to the foreground alignment
+        widget._align_task = finished_task()
+        widget._record_cost_sample(finished_task())
+        # foreground alignment with adaptive sweep
+        widget._align_task = finished_task(adaptive_sweep=True)
+        widget._record_cost_sample(widget._align_task)
+        self.assertEqual(widget.cost_model.samples, [])
+        self.assertFalse(widget._cost_model_changed)
+        widget._align_task = finished_task()
+        widget._record_cost_sample(widget._align_task)
+        self.assertEqual(len(widget.cost_model.samples), 1)
+        self.assertTrue(widget._cost_model_changed)
@@ -0,0 +1,37 @@
+import unittest
+
+from shapely import box
+
+from ..brdrq_bulk_engine import build_chunks, get_z_order
+
+
+class TestBulkEngine(unittest.TestCase):
+    def test_z_order(self):
+        keys = get_z_order([0, 1, 0, 1], [0, 0, 1, 1], bits=1)
+        self.assertEqual(list(keys), [0, 1, 2, 3])
+        self.assertEqual(list(get_z_order([5, 5], [5, 5])), [0, 0])
+
+    def test_build_chunks(self):
+        self.assertEqual(build_chunks({}, 1), [])
+        # two rows of 10 separate squares, far from each other
+        dict_thematic = {}
+        for i in range(10):
+            dict_thematic[f"a{i}"] = box(i * 10, 0, i * 10 + 1, 1)
+            dict_thematic[f"b{i}"] = box(i * 10, 1000, i * 10 + 1, 1001)
+        chunks = build_chunks(dict_thematic, 1, chunk_size=10)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(sorted(sum(chunks, [])), sorted(dict_thematic.keys()))
+        # spatially compact chunks
+        for chunk in chunks:
+            self.assertEqual(len({thematic_id[0] for thematic_id in chunk}), 1)
+
+    def test_build_chunks_keeps_clusters(self):
+        # 5 touching squares are kept together, even when bigger than the chunk size
+        dict_thematic = {i: box(i, 0, i + 1, 1) for i in range(5)}
+        dict_thematic[5] = box(1000, 0, 1001, 1)
+        chunks = build_chunks(dict_thematic, 1, chunk_size=2)
+        self.assertEqual(sorted(chunks, key=len), [[5], [0, 1, 2, 3, 4]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+import numpy as np
+from brdr.enums import Evaluation
+
+from ..brdrq_classification import (
+    STATE_AUTO_UPDATED,
+    STATE_NOT_CHANGED,
+    STATE_TO_REVIEW,
+    STATE_TO_UPDATE,
+    classify_results,
+    factorize,
+)
+
+_CHANGED = Evaluation.TO_CHECK_NO_PREDICTION.value
+
+
+class TestClassification(unittest.TestCase):
+    def test_factorize(self):
+        uniques, codes = factorize(["b", 1, "b", "a", 1])
+        self.assertEqual(uniques, ["b", 1, "a"])
+        self.assertEqual(codes.tolist(), [0, 1, 0, 2, 1])
+
+    def test_classify_results(self):
+        ids, last_rows, states = classify_results(
+            ["no_change", "equal", "empty", "review", "small", "changed"],
+            [
+                Evaluation.NO_CHANGE.value,
+                Evaluation.EQUALITY_BY_ID.value,
+                _CHANGED,
+                _CHANGED,
+                _CHANGED,
+                _CHANGED,
+            ],
+            [50, 50, 0, 50, 0.001, 5],
+            [50, 50, 0, 50, 0.01, 5],
+            [False, False, True, False, False, False],
+            review_percentage=10,
+        )
+        self.assertEqual(
+            ids, ["no_change", "equal", "empty", "review", "small", "changed"]
+        )
+        self.assertEqual(last_rows.tolist(), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(
+            states.tolist(),
+            [
+                STATE_NOT_CHANGED,
+                STATE_AUTO_UPDATED,
+                STATE_TO_UPDATE,
+                STATE_TO_REVIEW,
+                STATE_NOT_CHANGED,
+                STATE_AUTO_UPDATED,
+            ],
+        )
+
+    def test_classify_results_thresholds(self):
+        args = (["a", "b"], [_CHANGED] * 2, [0.5, 5], [20, 5], [False, False])
+        _, _, states = classify_results(*args, review_percentage=10)
+        self.assertEqual(states.tolist(), [STATE_TO_REVIEW, STATE_AUTO_UPDATED])
+        _, _, states = classify_results(
+            *args, review_percentage=25, not_changed_area=1
+        )
+        self.assertEqual(states.tolist(), [STATE_NOT_CHANGED, STATE_AUTO_UPDATED])
+
+    def test_classify_results_stability(self):
+        args = (["a", "b"], [_CHANGED] * 2, [5, 5], [5, 5], [False, False])
+        _, _, states = classify_results(*args, stability=[True, False])
+        self.assertEqual(states.tolist(), [STATE_AUTO_UPDATED, STATE_TO_UPDATE])
+        _, _, states = classify_results(*args, stability=[True, False], polygon=False)
+        self.assertEqual(states.tolist(), [STATE_TO_REVIEW, STATE_TO_UPDATE])
+
+    def test_classify_results_multiple_predictions(self):
+        ids, last_rows, states = classify_results(
+            ["a", "b", "a", "c", "c"],
+            [_CHANGED] * 5,
+            [5, 5, 6, 5, 5],
+            [5, 5, 6, 5, 5],
+            [False, False, False, False, True],
+        )
+        self.assertEqual(ids, ["a", "b", "c"])
+        self.assertEqual(last_rows.tolist(), [2, 1, 4])
+        # multiple predictions go to review, unless one of them has to be updated
+        self.assertEqual(
+            states.tolist(), [STATE_TO_REVIEW, STATE_AUTO_UPDATED, STATE_TO_UPDATE]
+        )
+
+    def test_classify_results_missing_values(self):
+        _, _, states = classify_results(
+            ["a"], [Evaluation.NOT_EVALUATED.value], [None], [None], [False]
+        )
+        self.assertEqual(states.tolist(), [STATE_AUTO_UPDATED])
+
+    def test_classify_results_empty(self):
+        ids, last_rows, states = classify_results([], [], [], [], [])
+        self.assertEqual(ids, [])
+        self.assertEqual(len(last_rows), 0)
+        self.assertEqual(len(states), 0)
+        self.assertIsInstance(states, np.ndarray)
+
+
+if __name__ == "__main__":
+    unittest.main()
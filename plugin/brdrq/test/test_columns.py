@@ -0,0 +1,141 @@
+import unittest
+from datetime import date
+
+import numpy as np
+from brdr.aligner import Aligner
+from brdr.constants import (
+    AREA_ATTRIBUTE,
+    METADATA_FIELD_NAME,
+    PERIMETER_ATTRIBUTE,
+    SHAPE_INDEX_ATTRIBUTE,
+)
+from brdr.enums import AlignerResultType, Evaluation
+from brdr.loader import DictLoader
+from shapely import LineString, Point, Polygon, box
+
+from ..brdrq_columns import (
+    featurecollection_to_columns,
+    get_column_type,
+    results_to_columns,
+    split_by_geometry_type,
+    to_column_value,
+    to_multi,
+)
+
+
+class TestColumns(unittest.TestCase):
+    def test_to_multi(self):
+        geometries = to_multi(
+            [box(0, 0, 1, 1), Polygon(), LineString([(0, 0), (1, 1)]), Point(0, 0), None]
+        )
+        self.assertEqual(
+            [g.geom_type if g is not None else None for g in geometries],
+            ["MultiPolygon", "MultiPolygon", "MultiLineString", "MultiPoint", None],
+        )
+        self.assertTrue(geometries[1].is_empty)
+        self.assertEqual(geometries[0].area, 1)
+
+    def test_to_column_value(self):
+        self.assertEqual(to_column_value(Evaluation.NO_CHANGE), "no_change")
+        self.assertEqual(to_column_value(date(2024, 2, 1)), "2024-02-01")
+        self.assertEqual(to_column_value({"a": [1]}), '{"a": [1]}')
+        self.assertEqual(to_column_value(1.5), 1.5)
+
+    def test_get_column_type(self):
+        self.assertEqual(get_column_type([True, None, False]), "bool")
+        self.assertEqual(get_column_type([1, None, np.int64(2)]), "int")
+        self.assertEqual(get_column_type([1, 2.5]), "float")
+        self.assertEqual(get_column_type(np.array([1.0, 2.0])), "float")
+        self.assertEqual(get_column_type([1, "a"]), "string")
+        self.assertEqual(get_column_type([True, 1]), "string")
+        self.assertEqual(get_column_type([None, None]), "string")
+
+    def test_featurecollection_to_columns(self):
+        featurecollection = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"id": 1, "name": "A"},
+                    "geometry": {"type": "Point", "coordinates": [0, 0]},
+                },
+                {
+                    "type": "Feature",
+                    "properties": {"id": 2, "meta": {"x": 1}},
+                    "geometry": None,
+                },
+            ],
+        }
+        geometries, columns = featurecollection_to_columns(featurecollection)
+        self.assertEqual(geometries[0].geom_type, "MultiPoint")
+        self.assertIsNone(geometries[1])
+        self.assertEqual(
+            columns, {"id": [1, 2], "name": ["A", None], "meta": [None, '{"x": 1}']}
+        )
+        geometries, columns = featurecollection_to_columns({"features": []})
+        self.assertEqual((len(geometries), columns), (0, {}))
+
+    def test_split_by_geometry_type(self):
+        geometries = to_multi(
+            [
+                box(0, 0, 1, 1),
+                Point(0, 0),
+                None,
+                LineString([(0, 0), (1, 0)]),
+                box(2, 0, 3, 1),
+                Point(1, 1),
+            ]
+        )
+        parts = split_by_geometry_type(geometries, {"id": [1, 2, 3, 4, 5, 6]})
+        self.assertEqual(
+            [(t, list(c["id"])) for t, _, c in parts],
+            [("MultiPolygon", [1, 5]), ("MultiPoint", [2, 6]), ("MultiLineString", [4])],
+        )
+        self.assertEqual(parts[0][1][1].bounds, (2, 0, 3, 1))
+        parts = split_by_geometry_type(geometries[:1], {"id": [1]})
+        self.assertEqual(parts[0][0], "MultiPolygon")
+        parts = split_by_geometry_type([None], {"id": [1]})
+        self.assertIsNone(parts[0][0])
+
+    def test_results_to_columns(self):
+        aligner = Aligner(crs="EPSG:31370")
+        aligner.load_thematic_data(
+            DictLoader(
+                {"a": box(0, 0, 10, 10), "b": box(20, 0, 30, 10)},
+                data_dict_properties={"a": {"name": "A"}, "b": {"name": "B"}},
+            )
+        )
+        aligner.load_reference_data(
+            DictLoader({"r1": box(0, 0, 10.5, 10), "r2": box(20, 0, 30, 10.5)})
+        )
+        aligner_result = aligner.evaluate(relevant_distances=[0, 1])
+        results = aligner_result.get_results(
+            aligner=aligner, result_type=AlignerResultType.EVALUATED_PREDICTIONS
+        )
+        columnar = results_to_columns(aligner, results)
+        fcs = aligner_result.get_results_as_geojson(
+            aligner=aligner,
+            result_type=AlignerResultType.EVALUATED_PREDICTIONS,
+            add_metadata=True,
+            add_original_attributes=True,
+        )
+        self.assertEqual(set(columnar.keys()), set(fcs.keys()))
+        geometries, columns = columnar["result"]
+        features = fcs["result"]["features"]
+        self.assertEqual(len(geometries), len(features))
+        self.assertTrue(all(g.geom_type == "MultiPolygon" for g in geometries))
+        self.assertEqual(set(columns.keys()), set(features[0]["properties"].keys()))
+        self.assertEqual(columns["name"], [f["properties"]["name"] for f in features])
+        for field in (AREA_ATTRIBUTE, PERIMETER_ATTRIBUTE, SHAPE_INDEX_ATTRIBUTE):
+            for value, feature in zip(columns[field], features):
+                self.assertAlmostEqual(value, feature["properties"][field])
+        self.assertTrue(all(isinstance(v, str) for v in columns[METADATA_FIELD_NAME]))
+
+        # same columns via the GeoJSON-path (parallel runs, result store)
+        geometries_fc, columns_fc = featurecollection_to_columns(fcs["result"])
+        self.assertEqual(len(geometries_fc), len(geometries))
+        self.assertEqual(set(columns_fc.keys()), set(columns.keys()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from shapely import box
+
+from ..brdrq_cost_model import (
+    CostModel,
+    count_reference_vertices,
+    count_vertices,
+    get_search_area,
+)
+
+
+class TestCostModel(unittest.TestCase):
+    def _calibrated_model(self):
+        # 0.01 s per distance + 0.001 s per thematic vertex + 0.0001 s per reference
+        # vertex
+        model = CostModel()
+        for i in range(12):
+            thematic_vertices = 10 + 50 * (i % 4)
+            reference_vertices = 100 + 1000 * (i % 3)
+            distances = 20 + i
+            seconds = distances * (
+                0.01 + 0.001 * thematic_vertices + 0.0001 * reference_vertices
+            )
+            model.add_sample(
+                thematic_vertices,
+                reference_vertices,
+                distances,
+                seconds,
+                reference="GRB",
+                search_area=1000,
+            )
+        return model
+
+    def test_vertices(self):
+        self.assertEqual(count_vertices([box(0, 0, 1, 1), None]), 5)
+        reference = [box(2, 0, 3, 1), box(100, 0, 101, 1)]
+        self.assertEqual(count_reference_vertices(box(0, 0, 1, 1), reference, 2), 5)
+        self.assertAlmostEqual(get_search_area(box(0, 0, 1, 1), 1), 9)
+
+    def test_not_calibrated(self):
+        model = CostModel()
+        self.assertIsNone(model.estimate(10, 100, 10))
+        self.assertEqual(model.choose_step([(10, 100)], 10, 100), (None, None))
+
+    def test_estimate(self):
+        model = self._calibrated_model()
+        self.assertAlmostEqual(model.estimate(100, 1000, 10), 10 * 0.21, places=6)
+        self.assertAlmostEqual(model.estimate_reference_vertices("GRB", 2000), 2200)
+        self.assertIsNone(model.estimate_reference_vertices("OSM", 2000))
+        # round trip
+        model = CostModel.from_json(model.to_json())
+        self.assertAlmostEqual(model.estimate(100, 1000, 10), 10 * 0.21, places=6)
+        self.assertEqual(len(CostModel.from_json("not json").samples), 0)
+
+    def test_choose_step(self):
+        model = self._calibrated_model()
+        candidates = [(10, 100), (20, 50), (50, 20)]
+        # cheap feature: densest step
+        self.assertEqual(model.choose_step(candidates, 10, 100, 3, 30)[0], 10)
+        # 0.21 s per distance: 50 distances exceed the target, 20 distances do not
+        self.assertEqual(model.choose_step(candidates, 100, 1000, 5, 30)[0], 50)
+        # above the target for all steps, but below the maximum: coarsest step
+        self.assertEqual(model.choose_step(candidates, 100, 1000, 1, 30)[0], 50)
+        # blocked
+        step, estimate = model.choose_step(candidates, 1000, 100000, 3, 30)
+        self.assertIsNone(step)
+        self.assertGreater(estimate, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
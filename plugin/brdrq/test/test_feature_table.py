@@ -0,0 +1,99 @@
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer
+from qgis.gui import QgsMapCanvas
+
+from .utilities import get_qgis_app
+from ..brdrq_feature_table import FeatureTableModel
+from ..qt_compat import (
+    qt_ascending_order,
+    qt_descending_order,
+    qt_horizontal,
+    qt_user_role,
+)
+
+CANVAS: QgsMapCanvas
+QGISAPP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+STATES = ["to_review", "auto_updated", "not_changed"]
+
+
+def _layer(count):
+    layer = QgsVectorLayer(
+        "Point?crs=epsg:31370&field=name:string&field=brdrq_state:string",
+        "features",
+        "memory",
+    )
+    features = []
+    for i in range(count):
+        feature = QgsFeature(layer.fields())
+        feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(i, i)))
+        feature.setAttributes([f"name_{count - i:05d}", STATES[i % len(STATES)]])
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+class TestFeatureTableModel(unittest.TestCase):
+    def test_columns_and_lazy_pages(self):
+        layer = _layer(1000)
+        model = FeatureTableModel(page_size=100, max_pages=2)
+        model.set_source(layer, layer.allFeatureIds(), "brdrq_state")
+        self.assertEqual(model.rowCount(), 1000)
+        self.assertEqual(
+            [model.headerData(c, qt_horizontal()) for c in range(3)],
+            ["ID", "brdrq_state", "name"],
+        )
+        self.assertEqual(len(model._pages), 0)
+
+        fid = model.feature_id(0)
+        self.assertEqual(model.data(model.index(0, 0)), str(fid))
+        self.assertEqual(model.data(model.index(0, 0), qt_user_role()), str(fid))
+        self.assertEqual(model.data(model.index(0, 1)), layer.getFeature(fid)["brdrq_state"])
+        self.assertEqual(model.data(model.index(999, 2)), "name_00001")
+        # only the last pages are kept
+        model.data(model.index(500, 2))
+        self.assertEqual(sorted(model._pages), [5, 9])
+        self.assertEqual(model.row_of_feature_id(fid), 0)
+
+    def test_sort_by_provider(self):
+        layer = _layer(300)
+        model = FeatureTableModel(page_size=50)
+        model.set_source(layer, layer.allFeatureIds(), "brdrq_state")
+        model.sort(2, qt_ascending_order())
+        names = [model.data(model.index(r, 2)) for r in range(model.rowCount())]
+        self.assertEqual(names, sorted(names))
+        model.sort(0, qt_descending_order())
+        fids = [model.feature_id(r) for r in range(model.rowCount())]
+        self.assertEqual(fids, sorted(fids, reverse=True))
+
+    def test_sort_subset_keeps_sort_order(self):
+        layer = _layer(100)
+        model = FeatureTableModel()
+        model.sort(2, qt_ascending_order())
+        subset = sorted(layer.allFeatureIds())[:10]
+        model.set_source(layer, subset, "brdrq_state")
+        self.assertEqual(model.rowCount(), 10)
+        names = [model.data(model.index(r, 2)) for r in range(model.rowCount())]
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(
+            sorted(model.feature_id(r) for r in range(model.rowCount())), subset
+        )
+
+    def test_refresh_and_clear(self):
+        layer = _layer(10)
+        model = FeatureTableModel()
+        model.set_source(layer, layer.allFeatureIds(), "brdrq_state")
+        fid = model.feature_id(0)
+        self.assertNotEqual(model.data(model.index(0, 1)), "manual_updated")
+        ix = layer.fields().indexOf("brdrq_state")
+        layer.dataProvider().changeAttributeValues({fid: {ix: "manual_updated"}})
+        model.refresh()
+        self.assertEqual(model.data(model.index(0, 1)), "manual_updated")
+        model.clear()
+        self.assertEqual(model.rowCount(), 0)
+        self.assertEqual(model.columnCount(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
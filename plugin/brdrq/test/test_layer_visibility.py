@@ -114,7 +114,7 @@ class TestLayerVisibility(unittest.TestCase):
         with patch.object(brdrq_utils.QgsProject, "instance", return_value=project), patch.object(
             brdrq_utils, "QgsVectorLayer", return_value=layer
         ), patch.object(
-            brdrq_utils, "write_featurecollection_to_geopackage"
+            brdrq_utils, "OutputStore"
         ), patch.object(
             brdrq_utils, "move_to_group", return_value=(moved_node, MagicMock())
         ), patch.object(
@@ -130,3 +130,60 @@ class TestLayerVisibility(unittest.TestCase):
             )
 
         moved_node.setItemVisibilityChecked.assert_called_once_with(False)
+
+    def test_scrub_layer_swaps_features_of_memory_provider(self):
+        layer = MagicMock()
+        layer.id.return_value = "layer-id-4"
+        provider = layer.dataProvider.return_value
+        features = {1.0: ["feature_1"], 2.0: ["feature_2a", "feature_2b"]}
+
+        project = MagicMock()
+        project.mapLayer.return_value = layer
+
+        scrub_layer = brdrq_utils.ScrubLayer(layer, features)
+        with patch.object(brdrq_utils.QgsProject, "instance", return_value=project):
+            self.assertTrue(scrub_layer.show_distance(2.0))
+            provider.truncate.assert_called_once_with()
+            provider.addFeatures.assert_called_once_with(["feature_2a", "feature_2b"])
+
+            # same distance: no swap
+            provider.reset_mock()
+            self.assertTrue(scrub_layer.show_distance(2.0))
+            provider.truncate.assert_not_called()
+
+            # distance without results: empty layer
+            self.assertTrue(scrub_layer.show_distance(3.0))
+            provider.addFeatures.assert_called_once_with([])
+
+            # layer removed from the project
+            project.mapLayer.return_value = None
+            self.assertFalse(scrub_layer.show_distance(1.0))
+
+    def test_scrub_layer_is_reused_for_next_feature(self):
+        layer = MagicMock()
+        layer.id.return_value = "layer-id-5"
+        layer.fields.return_value.indexFromName.side_effect = (
+            lambda name: 0 if name == "brdr_relevant_distance" else -1
+        )
+        provider = layer.dataProvider.return_value
+
+        project = MagicMock()
+        project.mapLayer.return_value = layer
+
+        scrub_layer = brdrq_utils.ScrubLayer(layer, {1.0: ["feature_1"]})
+        with patch.object(brdrq_utils.QgsProject, "instance", return_value=project):
+            scrub_layer.show_distance(1.0)
+            scrub_layer.set_features({1.0: ["feature_next"]})
+            self.assertIsNone(scrub_layer.relevant_distance)
+
+            provider.reset_mock()
+            scrub_layer.show_distance(1.0)
+            provider.addFeatures.assert_called_once_with(["feature_next"])
+
+        existing_field = MagicMock()
+        existing_field.name.return_value = "brdr_relevant_distance"
+        new_field = MagicMock()
+        new_field.name.return_value = "brdr_evaluation"
+        scrub_layer.add_missing_fields([existing_field, new_field])
+        provider.addAttributes.assert_called_once_with([new_field])
+        layer.updateFields.assert_called_once_with()
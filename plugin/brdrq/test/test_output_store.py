@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from shapely import LineString, MultiPolygon, Point, box
+from shapely.geometry import MultiLineString
+
+from ..brdrq_columns import to_multi
+from ..brdrq_output_store import OutputStore
+
+
+class TestOutputStore(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "run", "brdrq.gpkg")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_write_layers(self):
+        import pyogrio
+
+        polygons = to_multi([box(0, 0, 10, 10), MultiPolygon(), None, box(20, 0, 30, 5)])
+        columns = {
+            "brdr_id": ["a", "b", "c", "d"],
+            "fid": [7, 8, 9, 10],
+            "brdr_area": [100.0, 0.0, float("nan"), 50.0],
+            "flag": [True, False, None, True],
+        }
+        lines = to_multi([LineString([(0, 0), (5, 0)])])
+        with OutputStore(self.path, "EPSG:31370") as store:
+            self.assertEqual(
+                store.write_layer(
+                    "result", "MultiPolygon", polygons, columns, index_fields=["brdr_id"]
+                ),
+                4,
+            )
+            store.write_layer("result diff", "MultiLineString", lines, {"brdr_id": ["a"]})
+            # replacing a layer
+            store.write_layer("result diff", "MultiLineString", lines, {"brdr_id": ["x"]})
+            self.assertEqual(sorted(store.layer_names()), ["result", "result diff"])
+
+        layers = {name: geometry_type for name, geometry_type in pyogrio.list_layers(self.path)}
+        self.assertEqual(
+            layers, {"result": "MultiPolygon", "result diff": "MultiLineString"}
+        )
+        info = pyogrio.read_info(self.path, layer="result")
+        self.assertEqual(info["crs"], "EPSG:31370")
+        self.assertEqual(info["features"], 4)
+        self.assertEqual(info["capabilities"]["fast_spatial_filter"], True)
+        df = pyogrio.read_dataframe(self.path, layer="result")
+        self.assertEqual(list(df["brdr_id"]), ["a", "b", "c", "d"])
+        self.assertEqual(list(df["fid"]), [7, 8, 9, 10])
+        self.assertEqual(df.geometry[0].area, 100)
+        self.assertIsNone(df.geometry[2])
+        self.assertTrue(df["brdr_area"].isna()[2])
+        df = pyogrio.read_dataframe(self.path, layer="result", bbox=(19, 0, 21, 1))
+        self.assertEqual(list(df["brdr_id"]), ["d"])
+        df = pyogrio.read_dataframe(self.path, layer="result diff")
+        self.assertEqual(list(df["brdr_id"]), ["x"])
+        self.assertIsInstance(df.geometry[0], MultiLineString)
+
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(
+            conn.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'index' "
+                "AND name = 'idx_result_brdr_id'"
+            ).fetchone()[0],
+            1,
+        )
+        conn.close()
+
+    def test_reopen(self):
+        import pyogrio
+
+        with OutputStore(self.path) as store:
+            store.write_layer("points", "MultiPoint", to_multi([Point(1, 1)]), {"a": [1]})
+        with OutputStore(self.path) as store:
+            store.write_layer("lines", "MultiLineString", [None], {"a": ["x"]})
+        self.assertEqual(
+            sorted(name for name, _ in pyogrio.list_layers(self.path)),
+            ["lines", "points"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
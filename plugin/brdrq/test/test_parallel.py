@@ -0,0 +1,133 @@
+import unittest
+
+from brdr.aligner import Aligner
+from shapely import box
+
+from ..brdrq_parallel import (
+    align_group,
+    build_group_tasks,
+    build_tasks,
+    get_connected_components,
+    group_components,
+    merge_featurecollections,
+    run_tasks,
+)
+
+
+class _Feedback:
+    def __init__(self, canceled=False):
+        self.canceled = canceled
+        self.messages = []
+
+    def isCanceled(self):
+        return self.canceled
+
+    def pushInfo(self, message):
+        self.messages.append(message)
+
+
+class TestParallel(unittest.TestCase):
+    def test_connected_components(self):
+        geoms = [box(0, 0, 1, 1), box(50, 0, 51, 1), box(2, 0, 3, 1)]
+        labels = get_connected_components(geoms, 2)
+        self.assertEqual(list(labels), [0, 1, 0])
+
+    def test_group_components(self):
+        labels = [0, 1, 0, 2, 3]
+        groups = group_components(labels, 2)
+        self.assertEqual([list(g) for g in groups], [[0, 2, 4], [1, 3]])
+
+    def test_build_group_tasks(self):
+        # three clusters: 0-1 (10 m apart), 2-3-4 and 5 (far away)
+        x = [0, 11, 500, 511, 522, 2000]
+        dict_thematic = {i: box(x[i], 0, x[i] + 1, 1) for i in range(6)}
+        dict_thematic_properties = {i: {"name": str(i)} for i in range(6)}
+        tasks = build_group_tasks(
+            dict_thematic, dict_thematic_properties, 5, 2, setting=1
+        )
+        self.assertEqual(len(tasks), 2)
+        groups = [sorted(task["thematic"].keys()) for task in tasks]
+        self.assertEqual(groups, [[0, 1, 5], [2, 3, 4]])
+        self.assertEqual(tasks[1]["thematic_properties"][3], {"name": "3"})
+        self.assertTrue(all(task["setting"] == 1 for task in tasks))
+        # a cluster is never split over the groups
+        tasks = build_group_tasks(dict_thematic, dict_thematic_properties, 5, 6)
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual(build_group_tasks({}, {}, 5, 2), [])
+
+    def test_merge_featurecollections(self):
+        fcs_1 = {"result": {"type": "FeatureCollection", "features": [
+            {"properties": {"brdr_id": "b"}}]}}
+        fcs_2 = {"result": {"type": "FeatureCollection", "features": [
+            {"properties": {"brdr_id": "a"}}]}}
+        merged = merge_featurecollections([fcs_1, fcs_2], ["a", "b"])
+        self.assertEqual(
+            [f["properties"]["brdr_id"] for f in merged["result"]["features"]],
+            ["a", "b"],
+        )
+
+    def _build_tasks(self, n_groups):
+        # clusters of 2 features, in a thematic order that differs from the groups
+        dict_thematic = {}
+        dict_reference = {}
+        for i in [3, 0, 5, 1, 4, 2]:
+            x = 100 * i
+            dict_thematic[f"t{i}_a"] = box(x + 0.4, 0.3, x + 10.6, 10.4)
+            dict_thematic[f"t{i}_b"] = box(x + 11.2, 0.2, x + 20.5, 9.7)
+            dict_reference[f"r{i}_a"] = box(x, 0, x + 10, 10)
+            dict_reference[f"r{i}_b"] = box(x + 10, 0, x + 20, 10)
+            dict_reference[f"r{i}_c"] = box(x, 10, x + 20, 20)
+        processor = Aligner().processor
+        tasks = build_tasks(
+            dict_thematic,
+            {},
+            dict_reference,
+            2,
+            n_groups,
+            processor_class=type(processor),
+            processor_config=processor.config,
+            crs="EPSG:31370",
+            log_metadata=False,
+            add_observations=True,
+            reference_source={"source": "test"},
+            predictions=True,
+            adaptive_sweep=False,
+            relevant_distances=[0, 0.5, 1, 1.5, 2],
+            max_predictions=-1,
+            multi_to_best_prediction=True,
+            full_reference_strategy=None,
+            add_metadata=False,
+            add_attributes=False,
+        )
+        return tasks, list(dict_thematic.keys())
+
+    def test_run_tasks_equals_sequential(self):
+        tasks, thematic_ids = self._build_tasks(1)
+        self.assertEqual(len(tasks), 1)
+        sequential = align_group(tasks[0])
+
+        tasks, thematic_ids = self._build_tasks(4)
+        self.assertEqual(len(tasks), 4)
+        feedback = _Feedback()
+        results = run_tasks(tasks, 2, feedback=feedback)
+        self.assertEqual(len(feedback.messages), 4)
+        merged = merge_featurecollections(results, thematic_ids)
+
+        self.assertEqual(merged.keys(), sequential.keys())
+        for name, fc in sequential.items():
+            self.assertEqual(
+                [f["properties"] for f in merged[name]["features"]],
+                [f["properties"] for f in fc["features"]],
+            )
+            self.assertEqual(
+                [f["geometry"] for f in merged[name]["features"]],
+                [f["geometry"] for f in fc["features"]],
+            )
+
+    def test_run_tasks_cancel(self):
+        tasks, _ = self._build_tasks(4)
+        self.assertIsNone(run_tasks(tasks, 2, feedback=_Feedback(canceled=True)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from shapely import box
+
+from ..brdrq_prediction_cache import PredictionCache, estimate_size, get_fingerprint
+
+
+class TestPredictionCache(unittest.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(
+            get_fingerprint({"a": 1, "b": [0.5, 1.0]}),
+            get_fingerprint({"b": [0.5, 1.0], "a": 1}),
+        )
+        self.assertNotEqual(
+            get_fingerprint(box(0, 0, 1, 1).wkb), get_fingerprint(box(0, 0, 1, 2).wkb)
+        )
+
+    def test_estimate_size(self):
+        self.assertEqual(estimate_size([]), 0)
+        self.assertGreater(estimate_size([box(0, 0, 1, 1), None]), 0)
+
+    def test_lru_memory_bound(self):
+        cache = PredictionCache(max_memory=1)  # MB
+        size = 400 * 1024
+        cache.put(("layer", 1, "g", "s"), "entry_1", size)
+        cache.put(("layer", 2, "g", "s"), "entry_2", size)
+        self.assertEqual(cache.get(("layer", 1, "g", "s")), "entry_1")
+        cache.put(("layer", 3, "g", "s"), "entry_3", size)
+        # feature 2 is the least recently used
+        self.assertIsNone(cache.get(("layer", 2, "g", "s")))
+        self.assertEqual(len(cache), 2)
+        cache.invalidate("layer", 1)
+        self.assertIsNone(cache.get(("layer", 1, "g", "s")))
+        cache.put(("layer", 4, "g", "s"), "too_big", 2 * 1024 * 1024)
+        self.assertIsNone(cache.get(("layer", 4, "g", "s")))
+        cache.set_max_memory(0)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
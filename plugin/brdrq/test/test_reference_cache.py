@@ -0,0 +1,181 @@
+import os
+import tempfile
+import unittest
+
+from brdr.aligner import Aligner
+from brdr.loader import DictLoader, Loader
+from shapely import box, to_wkb
+
+from ..brdrq_reference_cache import (
+    CachedReferenceLoader,
+    ReferenceTileCache,
+    SessionReferenceCache,
+    get_tiles,
+)
+
+REFERENCE = {
+    "a": box(0, 0, 10, 10),
+    "b": box(900, 0, 1100, 100),
+    "c": box(5000, 5000, 5010, 5010),
+}
+
+
+class _ReferenceLoader(Loader):
+    """On-the-fly reference loader: features intersecting the thematic extent"""
+
+    def __init__(self, aligner, reference=None):
+        super().__init__(is_reference=True)
+        self.aligner = aligner
+        self.reference = REFERENCE if reference is None else reference
+        self.extents = []
+
+    def load_data(self):
+        extent = self.aligner.thematic_data.union
+        self.extents.append(extent)
+        self.data_dict = {
+            k: g for k, g in self.reference.items() if g.intersects(extent)
+        }
+        self.data_dict_properties = {k: {"name": k} for k in self.data_dict}
+        collection = super().load_data()
+        for feature in collection.features.values():
+            feature.data_uri = "https://example.org/" + feature.data_id
+        return collection
+
+
+class TestReferenceCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = ReferenceTileCache(
+            os.path.join(self.folder, "reference_cache.sqlite")
+        )
+
+    def test_get_tiles(self):
+        tiles, boxes = get_tiles(box(100, 100, 1500, 200), 1000)
+        self.assertEqual(tiles, [(0, 0), (1, 0)])
+        self.assertEqual(len(boxes), 2)
+
+    def test_put_get(self):
+        source = "GRB_ADP_EPSG:31370"
+        tiles = [(0, 0), (1, 0)]
+        self.assertEqual(self.cache.missing_tiles(source, tiles), tiles)
+        wkb = to_wkb(box(900, 0, 1100, 100))
+        features = [
+            ((0, 0), "1", wkb, {"a": 1}, None),
+            ((1, 0), "1", wkb, {"a": 1}, None),
+        ]
+        self.cache.put(source, tiles, features, source_info={"source": "test"})
+        self.assertEqual(self.cache.missing_tiles(source, tiles), [])
+        cached, source_info = self.cache.get(source, tiles)
+        self.assertEqual(list(cached.keys()), ["1"])
+        self.assertEqual(source_info, {"source": "test"})
+
+    def test_ttl_and_eviction(self):
+        source = "GRB_ADP_EPSG:31370"
+        feature = ((0, 0), 1, to_wkb(box(0, 0, 1, 1)), {}, None)
+        self.cache.put(source, [(0, 0)], [feature])
+        self.cache.ttl = {"GRB": -1}
+        self.assertEqual(self.cache.missing_tiles(source, [(0, 0)]), [(0, 0)])
+        self.cache.ttl = {}
+        self.cache.max_size = 0
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertEqual(self.cache.missing_tiles(source, [(0, 0)]), [(0, 0)])
+
+    def test_put_does_not_evict_tiles_of_the_call(self):
+        source = "GRB_ADP_EPSG:31370"
+        self.cache.max_size = 1
+
+        def put(tile, keep=None):
+            feature = (tile, str(tile), to_wkb(box(0, 0, 1, 1)), {}, None)
+            return self.cache.put(source, [tile], [feature], keep=keep)
+
+        self.assertEqual(put((0, 0)), 0)
+        self.assertEqual(put((1, 0), keep=[(0, 0)]), 0)
+        self.assertEqual(self.cache.missing_tiles(source, [(0, 0), (1, 0)]), [])
+        self.assertEqual(put((2, 0)), 2)
+        self.assertEqual(
+            self.cache.missing_tiles(source, [(0, 0), (1, 0), (2, 0)]),
+            [(0, 0), (1, 0)],
+        )
+
+    def test_cached_loader(self):
+        aligner = Aligner(crs="EPSG:31370")
+        aligner.load_thematic_data(DictLoader({"t": box(5, 5, 50, 50)}))
+        reference_loader = _ReferenceLoader(aligner)
+        loader = CachedReferenceLoader(reference_loader, "GRB_ADP", cache=self.cache)
+        collection = loader.load_data()
+        self.assertEqual(sorted(f.data_id for f in collection.features.values()), ["a"])
+        self.assertEqual(
+            [f.data_uri for f in collection.features.values()],
+            ["https://example.org/a"],
+        )
+        # the wrapped loader downloaded the tile, on its own aligner
+        self.assertEqual(len(reference_loader.extents), 1)
+        self.assertEqual(reference_loader.extents[0].bounds, (-1000, -1000, 1000, 1000))
+        self.assertIs(reference_loader.aligner, aligner)
+        # second load: from the disk-cache
+        collection = CachedReferenceLoader(
+            reference_loader, "GRB_ADP", cache=self.cache
+        ).load_data()
+        self.assertEqual(len(reference_loader.extents), 1)
+        self.assertEqual(
+            [f.data_uri for f in collection.features.values()],
+            ["https://example.org/a"],
+        )
+
+    def test_session_sliding_window(self):
+        source = "GRB_ADP_EPSG:31370"
+        session = SessionReferenceCache(max_tiles=1)
+        self.assertEqual(session.missing_tiles(source, [(0, 0)]), [(0, 0)])
+        cached = {
+            "a": (to_wkb(box(0, 0, 10, 10)), "{}", None),
+            "b": (to_wkb(box(500, 500, 510, 510)), "{}", None),
+        }
+        session.add(source, [(0, 0)], 1000, cached, {"source": "test"})
+        self.assertEqual(session.missing_tiles(source, [(0, 0)]), [])
+        geoms, properties, source_info, _ = session.query(source, box(0, 0, 20, 20))
+        self.assertEqual(list(geoms.keys()), ["a"])
+        session.add(source, [(1, 0)], 1000, {}, {"source": "test"})
+        self.assertEqual(session.missing_tiles(source, [(0, 0)]), [(0, 0)])
+        geoms, _, _, _ = session.query(source, box(0, 0, 20, 20))
+        self.assertEqual(geoms, {})
+
+    def test_session_keeps_tiles_of_the_load(self):
+        source = "GRB_ADP_EPSG:31370"
+        session = SessionReferenceCache(max_tiles=2)
+        cached = {
+            "a": (to_wkb(box(0, 0, 10, 10)), "{}", None),
+            "b": (to_wkb(box(1500, 0, 1510, 10)), "{}", None),
+            "c": (to_wkb(box(1990, 0, 2010, 10)), "{}", None),
+        }
+        tiles = [(0, 0), (1, 0), (2, 0)]
+        session.add(source, tiles, 1000, cached, {}, keep=[(3, 0)])
+        geoms, _, _, _ = session.query(source, box(0, 0, 3000, 1000))
+        self.assertEqual(sorted(geoms), ["a", "b", "c"])
+        # next load: the oldest tiles are dropped, features of held tiles are kept
+        session.add(source, [(5, 5)], 1000, {}, {})
+        self.assertEqual(session.missing_tiles(source, tiles), [(0, 0), (1, 0)])
+        geoms, _, _, _ = session.query(source, box(0, 0, 3000, 1000))
+        self.assertEqual(sorted(geoms), ["c"])
+
+    def test_cached_loader_extent_larger_than_session(self):
+        # one reference feature per tile, 26 x 26 tiles
+        reference = {
+            f"{x}_{y}": box(x * 1000 + 100, y * 1000 + 100, x * 1000 + 200, y * 1000 + 200)
+            for x in range(26)
+            for y in range(26)
+        }
+        aligner = Aligner(crs="EPSG:31370")
+        aligner.load_thematic_data(DictLoader({"t": box(0, 0, 25999, 25999)}))
+        for session in (None, SessionReferenceCache(max_tiles=100)):
+            loader = CachedReferenceLoader(
+                _ReferenceLoader(aligner, reference),
+                "GRB_ADP",
+                cache=self.cache,
+                session=session,
+            )
+            collection = loader.load_data()
+            self.assertEqual(len(collection.features), len(reference))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+from enum import Enum
+
+import numpy as np
+
+from brdr.aligner import Aligner
+from brdr.enums import AlignerResultType
+from brdr.loader import DictLoader
+from shapely import box
+
+from ..brdrq_result_store import (
+    ResultStore,
+    add_original_attributes,
+    get_feature_keys,
+    get_run_fingerprint,
+    stored_to_featurecollections,
+)
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = ResultStore(os.path.join(self.folder, "result_store.sqlite"))
+        self.thematic = {"a": box(0.5, 0.5, 10.3, 10.2), "b": box(30, 0, 36, 6)}
+        self.reference = {
+            "ref_1": box(0, 0, 10, 10),
+            "ref_2": box(10, 0, 20, 10),
+            "ref_3": box(29, 0, 35, 7),
+        }
+
+    def _get_keys(self, aligner, thematic, reference, relevant_distance=2):
+        fingerprint = get_run_fingerprint(
+            aligner.processor,
+            aligner.config,
+            aligner.crs,
+            relevant_distances=[relevant_distance],
+        )
+        return get_feature_keys(thematic, reference, 2.02, fingerprint)
+
+    def test_feature_keys(self):
+        aligner = Aligner()
+        keys = self._get_keys(aligner, self.thematic, self.reference)
+        self.assertEqual(keys, self._get_keys(aligner, self.thematic, self.reference))
+        # changed thematic geometry
+        thematic = dict(self.thematic, a=box(0.5, 0.5, 10.3, 10.4))
+        changed = self._get_keys(aligner, thematic, self.reference)
+        self.assertNotEqual(keys["a"], changed["a"])
+        self.assertEqual(keys["b"], changed["b"])
+        # changed reference near 'b' only
+        reference = dict(self.reference, ref_3=box(29, 0, 35, 8))
+        changed = self._get_keys(aligner, self.thematic, reference)
+        self.assertEqual(keys["a"], changed["a"])
+        self.assertNotEqual(keys["b"], changed["b"])
+        # changed parameters
+        changed = self._get_keys(aligner, self.thematic, self.reference, 3)
+        self.assertNotEqual(keys["a"], changed["a"])
+
+    def test_put_get(self):
+        aligner = Aligner()
+        aligner.load_thematic_data(
+            DictLoader(self.thematic, {"a": {"name": "A"}, "b": {"name": "B"}})
+        )
+        aligner.load_reference_data(DictLoader(self.reference))
+        keys = self._get_keys(aligner, self.thematic, self.reference)
+        self.assertEqual(self.store.get(keys), {})
+        fcs = aligner.predict(relevant_distances=[2]).get_results_as_geojson(
+            aligner=aligner, result_type=AlignerResultType.PROCESSRESULTS
+        )
+        id_field = aligner.thematic_data.id_fieldname
+        self.store.put(keys, fcs, id_field)
+        stored = self.store.get(keys)
+        self.assertEqual(set(stored.keys()), {"a", "b"})
+        stored_fcs = stored_to_featurecollections(stored, aligner.crs)
+        self.assertEqual(stored_fcs.keys(), fcs.keys())
+        self.assertEqual(len(stored_fcs["result"]["features"]), 2)
+        add_original_attributes(
+            stored_fcs, {"a": {"name": "A"}, "b": {"name": "B"}}, id_field
+        )
+        for feature in stored_fcs["result"]["features"]:
+            self.assertEqual(
+                feature["properties"]["name"],
+                feature["properties"][id_field].upper(),
+            )
+        self.assertEqual(self.store.prune(), 0)
+        self.store.max_age = -1
+        self.assertEqual(self.store.prune(), 2)
+        self.assertEqual(self.store.get(keys), {})
+
+    def test_round_trip(self):
+        aligner = Aligner()
+        aligner.load_thematic_data(DictLoader(self.thematic))
+        aligner.load_reference_data(DictLoader(self.reference))
+        keys = self._get_keys(aligner, self.thematic, self.reference)
+        fcs = aligner.evaluate(relevant_distances=[0, 1, 2]).get_results_as_geojson(
+            aligner=aligner,
+            result_type=AlignerResultType.EVALUATED_PREDICTIONS,
+            add_metadata=True,
+        )
+        id_field = aligner.thematic_data.id_fieldname
+        # values that are not JSON-types
+        values = {
+            "count": np.int64(3),
+            "ratio": np.float32(0.5),
+            "flag": np.bool_(True),
+            "state": _State.DONE,
+            "day": date(2024, 1, 31),
+            "moment": datetime(2024, 1, 31, 12, 30),
+        }
+        for fc in fcs.values():
+            for feature in fc["features"]:
+                feature["properties"].update(values)
+        self.store.put(keys, fcs, id_field)
+        stored_fcs = stored_to_featurecollections(self.store.get(keys), aligner.crs)
+        self.assertEqual(stored_fcs.keys(), fcs.keys())
+
+        def by_id(fc):
+            return sorted(fc["features"], key=lambda f: f["properties"][id_field])
+
+        for name, fc in fcs.items():
+            stored = by_id(stored_fcs[name])
+            fresh = by_id(fc)
+            self.assertEqual(len(stored), len(fresh))
+            for stored_feature, fresh_feature in zip(stored, fresh):
+                self.assertEqual(stored_feature["geometry"], fresh_feature["geometry"])
+                # numpy-values and enums are stored as their Python-value
+                properties = {
+                    k: _python_value(v) for k, v in fresh_feature["properties"].items()
+                }
+                self.assertEqual(stored_feature["properties"], properties)
+                self.assertEqual(
+                    {k: type(v) for k, v in stored_feature["properties"].items()},
+                    {k: type(v) for k, v in properties.items()},
+                )
+
+
+class _State(Enum):
+    DONE = 1
+
+
+def _python_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+if __name__ == "__main__":
+    unittest.main()
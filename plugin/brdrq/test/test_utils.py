@@ -2,10 +2,24 @@ import os
 import unittest
 
 from processing.core.Processing import Processing
+from pyproj import CRS
+from qgis.core import QgsFeature, QgsField, QgsFields, QgsGeometry, QgsProject
 from qgis.gui import QgsMapCanvas
+from shapely import from_wkt
 
 from .utilities import get_qgis_app
-from ..brdrq_utils import get_workfolder
+from ..brdrq_utils import (
+    BRDRQ_ORIGINAL_WKB_FIELDNAME,
+    BRDRQ_ORIGINAL_WKT_FIELDNAME,
+    get_original_geometry,
+    get_workfolder,
+    extract_geometries_by_dimension,
+    featurecollection_to_scrub_layers,
+    geoms_qgis_to_shapely,
+    geoms_shapely_to_qgis,
+    make_valid_where_invalid,
+)
+from ..qt_compat import qgs_field_type_bytearray, qgs_field_type_string
 
 CANVAS: QgsMapCanvas
 QGISAPP, CANVAS, IFACE, PARENT = get_qgis_app()
@@ -33,3 +47,105 @@ class TestUtils(unittest.TestCase):
         # print (folder_to_remove)
         # shutil.rmtree(folder_to_remove)
         assert True
+
+    def test_geoms_qgis_to_shapely(self):
+        geoms_qgis = [
+            QgsGeometry.fromWkt("POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0))"),
+            QgsGeometry(),
+            # self-intersecting 'bowtie' is repaired
+            QgsGeometry.fromWkt("POLYGON ((0 0, 10 10, 10 0, 0 10, 0 0))"),
+        ]
+        geoms_shapely = geoms_qgis_to_shapely(geoms_qgis)
+        assert len(geoms_shapely) == 3
+        assert geoms_shapely[0].area == 100
+        assert geoms_shapely[1] is None
+        assert geoms_shapely[2].is_valid
+        assert geoms_shapely[2].area == 50
+
+    def test_make_valid_where_invalid(self):
+        geoms = [
+            from_wkt("POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0))"),
+            None,
+            # ring around the square and then around an inner square: repaired as
+            # native:fixgeometries (structure) does, not by linework (area 64)
+            from_wkt(
+                "POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0, 2 2, 8 2, 8 8, 2 8, 2 2, 0 0))"
+            ),
+        ]
+        repaired = make_valid_where_invalid(geoms)
+        assert repaired[0] is geoms[0]
+        assert repaired[1] is None
+        assert repaired[2].is_valid
+        assert repaired[2].area == 100
+
+    def test_geoms_shapely_to_qgis(self):
+        geoms_shapely = [
+            from_wkt("POLYGON Z ((0 0 1, 10 0 1, 10 10 1, 0 10 1, 0 0 1))"),
+            None,
+        ]
+        geoms_qgis = geoms_shapely_to_qgis(geoms_shapely)
+        assert len(geoms_qgis) == 2
+        assert geoms_qgis[0].area() == 100
+        assert not geoms_qgis[0].constGet().is3D()
+        assert geoms_qgis[1].isNull()
+
+    def test_featurecollection_to_scrub_layers_pyproj_crs(self):
+        # the dock passes the crs of the aligner, a pyproj CRS
+        featurecollection = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"brdr_relevant_distance": d},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [[[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]],
+                    },
+                }
+                for d in (0.0, 0.5)
+            ],
+        }
+        try:
+            scrub_layers = featurecollection_to_scrub_layers(
+                "scrub", featurecollection, CRS("EPSG:31370"), None, True, "test", 1
+            )
+            assert len(scrub_layers) == 1
+            layer = scrub_layers[0].layer
+            assert layer.crs().authid() == "EPSG:31370"
+            assert scrub_layers[0].show_distance(0.5)
+            assert layer.featureCount() == 1
+        finally:
+            QgsProject.instance().removeAllMapLayers()
+
+    def test_extract_geometries_by_dimension(self):
+        geoms = [
+            from_wkt(
+                "GEOMETRYCOLLECTION (POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0)), LINESTRING (10 10, 20 20))"
+            ),
+            from_wkt("LINESTRING (0 0, 10 10)"),
+            from_wkt("POLYGON ((0 0, 1 0, 1 1, 0 1, 0 0))"),
+            None,
+        ]
+        polygons = extract_geometries_by_dimension(geoms, 2)
+        assert polygons[0].geom_type == "Polygon"
+        assert polygons[0].area == 100
+        assert polygons[1] is None
+        assert polygons[2] is geoms[2]
+        assert polygons[3] is None
+
+    def test_get_original_geometry(self):
+        geometry = QgsGeometry.fromWkt("POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0))")
+        fields = QgsFields()
+        fields.append(QgsField(BRDRQ_ORIGINAL_WKB_FIELDNAME, qgs_field_type_bytearray()))
+        fields.append(QgsField(BRDRQ_ORIGINAL_WKT_FIELDNAME, qgs_field_type_string()))
+        feature = QgsFeature(fields)
+        assert get_original_geometry(feature) is None
+
+        # correction layers of earlier versions: WKT
+        feature[BRDRQ_ORIGINAL_WKT_FIELDNAME] = geometry.asWkt()
+        assert get_original_geometry(feature).area() == 100
+
+        feature[BRDRQ_ORIGINAL_WKB_FIELDNAME] = geometry.asWkb()
+        feature[BRDRQ_ORIGINAL_WKT_FIELDNAME] = None
+        original_geometry = get_original_geometry(feature)
+        assert original_geometry.equals(geometry)